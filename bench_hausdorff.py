@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark the KD-tree Hausdorff distance against the former pure-Python implementation
+
+Usage: python bench_hausdorff.py [number of points]
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.abspath('.'))
+
+import numpy as np
+from gllm.utils.geometry_utils import hausdorff_distance
+
+
+def python_hausdorff_distance(path1, path2):
+    """The nested-generator implementation formerly used in validate_functional_correctness."""
+    def point_distance(p1, p2):
+        return ((p1[0] - p2[0])**2 + (p1[1] - p2[1])**2)**0.5
+
+    def directed_hausdorff(path_a, path_b):
+        return max(min(point_distance(a, b) for b in path_b) for a in path_a)
+
+    return max(directed_hausdorff(path1, path2), directed_hausdorff(path2, path1))
+
+
+def circle(num_points, radius=50.0, noise=0.0, seed=0):
+    angles = np.linspace(0, 2 * np.pi, num_points)
+    rng = np.random.default_rng(seed)
+    points = np.column_stack([radius * np.cos(angles), radius * np.sin(angles)])
+    return [tuple(point) for point in points + rng.normal(0, noise, points.shape)]
+
+
+def timed(function, *args, repeat=1, **kwargs):
+    """Best wall-clock time of `repeat` runs."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    gcode_path = circle(num_points, noise=0.05, seed=1)
+    user_path = circle(num_points + 1)
+    far_path = circle(num_points + 1, radius=60.0)
+
+    print(f"Paths with {num_points} / {num_points + 1} points")
+
+    distance, seconds = timed(hausdorff_distance, gcode_path, user_path, repeat=5)
+    print(f"KD-tree                  : {seconds * 1000:9.2f} ms (distance {distance:.4f})")
+
+    distance, seconds = timed(hausdorff_distance, gcode_path, far_path, tolerance=1, repeat=5)
+    print(f"KD-tree, early exit      : {seconds * 1000:9.2f} ms (distance > 1: {distance:.4f})")
+
+    # the quadratic reference is only timed on a subsample and extrapolated for large inputs
+    sample = min(num_points, 2000)
+    step = max(num_points // sample, 1)
+    distance, seconds = timed(python_hausdorff_distance, gcode_path[::step], user_path[::step])
+    estimate = seconds * (num_points / sample) ** 2
+    label = "measured" if sample == num_points else f"extrapolated from {sample} points"
+    print(f"Pure Python              : {estimate * 1000:9.2f} ms ({label})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Benchmark the heightmap stock simulation on a pocket over a 100x100 mm workpiece at 0.1 mm resolution
+
+Usage: python bench_stock.py [stepover in mm]
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.abspath('.'))
+
+from gllm.utils.ir_utils import parse_program
+from gllm.utils.toolpath_utils import interpret_program
+from gllm.utils.stock_utils import Stock, simulate_stock
+
+
+def pocket_gcode(stepover, depth=-2.0, layers=3):
+    """Zigzag pocket over the whole workpiece, layer by layer, with a rapid retract between layers."""
+    lines = ["G21 G90", "G00 Z5", "G00 X3 Y3"]
+    for layer in range(1, layers + 1):
+        lines.append(f"G01 Z{depth * layer / layers:.3f} F300")
+        y, forward = 3.0, True
+        while y <= 97:
+            lines.append(f"G01 X{97 if forward else 3} Y{y:.3f}")
+            y += stepover
+            forward = not forward
+            lines.append(f"G01 Y{min(y, 97):.3f}")
+        lines += ["G00 Z5", "G00 X3 Y3"]
+    lines.append("M30")
+    return "\n".join(lines)
+
+
+def main():
+    stepover = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    program = parse_program(pocket_gcode(stepover))
+    toolpath = interpret_program(program)
+    print(f"Pocket with {len(toolpath)} moves on a 1000 x 1000 heightmap")
+
+    best = float('inf')
+    for _ in range(3):
+        stock = Stock(100, 100, bottom=-10)
+        start = time.perf_counter()
+        collisions = simulate_stock(toolpath, stock, tool_radius=3.0)
+        best = min(best, time.perf_counter() - start)
+    print(f"Simulation: {best * 1000:.1f} ms, {len(collisions)} rapid collisions, "
+          f"{stock.volume() / 1000:.1f} cm^3 removed")
+
+
+if __name__ == "__main__":
+    main()
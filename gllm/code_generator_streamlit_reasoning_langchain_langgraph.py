@@ -23,11 +23,17 @@ import streamlit as st
 from gllm.utils.rag_utils import setup_langchain_with_rag
 from gllm.utils.model_utils import setup_model, setup_langchain_without_rag
 from gllm.utils.params_extraction_utils import extract_parameters_logic, display_extracted_parameters, parse_extracted_parameters, extract_numerical_values
-from gllm.utils.gcode_utils import display_generated_gcode, generate_gcode_logic, plot_generated_gcode, validate_gcode, clean_gcode, generate_gcode_unstructured_prompt, generate_task_descriptions
+from gllm.utils.gcode_utils import display_generated_gcode, generate_gcode_logic, plot_generated_gcode, validate_gcode, validate_rewrite, clean_gcode, generate_gcode_unstructured_prompt, generate_task_descriptions
 from gllm.utils.graph_utils import construct_graph, _print_event
-from gllm.utils.plot_utils import plot_user_specification, refine_gcode
+from gllm.utils.plot_utils import user_specification_image, cached_render
+from gllm.utils.reorder_utils import reorder_program, describe_reorder
+from gllm.utils.arcfit_utils import fit_arcs
+from gllm.utils.compact_utils import compact_gcode
+from gllm.utils.program_utils import ProgramBuilder, assemble_programs, describe_assembly
+from gllm.utils.spatial_utils import parse_keep_out_zones
 import plotly.express as px  # Import Plotly Express
 from gllm.utils.params_extraction_utils import from_dict_to_text
+from gllm.utils.trace_utils import configure_logging
 from langgraph.checkpoint.sqlite import SqliteSaver
 
 
@@ -40,8 +46,18 @@ def extract_parameters(description_text):
         st.session_state['user_inputs'].update(extracted_parameters)
 
 
+def keep_if_valid(original, rewritten, label):
+    """The rewritten program unless it fails a check of validate_gcode that the original passes (with a warning)."""
+    passed, error = (True, None) if rewritten == original else validate_rewrite(original, rewritten)
+    if passed:
+        return rewritten
+    st.warning(f"{label} produced a program that fails validation ({error}); the program is kept as it was.")
+    return original
+
+
 def main():
 
+    configure_logging()
     _printed = set()
     thread_id = str(uuid.uuid4())
     config = {
@@ -67,6 +83,24 @@ def main():
 
     pdf_files = st.file_uploader("Upload PDF files with additional knowledge (RAG)", accept_multiple_files=True, type=['pdf'])
 
+    # fixtures and clamps the generated tool path is checked against
+    keep_out_text = st.sidebar.text_area("Keep-out zones", placeholder="40, 40, 60, 60, 10, front clamp",
+                                         help="One zone per line: x_min, y_min, x_max, y_max, z_top in mm and an optional name.")
+    try:
+        keep_out_zones = parse_keep_out_zones(keep_out_text)
+    except ValueError as e:
+        st.sidebar.error(str(e))
+        keep_out_zones = []
+
+    # optimizations rewriting the validated program (each rewritten program is validated again)
+    st.sidebar.subheader("Optimizations")
+    reorder_enabled = st.sidebar.checkbox("Reorder operations to shorten rapid travel", value=False)
+    arcs_enabled = st.sidebar.checkbox("Replace G01 polylines by G02/G03 arcs", value=False)
+
+    st.sidebar.subheader("Export")
+    compact_export = st.sidebar.checkbox("Offer a compacted copy for DNC transfer", value=False,
+                                         help="Drops the comments and the words repeating the modal state; the program shown stays readable.")
+
     if "langchain_chain" not in st.session_state:
         if pdf_files:
             st.session_state['langchain_chain'] = setup_langchain_with_rag(pdf_files, model)
@@ -123,7 +157,7 @@ def main():
             # Check if parsed_parameters is valid before plotting
             if st.session_state.parsed_parameters and isinstance(st.session_state.parsed_parameters, dict):
                 st.text("If the plotted path is incorrect, please adjust the task description.")
-                st.pyplot(plot_user_specification(parsed_parameters=st.session_state.parsed_parameters))
+                st.image(cached_render(user_specification_image, st.session_state.parsed_parameters))
             else:
                 st.error("Could not parse parameters for visualization. Please check your task description and try extracting parameters again.")
                 st.write("Debug: parsed_parameters =", st.session_state.parsed_parameters)
@@ -134,7 +168,7 @@ def main():
 
     if st.button("Generate G-code"):
 
-        gcodes_combined = ""
+        subtask_programs = []
 
         if not st.session_state['task_descriptions']:
             st.session_state['task_descriptions'] = [input_description]
@@ -159,13 +193,15 @@ def main():
                         graph_builder = construct_graph(
                             st.session_state['langchain_chain'],
                             st.session_state['user_inputs'],
-                            st.session_state['extracted_parameters']
+                            st.session_state['extracted_parameters'],
+                            keep_out_zones
                         )
                         
                         # Compile the graph with the checkpointer
                         graph = graph_builder.compile(checkpointer=memory)
 
                         # Stream events from the compiled graph
+                        subtask_program = ProgramBuilder()
                         events = graph.stream(
                             {"messages": [("user", subtask_description)], "iterations": 0},
                             config,
@@ -176,16 +212,54 @@ def main():
                             # Defensively check if the 'generation' key exists in the event
                             if "generation" in event:
                                 # This code will only run when the key is present
-                                gcodes_combined += f"\n{event['generation']}"
-                                gcodes_combined = refine_gcode(gcodes_combined)
-                                st.session_state['gcode'] = gcodes_combined
+                                subtask_program.append(event['generation'])
+
+                        if subtask_program:
+                            subtask_programs.append(subtask_program.gcode)
 
         # restore the extracted parameters from the input task description
         st.session_state['user_inputs'] = st.session_state['user_inputs_backup']
         st.session_state['extracted_parameters'] = st.session_state['extracted_parameters_backup']
 
+        # merge the programs of the subtasks into one program with a single setup, or join them as they are if the
+        # merged program does not pass validation
+        if subtask_programs:
+            joined = ProgramBuilder()
+            for subtask_program in subtask_programs:
+                joined.append(subtask_program)
+            merged, assembly_report = assemble_programs(subtask_programs)
+            st.session_state['gcode'] = keep_if_valid(joined.gcode, merged, "Merging the subtask programs")
+            if len(subtask_programs) > 1 and st.session_state['gcode'] == merged:
+                st.info(describe_assembly(assembly_report))
+
+        # visit the operations of the subtasks (and the drilled holes) in the order with the least rapid travel
+        if st.session_state.get('gcode') and reorder_enabled:
+            reordered, reorder_report = reorder_program(st.session_state['gcode'])
+            st.session_state['gcode'] = keep_if_valid(st.session_state['gcode'], reordered, "Reordering")
+            if st.session_state['gcode'] == reordered:
+                st.info(describe_reorder(reorder_report))
+        # replace the G01 polylines approximating arcs by G02/G03 moves
+        if st.session_state.get('gcode') and arcs_enabled:
+            compressed, arc_report = fit_arcs(st.session_state['gcode'])
+            st.session_state['gcode'] = keep_if_valid(st.session_state['gcode'], compressed, "Arc fitting")
+            if arc_report['arcs'] and st.session_state['gcode'] == compressed:
+                st.info(f"Fitted {arc_report['arcs']} arcs to {arc_report['replaced_moves']} G01 moves: "
+                        f"{arc_report['lines_before']} -> {arc_report['lines_after']} lines "
+                        f"({arc_report['reduction']:.0%} fewer).")
+
     display_generated_gcode()
 
+    # compacted copy of the program for drip-feeding; the readable program stays in the session
+    if st.session_state.get('gcode') and compact_export:
+        compacted, compact_report = compact_gcode(st.session_state['gcode'])
+        compacted = keep_if_valid(st.session_state['gcode'], compacted, "Compaction")
+        if compacted != st.session_state['gcode']:
+            st.download_button(label="Download compacted G-code (DNC)", data=compacted,
+                               file_name="generated_compact.gcode", mime="text/plain")
+            st.caption(f"Compacted copy: {compact_report['bytes_before']} -> {compact_report['bytes_after']} bytes, "
+                       f"{compact_report['lines_before']} -> {compact_report['lines_after']} lines "
+                       f"({compact_report['reduction']:.0%} smaller).")
+
     plot_generated_gcode()
 
      # Debug information
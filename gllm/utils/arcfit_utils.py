@@ -0,0 +1,254 @@
+"""
+Description of this file:
+
+This file contains the arc-fitting compressor, which replaces runs of short G01 moves approximating a curve by
+G02/G03 arcs. Long G01 polylines make programs large and starve the lookahead of the controller; an arc is a single
+block that the controller follows at full feed.
+
+The runs of planar XY feed moves (same height, same feed, nothing but X/Y words on the lines) are first cut where
+the polyline stops turning in one direction. Every candidate run is then fitted with the circle through its end points
+and its middle vertex and checked: its vertices must lie within the tolerance of the circle and so must its moves
+(the sagitta between every chord and the arc), and the arc must turn monotonically, by less than a full circle and by
+at most MAX_MOVE_ANGLE per move (so that coarse polygons, whose corners also lie on a circle, stay polygons). Runs that
+fail are split at their worst vertex, as in the Douglas-Peucker algorithm, until every remaining run fits or becomes
+too short.
+
+The fitting is vectorized with NumPy over all the runs of the program at once.
+
+Authors: Mohamed Abdelaal, Samuel Lokadjaja
+
+This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
+"""
+
+import re
+import math
+from typing import TypedDict
+import numpy as np
+from gllm.utils.ir_utils import parse_program, forward_fill, format_word, COMMENT_PATTERN, NO_MOTION, FLAG_G20, \
+    FLAG_G21, FLAG_G91
+from gllm.utils.toolpath_utils import interpret_program, LINEAR, INCH, CHORD_TOLERANCE
+
+# Largest distance in mm between the fitted arcs and the G01 moves they replace
+ARC_TOLERANCE = CHORD_TOLERANCE
+
+# Largest angle a replaced move may turn around the center of its arc (at least 24 moves per full circle)
+MAX_MOVE_ANGLE = math.pi / 12
+
+# Smallest number of G01 moves replaced by one arc
+MIN_ARC_SEGMENTS = 3
+
+# Largest radius of a fitted arc in mm (flatter runs are kept as straight moves)
+MAX_ARC_RADIUS = 10000.0
+
+# Decimals of the I/J words of the fitted arcs
+ARC_DIGITS = 4
+
+# G01 lines that can be part of an arc: X/Y words, and an optional G01 and F word
+FEED_LINE_PATTERN = re.compile(r'^(G0*1(?!\d))?\s*([XY]\s*[+-]?(?:\d+\.?\d*|\.\d+)\s*)+(F\s*(?:\d+\.?\d*|\.\d+))?$')
+
+
+class ArcFitReport(TypedDict):
+    """
+    Outcome of fitting arcs to a program.
+
+    Attributes:
+        lines_before, lines_after : Number of lines of the original and of the compressed program
+        arcs : Number of G02/G03 arcs written
+        replaced_moves : Number of G01 moves replaced by the arcs
+        reduction : Share of the lines removed (0 to 1)
+    """
+
+    lines_before: int
+    lines_after: int
+    arcs: int
+    replaced_moves: int
+    reduction: float
+
+
+def circle_centers(a, b, c):
+    """Centers of the circles through the points a, b and c, pairwise (NaN for collinear points)."""
+    ab, ac = b - a, c - a
+    cross = ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0]
+    ab2, ac2 = np.einsum('ij,ij->i', ab, ab), np.einsum('ij,ij->i', ac, ac)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = (np.column_stack((ac[:, 1] * ab2 - ab[:, 1] * ac2, ab[:, 0] * ac2 - ac[:, 0] * ab2)) /
+                  (2 * cross[:, None]))
+    return np.where(cross[:, None] != 0, a + offset, np.nan)
+
+
+def turning_runs(points, chain_ends, min_segments):
+    """
+    Runs of vertices along which the polylines turn in a single direction.
+
+    :param points: (N, 2) vertices of all polylines, one after the other.
+    :param chain_ends: Mask of the first and last vertex of every polyline.
+    :return: (starts, ends, turn): first and last vertex of every run with at least min_segments moves, and its
+             direction (1 counterclockwise, -1 clockwise)
+    """
+    direction = np.diff(points, axis=0)
+    cross = direction[:-1, 0] * direction[1:, 1] - direction[:-1, 1] * direction[1:, 0]
+    lengths = np.hypot(*direction.T)
+    # vertices where the polyline goes straight on turn in neither direction
+    straight = np.abs(cross) <= 1e-12 * lengths[:-1] * lengths[1:]
+    turn = np.concatenate(([0], np.where(straight, 0, np.sign(cross)), [0])).astype(np.int8)
+    turn[chain_ends] = 0
+
+    changes = np.flatnonzero(np.diff(turn) != 0) + 1
+    first, last = np.concatenate(([0], changes)), np.concatenate((changes, [len(turn)])) - 1
+    turning = turn[first] != 0
+    # the run of vertices first..last turning one way covers the moves from the vertex before to the vertex after
+    starts, ends, turn = first[turning] - 1, last[turning] + 1, turn[first[turning]]
+    # a move between two runs turning in opposite directions goes to the first one
+    starts[1:] = np.maximum(starts[1:], ends[:-1])
+    long_enough = ends - starts >= min_segments
+    return starts[long_enough], ends[long_enough], turn[long_enough]
+
+
+def fit_polyline_arcs(points, starts, ends, turn, tolerance=ARC_TOLERANCE, min_segments=MIN_ARC_SEGMENTS):
+    """
+    Arcs within tolerance of the polyline runs points[starts[i]..ends[i]], all runs at once.
+
+    :return: (starts, ends, centers, turn): first and last vertex, center and direction of every fitted arc
+    """
+    starts, ends, turn = np.asarray(starts), np.asarray(ends), np.asarray(turn)
+    fitted = [], [], [], []
+    while len(starts):
+        middle = (starts + ends) // 2
+        centers = circle_centers(points[starts], points[middle], points[ends])
+        radii = np.hypot(*(points[starts] - centers).T)
+
+        counts = ends - starts
+        offsets = np.cumsum(counts) - counts
+        owner = np.repeat(np.arange(len(starts)), counts)
+        index = starts[owner] + np.arange(counts.sum()) - offsets[owner]
+        center = centers[owner]
+        # every move index -> index + 1: the distance of its end from the circle and the angle it turns around it
+        deviation = np.nan_to_num(np.abs(np.hypot(*(points[index + 1] - center).T) - radii[owner]), nan=np.inf)
+        before, after = points[index] - center, points[index + 1] - center
+        cross = before[:, 0] * after[:, 1] - before[:, 1] * after[:, 0]
+        angles = np.arctan2(cross, np.einsum('ij,ij->i', before, after)) * turn[owner]
+        # the arc is furthest from the chord of a move in its middle: the sagitta, radius minus the distance of the
+        # chord from the center (the deviations of the vertices are included in that distance)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            chord_distance = np.abs(cross) / np.hypot(*(after - before).T)
+        sagitta = np.nan_to_num(np.abs(radii[owner] - chord_distance), nan=0.0)
+
+        worst = np.maximum.reduceat(deviation, offsets)
+        worst_chord = np.maximum.reduceat(sagitta, offsets)
+        turns = np.logical_and.reduceat((angles > 0) & (angles <= MAX_MOVE_ANGLE), offsets)
+        sweep = np.add.reduceat(angles, offsets)
+        fits = ((worst <= tolerance) & (worst_chord <= tolerance) & turns & (sweep < 2 * math.pi - 1e-9) &
+                (radii <= MAX_ARC_RADIUS))
+        for collected, values in zip(fitted, (starts, ends, centers, turn)):
+            collected.append(values[fits])
+
+        # split the others at the vertex furthest from their arc (the middle one if the arc itself does not fit)
+        vertex_deviation = np.where(index + 1 < ends[owner], deviation, -np.inf)
+        candidates = np.flatnonzero(vertex_deviation == np.maximum.reduceat(vertex_deviation, offsets)[owner])
+        _, first = np.unique(owner[candidates], return_index=True)
+        split = np.where((worst <= tolerance) | ~np.isfinite(worst), middle, index[candidates[first]] + 1)
+        failed = ~fits
+        starts, ends = (np.concatenate((starts[failed], split[failed])),
+                        np.concatenate((split[failed], ends[failed])))
+        turn = np.tile(turn[failed], 2)
+        long_enough = ends - starts >= min_segments
+        starts, ends, turn = starts[long_enough], ends[long_enough], turn[long_enough]
+
+    starts, ends, centers, turn = (np.concatenate(values) if values else np.zeros(0) for values in fitted)
+    order = np.argsort(starts)
+    return starts[order].astype(np.int64), ends[order].astype(np.int64), centers[order].reshape(-1, 2), \
+        turn[order].astype(np.int8)
+
+
+def feed_runs(program, segments):
+    """
+    Runs of G01 lines that can be replaced by arcs: consecutive lines each making one planar XY feed move, with the
+    same feed, nothing but X/Y words (an F word only on the first line of a run) and in the G17 plane.
+
+    :return: (segment, run_start): the segments of the runs, one after the other, and a mask of the first segment of
+             every run
+    """
+    rows, first, counts = np.unique(segments['row'], return_index=True, return_counts=True)
+    codes = [COMMENT_PATTERN.sub('', program.lines[row]).upper().strip() for row in rows]
+    simple = np.array([FEED_LINE_PATTERN.match(code) is not None for code in codes], dtype=bool)
+    single = segments[first]
+    candidate = (simple & (counts == 1) & (single['motion'] == LINEAR) & (single['plane'] == 17) &
+                 (single['start'][:, 2] == single['end'][:, 2]))
+    segment = first[candidate]
+    rows = rows[candidate]
+    has_feed = program.has('F')[rows]
+    joined = np.concatenate(([False], (np.diff(rows) == 1) & (np.diff(segment) == 1) & ~has_feed[1:] &
+                             (segments['feed'][segment[1:]] == segments['feed'][segment[:-1]])))
+    return segment, ~joined
+
+
+def fit_arcs(gcode, tolerance=ARC_TOLERANCE, min_segments=MIN_ARC_SEGMENTS):
+    """
+    Replace runs of G01 moves approximating circular arcs by G02/G03 moves with I/J offsets.
+
+    :param gcode: The G-code string.
+    :param tolerance: Largest distance in mm between an arc and the moves it replaces.
+    :param min_segments: Smallest number of moves replaced by one arc.
+    :return: (gcode, ArcFitReport): the compressed program (the original text if no arc was fitted)
+    """
+    program = parse_program(gcode)
+    lines_before = len(program)
+    unchanged = ArcFitReport(lines_before=lines_before, lines_after=lines_before, arcs=0, replaced_moves=0,
+                             reduction=0.0)
+    if program.has_flag(FLAG_G91).any() or (program.has_flag(FLAG_G20).any() and program.has_flag(FLAG_G21).any()):
+        return gcode, unchanged
+    scale = INCH if program.has_flag(FLAG_G20).any() else 1.0
+    segments = interpret_program(program).segments
+    segment, run_start = feed_runs(program, segments)
+    if not len(segment):
+        return gcode, unchanged
+
+    # vertices of every run: the start of its first move, then the end of every move
+    first_of_run = np.flatnonzero(run_start)
+    vertex_segment = np.insert(segment, first_of_run, segment[first_of_run])
+    is_start = np.zeros(len(vertex_segment), dtype=bool)
+    is_start[first_of_run + np.arange(len(first_of_run))] = True
+    points = np.where(is_start[:, None], segments['start'][vertex_segment, :2], segments['end'][vertex_segment, :2])
+    chain_ends = is_start | np.append(is_start[1:], True)
+
+    starts, ends, turn = turning_runs(points, chain_ends, min_segments)
+    # leave room for rounding the centers to ARC_DIGITS decimals
+    starts, ends, centers, turn = fit_polyline_arcs(points, starts, ends, turn, tolerance - 10.0 ** -ARC_DIGITS * scale,
+                                                    min_segments)
+    if not len(starts):
+        return gcode, unchanged
+
+    lines = list(program.lines)
+    modal_motion = forward_fill(program.motion, program.motion != NO_MOTION, NO_MOTION)
+    has_x, has_y, has_f = program.has('X'), program.has('Y'), program.has('F')
+    removed = np.zeros(len(lines), dtype=bool)
+    first_rows, last_rows = [], []
+    for start, end, center, direction in zip(starts, ends, centers, turn):
+        # vertex k > 0 of a run is the end of the move of vertex_segment[k]
+        rows = segments['row'][vertex_segment[start + 1:end + 1]]
+        first_row, last_row = int(rows[0]), int(rows[-1])
+        x = program.X[last_row] if has_x[last_row] else points[end, 0] / scale
+        y = program.Y[last_row] if has_y[last_row] else points[end, 1] / scale
+        i, j = np.round((center - points[start]) / scale, ARC_DIGITS) + 0.0
+        words = ['G03' if direction > 0 else 'G02', format_word('X', x), format_word('Y', y), format_word('I', i),
+                 format_word('J', j)]
+        if has_f[first_row]:
+            words.append(format_word('F', program.F[first_row]))
+        lines[first_row] = ' '.join(words)
+        removed[first_row + 1:last_row + 1] = True
+        first_rows.append(first_row)
+        last_rows.append(last_row)
+
+    # the moves after an arc that relied on the modal G01 need it again
+    rewritten = set(first_rows)
+    for last_row in last_rows:
+        following = last_row + 1
+        if (following < len(lines) and following not in rewritten and modal_motion[following] == 1 and
+                program.motion[following] == NO_MOTION):
+            lines[following] = f"G01 {lines[following]}".rstrip()
+
+    compressed = [line_text for line_text, drop in zip(lines, removed) if not drop]
+    replaced = int((ends - starts).sum())
+    return '\n'.join(compressed), ArcFitReport(lines_before=lines_before, lines_after=len(compressed),
+                                               arcs=len(starts), replaced_moves=replaced,
+                                               reduction=1 - len(compressed) / lines_before)
@@ -0,0 +1,171 @@
+"""
+Description of this file:
+
+This file contains the content-addressed caches used to avoid repeating work on identical inputs, e.g. validating a
+G-code program that was already validated with the same checks. Entries are keyed by a SHA-256 hash of their inputs,
+kept in memory in least-recently-used order up to a bounded number of entries and, optionally, stored on disk as
+well, so that they survive restarts and are shared between the processes using the same directory.
+
+The caches are implemented in Python on top of the standard collections, hashlib and pickle modules.
+
+Authors: Mohamed Abdelaal, Samuel Lokadjaja
+
+This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
+"""
+
+import os
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Default number of entries kept in memory and on disk
+CACHE_ENTRIES = 1024
+
+
+def content_key(*parts):
+    """SHA-256 hex digest identifying the given values (strings are hashed as they are, other values by repr)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part if isinstance(part, str) else repr(part)).encode('utf-8', errors='replace'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """
+    Bounded least-recently-used cache, optionally backed by a directory.
+
+    Entries evicted from memory stay on disk; the oldest files are removed once the directory holds more than
+    max_disk_entries of them. Values stored on disk must be picklable.
+
+    Attributes:
+        max_entries : Number of entries kept in memory
+        max_bytes, sizeof : Optional bound on the total size of the entries in memory, measured by sizeof(value)
+        directory : Directory holding one file per entry, or None for a memory-only cache
+        max_disk_entries : Number of files kept in the directory
+        hits, misses : Number of lookups that found / did not find their key
+    """
+
+    def __init__(self, max_entries=CACHE_ENTRIES, directory=None, max_disk_entries=None, max_bytes=None, sizeof=len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.sizes = {}
+        self.bytes = 0
+        self.directory = directory
+        self.max_disk_entries = max_disk_entries or max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.disk_entries = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self.disk_entries = len(self.disk_files())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries or (self.directory is not None and os.path.exists(self.path(key)))
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def disk_files(self):
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith('.pkl')]
+
+    def get(self, key, default=None):
+        """Value stored for key (counted as a hit), or default (counted as a miss)."""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+        value = self.load(key) if self.directory is not None else None
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.remember(key, value)
+        return value
+
+    def put(self, key, value):
+        """Store a value (None values are not cached)."""
+        if value is None:
+            return
+        with self.lock:
+            self.remember(key, value)
+        if self.directory is not None:
+            self.store(key, value)
+
+    def remember(self, key, value):
+        if self.max_bytes is not None:
+            size = self.sizeof(value)
+            self.bytes += size - self.sizes.get(key, 0)
+            self.sizes[key] = size
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        # the entry just stored is kept even if it exceeds max_bytes on its own
+        while len(self.entries) > self.max_entries or (self.max_bytes is not None and self.bytes > self.max_bytes
+                                                       and len(self.entries) > 1):
+            evicted, _ = self.entries.popitem(last=False)
+            self.bytes -= self.sizes.pop(evicted, 0)
+
+    def load(self, key):
+        try:
+            with open(self.path(key), 'rb') as file:
+                value = pickle.load(file)
+            os.utime(self.path(key))
+            return value
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logger.warning("Ignoring unreadable cache entry %s: %s", key, e)
+            return None
+
+    def store(self, key, value):
+        path = self.path(key)
+        existed = os.path.exists(path)
+        try:
+            # write to a temporary file first, so that concurrent readers never see a partial entry
+            temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, 'wb') as file:
+                pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, path)
+        except OSError as e:
+            logger.warning("Could not write cache entry %s: %s", key, e)
+            return
+        with self.lock:
+            self.disk_entries += not existed
+            if self.disk_entries <= self.max_disk_entries:
+                return
+            files = sorted(self.disk_files(), key=lambda entry: entry.stat().st_mtime)
+            for entry in files[:max(len(files) - self.max_disk_entries * 9 // 10, 0)]:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+            self.disk_entries = len(self.disk_files())
+
+    def clear(self):
+        """Remove all entries, in memory and on disk, and reset the counters."""
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.hits = self.misses = self.bytes = 0
+            if self.directory is not None:
+                for entry in self.disk_files():
+                    os.remove(entry.path)
+                self.disk_entries = 0
+
+    def stats(self):
+        """Hit and miss counters and sizes, e.g. for logging."""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self.entries), 'bytes': self.bytes, 'disk_entries': self.disk_entries}
@@ -0,0 +1,234 @@
+"""
+Description of this file:
+
+This file contains the compaction pass that shrinks G-code programs for DNC drip-feeding and for the block-processing
+rate of the controller. Walking the program once while tracking its modal state, it
+
+- drops the modal words that repeat the active state: G00-G03 motion, G17-G19 plane, G20/G21 units, G90/G91
+  distance mode, G98/G99 retract mode, and F and S words repeating the active feed and spindle speed;
+- drops the axis words of G00/G01 moves that repeat the current position, and with them the zero-length moves;
+- rounds the numbers to the resolution of the controller and prints them in their shortest form (G01 -> G1,
+  X10.000 -> X10);
+- drops the comments and the blank lines.
+
+Lines with words it does not handle (e.g. N, P, H or D words, G28/G92 and the canned cycles) are kept as they are,
+apart from their comments. Programs in inverse-time feed mode (G93), where every move carries its own F word, are
+not compacted. The compacted program is interpreted again and only returned if it makes the same moves as
+the original within the resolution; otherwise the original is returned.
+
+The pass is implemented in Python on top of the tokenizer (ir_utils.py) and the interpreter (toolpath_utils.py).
+
+Authors: Mohamed Abdelaal, Samuel Lokadjaja
+
+This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
+"""
+
+import re
+import math
+import logging
+from typing import TypedDict
+import numpy as np
+from gllm.utils.ir_utils import parse_program, tokenize_line, COMMENT_PATTERN, WORD_PATTERN, AXIS_WORDS, FLAG_ERROR, \
+    FLAG_G20
+from gllm.utils.toolpath_utils import interpret_program, DRILLING_CYCLES, INCH
+
+logger = logging.getLogger(__name__)
+
+# Decimals of the controller resolution (1 um in millimetres, 0.1 mil in inches)
+RESOLUTION_DIGITS_MM = 3
+RESOLUTION_DIGITS_INCH = 4
+
+# Modal groups of the G-codes whose repetition is dropped
+MODAL_GROUPS = {0: 'motion', 1: 'motion', 2: 'motion', 3: 'motion', 17: 'plane', 18: 'plane', 19: 'plane',
+                20: 'units', 21: 'units', 90: 'distance', 91: 'distance', 98: 'retract', 99: 'retract'}
+
+# G-codes whose axis words are not plain moves; their lines are kept as they are and the position becomes unknown
+SPECIAL_CODES = frozenset([4, 10, 28, 30, 52, 53, 92])
+
+# Inverse-time feed mode, in which the F words are not modal
+INVERSE_TIME_PATTERN = re.compile(r'G0*93(?!\d)', re.IGNORECASE)
+
+# Letters of the words the pass rewrites
+COMPACT_LETTERS = frozenset(AXIS_WORDS) | {'G', 'M'}
+
+
+class CompactReport(TypedDict):
+    """
+    Outcome of compacting a program.
+
+    Attributes:
+        lines_before, lines_after : Number of lines of the original and of the compacted program
+        bytes_before, bytes_after : Size of the original and of the compacted program in bytes (UTF-8)
+        reduction : Share of the bytes removed (0 to 1)
+    """
+
+    lines_before: int
+    lines_after: int
+    bytes_before: int
+    bytes_after: int
+    reduction: float
+
+
+def format_number(value, digits=None):
+    """Shortest text of a number, rounded to `digits` decimals (e.g. 10.0 -> '10', -0.50 -> '-0.5')."""
+    if digits is not None:
+        value = round(value, digits)
+    return np.format_float_positional(value + 0.0, trim='-')
+
+
+class ModalTracker:
+    """
+    Modal state of the compacted program, as the controller sees it.
+
+    Attributes:
+        modes : Active G-code of every modal group of MODAL_GROUPS (None while unknown)
+        feed, spindle : Active F and S values (None while unknown)
+        position : Current X, Y and Z in program units (NaN while unknown)
+    """
+
+    def __init__(self):
+        self.modes = dict.fromkeys(set(MODAL_GROUPS.values()))
+        self.feed = None
+        self.spindle = None
+        self.position = {'X': math.nan, 'Y': math.nan, 'Z': math.nan}
+
+    def absolute(self):
+        return self.modes['distance'] != 91
+
+    def update(self, words):
+        """Apply the words of a line kept as it is."""
+        codes = {value for letter, value in words if letter == 'G'}
+        for code in codes:
+            if code in MODAL_GROUPS:
+                self.modes[MODAL_GROUPS[code]] = code
+            elif code in DRILLING_CYCLES or code == 80:
+                self.modes['motion'] = code
+        for letter, value in words:
+            if letter == 'F':
+                self.feed = value
+            elif letter == 'S':
+                self.spindle = value
+        if codes & SPECIAL_CODES or not self.absolute() or self.modes['motion'] in DRILLING_CYCLES:
+            # canned cycles end at the retract height, and G91 moves are not tracked
+            self.position = dict.fromkeys(self.position, math.nan)
+        for letter, value in words:
+            if letter in self.position and not codes & SPECIAL_CODES and self.absolute():
+                self.position[letter] = value
+        if self.modes['motion'] in DRILLING_CYCLES:
+            self.position['Z'] = math.nan
+
+
+def line_words(code):
+    """(letter, value) of every word of a line (comments removed, upper case)."""
+    return [(letter, float(value)) for letter, value in WORD_PATTERN.findall(code)]
+
+
+def compact_line(words, tracker, digits):
+    """
+    Compacted words of one line, updating the tracker.
+
+    :return: List of the words to print; empty if the line can be dropped
+    """
+    codes = [value for letter, value in words if letter == 'G']
+    motion = next((code for code in codes if MODAL_GROUPS.get(code) == 'motion'), None)
+    distance = next((code for code in codes if MODAL_GROUPS.get(code) == 'distance'), tracker.modes['distance'])
+    absolute = distance != 91
+    active_motion = motion if motion is not None else tracker.modes['motion']
+    plain_move = active_motion in (0, 1) and absolute
+
+    kept = []
+    for letter, value in words:
+        if letter == 'G' and code_repeats(value, tracker):
+            continue
+        if letter in ('X', 'Y', 'Z', 'I', 'J', 'K', 'R'):
+            # incremental moves are not rounded, so that the rounding errors do not add up
+            value = round(value, digits) if absolute or letter not in tracker.position else value
+            if plain_move and letter in tracker.position and value == tracker.position[letter]:
+                continue
+            if not absolute and letter in tracker.position and value == 0 and active_motion in (0, 1):
+                continue
+        elif letter in ('F', 'S'):
+            value = round(value, digits)
+            if value == (tracker.feed if letter == 'F' else tracker.spindle):
+                continue
+        kept.append((letter, value))
+
+    # the dropped words repeat the state, so the kept ones carry all the changes
+    tracker.update(kept)
+    return kept
+
+
+def code_repeats(code, tracker):
+    """True if a G-code repeats the active code of its modal group."""
+    group = MODAL_GROUPS.get(code)
+    return group is not None and tracker.modes[group] == code
+
+
+def format_words(words):
+    return ' '.join(f"{letter}{format_number(value)}" for letter, value in words)
+
+
+def compact_gcode(gcode, digits=None):
+    """
+    Compact a G-code program: drop the repeated modal words, the zero-length moves, the comments and the blank lines,
+    and shorten the numbers to the resolution of the controller.
+
+    :param gcode: The G-code string.
+    :param digits: Decimals kept; default: RESOLUTION_DIGITS_MM, or RESOLUTION_DIGITS_INCH for programs in inches.
+    :return: (gcode, CompactReport): the compacted program (the original if it would not make the same moves)
+    """
+    program = parse_program(gcode)
+    bytes_before = len(gcode.encode('utf-8'))
+    unchanged = CompactReport(lines_before=len(program), lines_after=len(program), bytes_before=bytes_before,
+                              bytes_after=bytes_before, reduction=0.0)
+    if INVERSE_TIME_PATTERN.search(COMMENT_PATTERN.sub('', gcode)):
+        return gcode, unchanged
+    inches = program.has_flag(FLAG_G20).any()
+    if digits is None:
+        digits = RESOLUTION_DIGITS_INCH if inches else RESOLUTION_DIGITS_MM
+
+    tracker = ModalTracker()
+    compacted = []
+    for line_text in gcode.splitlines():
+        code = COMMENT_PATTERN.sub('', line_text).upper().strip()
+        if not code:
+            continue
+        if code == '%':
+            compacted.append(code)
+            continue
+        words = line_words(code)
+        _, flags, _, _ = tokenize_line(line_text)
+        codes = {value for letter, value in words if letter == 'G'}
+        if (flags & FLAG_ERROR or any(letter not in COMPACT_LETTERS for letter, _ in words) or
+                codes & SPECIAL_CODES or codes & DRILLING_CYCLES or tracker.modes['motion'] in DRILLING_CYCLES):
+            compacted.append(code)
+            tracker.update(words)
+            continue
+        kept = compact_line(words, tracker, digits)
+        if kept:
+            compacted.append(format_words(kept))
+
+    compacted_gcode = '\n'.join(compacted)
+    if not same_moves(gcode, compacted_gcode, 10.0 ** -digits * (INCH if inches else 1.0)):
+        logger.warning("Compaction changed the tool path; the program is kept as it is")
+        return gcode, unchanged
+    bytes_after = len(compacted_gcode.encode('utf-8'))
+    return compacted_gcode, CompactReport(lines_before=len(program), lines_after=len(compacted),
+                                          bytes_before=bytes_before, bytes_after=bytes_after,
+                                          reduction=1 - bytes_after / bytes_before if bytes_before else 0.0)
+
+
+def same_moves(original, compacted, tolerance):
+    """True if two programs make the same moves of non-zero length, within tolerance (in mm)."""
+    moves = []
+    for gcode in (original, compacted):
+        segments = interpret_program(gcode).segments
+        moves.append(segments[segments['length'] > tolerance])
+    original, compacted = moves
+    if len(original) != len(compacted):
+        return False
+    return (np.array_equal(original['motion'], compacted['motion']) and
+            np.array_equal(original['tool'], compacted['tool']) and
+            np.allclose(original['end'], compacted['end'], rtol=0, atol=tolerance) and
+            np.allclose(original['feed'], compacted['feed'], rtol=0, atol=tolerance, equal_nan=True) and
+            np.allclose(original['spindle'], compacted['spindle'], rtol=0, atol=tolerance))
@@ -0,0 +1,104 @@
+"""
+Description of this file:
+
+This file contains the machining cycle-time estimator. It works on the segment table of the interpreted tool path
+(see toolpath_utils.py): every rapid move is timed at the rapid traverse rate of the machine and every feed move
+(straight lines, arcs and helices, and the feed moves of expanded drilling cycles) at its programmed feed rate,
+with NumPy over the whole program at once. The estimate ignores acceleration, so it is a lower bound that is
+used to compare and rank G-code candidates by machining time.
+
+Authors: Mohamed Abdelaal, Samuel Lokadjaja
+
+This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
+"""
+
+from typing import TypedDict
+import numpy as np
+from gllm.utils.ir_utils import as_program, forward_fill, NO_MOTION
+from gllm.utils.toolpath_utils import interpret_program, RAPID, CW_ARC, DRILLING_CYCLES
+from gllm.utils.kinematics_utils import simulate_kinematics
+
+# Rapid traverse rate of the machine in mm/min
+RAPID_RATE = 5000.0
+
+# Operations of the per-operation breakdown
+OPERATIONS = ('rapid', 'linear', 'arc', 'drilling')
+
+
+class CycleTimeReport(TypedDict):
+    """
+    Estimated machining time of a program, in seconds.
+
+    Attributes:
+        total : Time of all moves
+        rapid : Time of the rapid moves
+        cutting : Time of the feed moves
+        by_tool : Time per active tool number (-1 before the first tool change)
+        by_operation : Time per operation: 'rapid', 'linear' and 'arc' moves, and 'drilling' for all the moves
+                       (rapid and feed) of canned cycles
+        unfed_moves : Number of feed moves programmed before any F word (not included in the times)
+    """
+
+    total: float
+    rapid: float
+    cutting: float
+    by_tool: dict[int, float]
+    by_operation: dict[str, float]
+    unfed_moves: int
+
+
+def segment_times(segments, rapid_rate=RAPID_RATE):
+    """Time in seconds of every segment of a tool path; feed moves without a feed rate take NaN."""
+    rates = np.where(segments['motion'] == RAPID, rapid_rate, segments['feed'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        times = segments['length'] / rates * 60.0
+    # zero-length moves take no time, even without a feed rate
+    return np.where(segments['length'] == 0, 0.0, times)
+
+
+def segment_operations(program, segments):
+    """Index into OPERATIONS of every segment of the tool path of `program`."""
+    modal_motion = forward_fill(program.motion, program.motion != NO_MOTION, NO_MOTION)
+    rows = np.searchsorted(program.line, segments['row'])
+    in_cycle = np.isin(modal_motion[rows], list(DRILLING_CYCLES))
+    return np.select([in_cycle, segments['motion'] == RAPID, segments['motion'] >= CW_ARC], [3, 0, 2], default=1)
+
+
+def estimate_cycle_time(gcode, rapid_rate=RAPID_RATE):
+    """
+    Estimate the machining time of a G-code program.
+
+    :param gcode: The G-code string, a parsed GCodeProgram or a pathlib.Path to a G-code file.
+    :param rapid_rate: Rapid traverse rate in mm/min.
+    :return: CycleTimeReport
+    """
+    program = as_program(gcode)
+    segments = interpret_program(program).segments
+    times = segment_times(segments, rapid_rate)
+    unfed = np.isnan(times)
+    times = np.where(unfed, 0.0, times)
+
+    is_rapid = segments['motion'] == RAPID
+    tools, tool_index = np.unique(segments['tool'], return_inverse=True)
+    by_tool = np.bincount(tool_index, weights=times, minlength=len(tools))
+    by_operation = np.bincount(segment_operations(program, segments), weights=times, minlength=len(OPERATIONS))
+
+    return CycleTimeReport(total=float(times.sum()), rapid=float(times[is_rapid].sum()),
+                           cutting=float(times[~is_rapid].sum()),
+                           by_tool={int(tool): float(seconds) for tool, seconds in zip(tools, by_tool)},
+                           by_operation={name: float(seconds) for name, seconds in zip(OPERATIONS, by_operation)},
+                           unfed_moves=int(unfed.sum()))
+
+
+def rank_by_cycle_time(gcodes, rapid_rate=RAPID_RATE, machine=None):
+    """
+    Indices of the given G-code candidates, from the fastest to the slowest estimated machining time.
+
+    :param machine: Optional MachineProfile; when given, the candidates are ranked by their simulated time
+                    (see kinematics_utils.simulate_kinematics) instead of length over feed.
+    """
+    if machine is not None:
+        totals = [simulate_kinematics(gcode, machine)['total'] for gcode in gcodes]
+    else:
+        totals = [estimate_cycle_time(gcode, rapid_rate)['total'] for gcode in gcodes]
+    return sorted(range(len(totals)), key=totals.__getitem__)
@@ -15,17 +15,27 @@ This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is publis
 
 import re
 import os
-import pygcode
 import tempfile
 import subprocess
 import streamlit as st
 import itertools
-from gllm.utils.plot_utils import plot_gcode, parse_coordinates, parse_gcode
+import logging
+import numpy as np
+from gllm.utils.ir_utils import as_program, forward_fill, format_word, NO_MOTION, FLAG_EMPTY, FLAG_M30, FLAG_G43, FLAG_G49, CHUNK_LINES
+from gllm.utils.geometry_utils import hausdorff_distance, path_hausdorff_distance, toolpath_primitives, polyline_primitives
+from gllm.utils.toolpath_utils import interpret_program
+from gllm.utils.kinematics_utils import DEFAULT_MACHINE
+from gllm.utils.stock_utils import Stock, simulate_stock, TOOL_RADIUS
+from gllm.utils.spatial_utils import keep_out_collisions, crossed_cuts, KeepOutZone
+from gllm.utils.validation_utils import register_rule, cached_validation, run_validation_stream
+from gllm.utils.plot_utils import toolpath_figure, cached_render, parse_coordinates, parse_gcode
 from gllm.utils.prompts_utils import REQUIRED_PARAMETERS
 from langchain_core.messages.ai import AIMessage
 from gllm.utils.params_extraction_utils import parse_extracted_parameters
 from transformers import AutoTokenizer
 
+logger = logging.getLogger(__name__)
+
 def generate_task_descriptions(chain, model_str, input_description):
 
     # Load tokenizer and model
@@ -87,7 +97,7 @@ def generate_gcode_unstructured_prompt(chain, task_description):
 
 def generate_gcode_logic(chain):
     if any(param not in st.session_state['user_inputs'] for param in REQUIRED_PARAMETERS):
-        print(st.session_state['user_inputs'])
+        logger.info("User inputs: %s", st.session_state['user_inputs'])
         st.error("Please provide all the required parameters.")
     else:        
         gcode = generate_gcode_with_langchain(chain, st.session_state['user_inputs'])
@@ -135,141 +145,132 @@ def display_generated_gcode():
 
 def plot_generated_gcode():
     if st.button("Plot G-code"):
-        plt = plot_gcode(st.session_state['gcode'])
-        st.pyplot(plt)
+        st.plotly_chart(cached_render(toolpath_figure, st.session_state['gcode']), use_container_width=True)
 
 def validate_syntax(gcode_string):
     """Parsing G-code and checking for syntax errors."""
-    try:
-        for line in gcode_string.splitlines():
-            gcode_line = pygcode.Line(line)
-            for word in gcode_line.block.gcodes:
-                # Validate that the word is a valid G-code command
-                if not isinstance(word, pygcode.gcodes.GCode):
-                    error_msg = f"Invalid G-code command: {word}"
-                    raise ValueError(error_msg)
-        return True, None
-    except Exception as e:
-        print(f"Syntax error in G-code: {e}")
-        return False, e
+    program = as_program(gcode_string)
+    if program.errors:
+        row = min(program.errors)
+        error_msg = f"{program.errors[row]} at {program.lines[row]}"
+        logger.info("Syntax error in G-code: %s", error_msg)
+        return False, error_msg
+    return True, None
 
 def validate_unreachable_code(gcode_string):
     """Detecting unreachable code in the program"""
-    reached_end = False
-    for line_text in gcode_string.strip().split('\n'):
-        if 'M30' in line_text:
-            reached_end = True
-        elif reached_end:
-            error_msg = f"Unreachable code detected: {line_text}"
-            print(error_msg)
+    program = as_program(gcode_string)
+    program_end = np.flatnonzero(program.has_flag(FLAG_M30))
+    if len(program_end):
+        after_end = program_end[0] + 1 + np.flatnonzero(~program.has_flag(FLAG_EMPTY)[program_end[0] + 1:])
+        if len(after_end):
+            error_msg = f"Unreachable code detected: {program.lines[after_end[0]]}"
+            logger.info(error_msg)
             return False, error_msg
-        else:
-            print(f"Executed: {line_text}")
 
     return True, None 
 
-def validate_safety(gcode_string):
-    """Ensuring that rapid movements do not pass through the material"""
-    is_cutting = False
-    for line_text in gcode_string.strip().split('\n'):
-        if 'G1' in line_text or 'G01' in line_text:
-            is_cutting = True
-        if ('G0 ' in line_text or 'G00' in line_text) and is_cutting:
-            error_msg = f"Warning: Rapid movement through potential material at {line_text}"
-            print(error_msg)
-            return False, error_msg
-        if is_cutting:
-            is_cutting = False
-        print(f"Processed: {line_text}")
-    
+def validate_safety(gcode_string, safe_height=0, workpiece_dimensions=None, tool_radius=TOOL_RADIUS, state=None):
+    """
+    Ensuring that rapid movements do not pass through the material
+
+    The stock is simulated as a heightmap: feed moves carve it and every rapid move is checked against the material
+    that is left. Without workpiece dimensions, the material fills the area of the tool path below safe_height.
+
+    :param workpiece_dimensions: Parsed `Workpiece Dimensions` (length, width and height of the stock).
+    :param tool_radius: Radius of the cutting tool in mm.
+    :param state: Simulation kept between the chunks of a streamed program (the stock and the modal state).
+    """
+    program = as_program(gcode_string)
+    state = {} if state is None else state
+    toolpath = interpret_program(program, state.get('modal'))
+    stock = state.get('stock')
+    if stock is None:
+        stock = Stock.from_dimensions(workpiece_dimensions) or Stock.around(toolpath.segments, tool_radius, top=safe_height)
+    elif Stock.from_dimensions(workpiece_dimensions) is None:
+        stock.include(toolpath.segments, tool_radius)
+    state['stock'], state['modal'] = stock, toolpath.state
+
+    collisions = simulate_stock(toolpath, stock, tool_radius)
+    if collisions:
+        row = np.searchsorted(program.line, toolpath.segments['row'][collisions[0]])
+        error_msg = f"Warning: Rapid movement through potential material at {program.lines[row]}"
+        logger.info(error_msg)
+        return False, error_msg
+
     return True, None
 
 def validate_continuity(gcode_string):
     """Checking for continuity in tool paths"""
-    lines = gcode_string.strip().split('\n')
-    last_position = None 
-
-    for line_text in lines:
-        line = pygcode.Line(line_text)
-        # Ensure the line has G-code commands and check for X, Y parameters
-        if line.block.gcodes and 'X' in line.block.gcodes[0].params and 'Y' in line.block.gcodes[0].params:
-            current_position = (line.block.gcodes[0].params['X'], line.block.gcodes[0].params['Y'])
-            if last_position and (current_position != last_position):
-                error_msg = f"Discontinuity detected at {line_text}"
-                print(error_msg)
-                return False, error_msg
-            last_position = current_position
-        print(f"Processed: {line_text}")
+    program = as_program(gcode_string)
+    rows = np.flatnonzero((program.motion != NO_MOTION) & program.has('X') & program.has('Y'))
+    jumps = np.flatnonzero((program.X[rows][1:] != program.X[rows][:-1]) | (program.Y[rows][1:] != program.Y[rows][:-1]))
+    if len(jumps):
+        error_msg = f"Discontinuity detected at {program.lines[rows[jumps[0] + 1]]}"
+        logger.info(error_msg)
+        return False, error_msg
     return True, None
 
 def validate_feed_rate(gcode_string, min_feed, max_feed):
     """Ensure that the feed rate specified in G-code commands is within the acceptable limits for the material and tool being used. 
        This can prevent tool breakage and suboptimal machining conditions."""
-    lines = gcode_string.strip().split('\n')
-    for line_text in lines:
-        line = pygcode.Line(line_text)
-        if 'F' in line.block.modal_params:
-            feed_rate = line.block.modal_params['F']
-            if not (min_feed <= feed_rate <= max_feed):
-                error_msg = f"Feed rate out of bounds at {line_text}"
-                print(error_msg)
-                return False, error_msg
+    program = as_program(gcode_string)
+    out_of_bounds = np.flatnonzero(program.has('F') & ((program.F < min_feed) | (program.F > max_feed)))
+    if len(out_of_bounds):
+        error_msg = f"Feed rate out of bounds at {program.lines[out_of_bounds[0]]}"
+        logger.info(error_msg)
+        return False, error_msg
     return True, None
 
 def validate_tool_changes(gcode_string):
-    expecting_initialization = False
-    lines = gcode_string.strip().split('\n')
-    for line_text in lines:
-        line = pygcode.Line(line_text)
-        if 'T' in line.block.modal_params:
-            expecting_initialization = True
-        elif 'S' in line.block.modal_params and expecting_initialization:
-            expecting_initialization = False
-        elif expecting_initialization:
-            error_msg = f"Missing spindle speed after tool change before {line_text}"
-            print(error_msg)
-            return False, error_msg
+    """Ensure that a spindle speed is programmed after every tool change, before the new tool cuts."""
+    program = as_program(gcode_string)
+    modal_motion = forward_fill(program.motion, program.motion != NO_MOTION, NO_MOTION)
+    moves = program.has('X') | program.has('Y') | program.has('Z')
+    cuts = np.flatnonzero(moves & (modal_motion != NO_MOTION) & (modal_motion != 0) & (modal_motion != 80))
+    tools = np.flatnonzero(program.has('T'))
+    # the first cut and the first speed at or after every tool change (len(program) if there is none)
+    next_cut = np.append(cuts, len(program))[np.searchsorted(cuts, tools)]
+    speeds = np.flatnonzero(program.has('S'))
+    next_speed = np.append(speeds, len(program))[np.searchsorted(speeds, tools)]
+    missing_speed = np.flatnonzero(next_cut < next_speed)
+    if len(missing_speed):
+        error_msg = f"Missing spindle speed after tool change before {program.lines[next_cut[missing_speed[0]]]}"
+        logger.info(error_msg)
+        return False, error_msg
     return True, None
 
 def validate_spindle_speed(gcode_string, max_spindle_speed):
     """"Ensure that spindle speeds are within the machine's operational limits."""
-    lines = gcode_string.strip().split('\n')
-    for line_text in lines:
-        line = pygcode.Line(line_text)
-        if 'S' in line.block.modal_params:
-            spindle_speed = line.block.modal_params['S']
-            if spindle_speed > max_spindle_speed:
-                error_msg = f"Spindle speed exceeds maximum limit at {line_text}"
-                print(error_msg)
-                return False, error_msg
+    program = as_program(gcode_string)
+    too_fast = np.flatnonzero(program.has('S') & (program.S > max_spindle_speed))
+    if len(too_fast):
+        error_msg = f"Spindle speed exceeds maximum limit at {program.lines[too_fast[0]]}"
+        logger.info(error_msg)
+        return False, error_msg
     return True, None
 
 def validate_z_levels(gcode_string, max_depth):
     """Verify that Z-level movements do not exceed certain depth limits to prevent the tool from crashing into the workpiece or machine bed."""
-    lines = gcode_string.strip().split('\n')
-    for line_text in lines:
-        line = pygcode.Line(line_text)
-        if 'Z' in line.block.gcodes[0].params:
-            z_level = line.block.gcodes[0].params['Z']
-            if z_level > max_depth:
-                error_msg = f"Z-level exceeds maximum depth at {line_text}"
-                print(error_msg)
-                return False, error_msg
+    program = as_program(gcode_string)
+    too_deep = np.flatnonzero(program.has('Z') & (program.Z > max_depth))
+    if len(too_deep):
+        error_msg = f"Z-level exceeds maximum depth at {program.lines[too_deep[0]]}"
+        logger.info(error_msg)
+        return False, error_msg
     return True, None
 
 
-def validate_functional_correctness(gcode_string, parameters_string):
+def validate_functional_correctness(gcode_string, parameters_string, comparison='segments'):
     """
     Validate functional correctness of G-code against user-defined parameters
+
+    :param comparison: 'segments' compares both tool paths exactly as line segments and arcs,
+                       'points' compares the points sampled by parse_gcode with the user-defined points.
     """
     # Handle None parameters_string
     if parameters_string is None:
         return True, None
-    
-    x_points, y_points = parse_gcode(gcode_string)
-    # print("Parsed G-code parameters", x_points, y_points)
-
-    gcode_tool_path = [(x,y) for x, y in zip(x_points, y_points)]
 
     user_defined_parameters = parse_extracted_parameters(parameter_string=parameters_string)
     
@@ -292,36 +293,32 @@ def validate_functional_correctness(gcode_string, parameters_string):
                 y_path = (user_defined_start_point[1],) + y_path
 
             user_defined_tool_path = [(x,y) for x, y in zip(x_path, y_path)]
-
-            # Remove consecutive duplicates from both paths
-            gcode_tool_path = [k for k, _ in itertools.groupby(gcode_tool_path)]
             user_defined_tool_path = [k for k, _ in itertools.groupby(user_defined_tool_path)]
 
-            # Calculate the Hausdorff distance between the two paths
-            def hausdorff_distance(path1, path2):
-                def point_distance(p1, p2):
-                    return ((p1[0] - p2[0])**2 + (p1[1] - p2[1])**2)**0.5
-
-                def directed_hausdorff(path_a, path_b):
-                    return max(min(point_distance(a, b) for b in path_b) for a in path_a)
-
-                return max(directed_hausdorff(path1, path2), directed_hausdorff(path2, path1))
-
-            distance = hausdorff_distance(gcode_tool_path, user_defined_tool_path)
-
             # Define a tolerance for the Hausdorff distance
             tolerance = 1 
 
+            # Calculate the Hausdorff distance between the two paths (stops early once above the tolerance)
+            if comparison == 'segments':
+                gcode_primitives = toolpath_primitives(gcode_string)
+                gcode_tool_path = gcode_primitives.vertices()
+                distance = path_hausdorff_distance(gcode_primitives, polyline_primitives(user_defined_tool_path), tolerance=tolerance)
+            else:
+                x_points, y_points = parse_gcode(gcode_string)
+                # Remove consecutive duplicates from the sampled path
+                gcode_tool_path = [k for k, _ in itertools.groupby(zip(x_points, y_points))]
+                distance = hausdorff_distance(gcode_tool_path, user_defined_tool_path, tolerance=tolerance)
+
             if distance <= tolerance:
-                print(f"INFO: Tool paths match within tolerance. Hausdorff distance: {distance:.4f}")
+                logger.info("Tool paths match within tolerance. Hausdorff distance: %.4f", distance)
                 return True, None
             else:
-                print(f"INFO: Tool paths do not match. Hausdorff distance: {distance:.4f}")
+                logger.info("Tool paths do not match. Hausdorff distance: %.4f", distance)
                 error_msg = f"The tool path extracted from the generated G-code ({gcode_tool_path}) does not reflect the specification defined by the user {user_defined_tool_path}."
                 return False, error_msg
         
         except:
-            print("Unsupported machine operation")
+            logger.warning("Unsupported machine operation", exc_info=True)
             return True, None
 
     return True, None
@@ -377,78 +374,176 @@ def validate_functional_correctness(gcode_string, parameters_string):
 
 def check_tool_offsets(gcode_string):
     """Validate that tool offsets are being used correctly and reset appropriately to avoid unintended tool paths."""
-    tool_offset_active = False
-    lines = gcode_string.strip().split('\n')
-    for line_text in lines:
-        line = pygcode.Line(line_text)
-        if 'G43' in line_text:  # Tool length offset compensation activate
-            tool_offset_active = True
-        elif 'G49' in line_text:  # Tool length offset compensation cancel
-            tool_offset_active = False
-        elif tool_offset_active and 'Z' in line.block.gcodes[0].params:
-            error_msg = f"Z movement with active tool offset in line: {line_text}"
-            print(error_msg)
-            return False, error_msg
+    program = as_program(gcode_string)
+    offset_on, offset_off = program.has_flag(FLAG_G43), program.has_flag(FLAG_G49)
+    tool_offset_active = forward_fill(offset_on, offset_on | offset_off, False)
+    z_with_offset = np.flatnonzero(tool_offset_active & ~offset_on & ~offset_off & program.has('Z'))
+    if len(z_with_offset):
+        error_msg = f"Z movement with active tool offset in line: {program.lines[z_with_offset[0]]}"
+        logger.info(error_msg)
+        return False, error_msg
     return True, None
 
 def validate_drilling_gcode(gcode_string, safe_height=0):
     """
     Validate that the G-code only drills at specified depths and does not mill between the holes.
 
-    :param gcode_string: The G-code string to be validated.
+    :param gcode_string: The G-code string (or parsed GCodeProgram) to be validated.
     :param safe_height: Safe height above the workpiece for rapid movements.
     :return: (bool, str) True and None if the G-code is valid, otherwise False and an error message.
     """
-    current_position = {'X': 0, 'Y': 0, 'Z': safe_height}
-    lines = gcode_string.strip().split('\n')
-    for line in lines:
-        gcode_line = pygcode.Line(line)
-        for block in gcode_line.block.gcodes:
-            if isinstance(block, pygcode.gcodes.GCode):
-                coords = parse_coordinates(line)
-                if block.word in ('G0', 'G00', 'G1', 'G01'):  # Rapid or linear move
-                    if 'Z' in coords and coords['Z'] is not None:
-                        current_position['Z'] = coords['Z']
-
-                    if ( (coords.get('X') is not None or coords.get('Y') is not None) and
-                            current_position['Z'] < safe_height):
-                        error_msg = (f"Invalid horizontal movement detected with G1 command at Z={current_position['Z']} "
-                                     f"(below safe height) at position X={current_position['X']}, Y={current_position['Y']}. "
-                                     f"Ensure that all horizontal movements occur at or above the safe height (Z >= {safe_height}).")
-                        return False, error_msg
-
-                    if 'X' in coords and coords['X'] is not None:
-                        current_position['X'] = coords['X']
-                    if 'Y' in coords and coords['Y'] is not None:
-                        current_position['Y'] = coords['Y']
+    program = as_program(gcode_string)
+    is_move = (program.motion == 0) | (program.motion == 1)  # Rapid or linear move
+    current_z = forward_fill(program.Z, is_move & program.has('Z'), safe_height)
+    horizontal = np.flatnonzero(is_move & (program.has('X') | program.has('Y')) & (current_z < safe_height))
+    if len(horizontal):
+        row = horizontal[0]
+        previous_moves = is_move[:row]
+        current_x = forward_fill(program.X[:row], previous_moves & program.has('X')[:row], 0)
+        current_y = forward_fill(program.Y[:row], previous_moves & program.has('Y')[:row], 0)
+        current_position = {'X': current_x[-1] if row else 0,
+                            'Y': current_y[-1] if row else 0,
+                            'Z': current_z[row]}
+        error_msg = (f"Invalid horizontal movement detected with G1 command at Z={current_position['Z']} "
+                     f"(below safe height) at position X={current_position['X']}, Y={current_position['Y']}. "
+                     f"Ensure that all horizontal movements occur at or above the safe height (Z >= {safe_height}).")
+        return False, error_msg
 
     return True, None
 
-def validate_gcode(gcode_string):
-
-    is_syntax,_ = validate_syntax(gcode_string)
+def validate_keep_out_zones(gcode_string, keep_out_zones=(), tool_radius=TOOL_RADIUS):
+    """
+    Ensure that no move brings the tool into the keep-out zone of a fixture or clamp.
 
-    is_unreachable_code,_ = validate_unreachable_code(gcode_string)
+    :param keep_out_zones: KeepOutZone values (or tuples x_min, y_min, x_max, y_max, z_top).
+    :param tool_radius: Radius of the cutting tool in mm.
+    """
+    program = as_program(gcode_string)
+    segments, zones = keep_out_collisions(program, keep_out_zones, tool_radius)
+    if len(segments):
+        zone = KeepOutZone(*keep_out_zones[zones[0]])
+        row = np.searchsorted(program.line, interpret_program(program).segments['row'][segments[0]])
+        error_msg = f"Tool enters the keep-out zone {zone.name or tuple(zone[:5])} at {program.lines[row]}"
+        logger.info(error_msg)
+        return False, error_msg
+    return True, None
 
-    is_safe,_ = validate_safety(gcode_string)
+def validate_rapids_over_cuts(gcode_string, tool_radius=TOOL_RADIUS):
+    """
+    Ensure that no rapid move runs below the floor of the machined regions it crosses.
 
-    is_continuous,_ = validate_continuity(gcode_string)
+    A horizontal rapid move crossing earlier cuts (found with the spatial index, see spatial_utils.crossed_cuts) below
+    the depth of every one of them moves through the material left under the machined regions.
 
-    is_valid_feed_rate,_ = validate_feed_rate(gcode_string, min_feed=1, max_feed=100)
+    :param tool_radius: Radius of the cutting tool in mm.
+    """
+    program = as_program(gcode_string)
+    segments = interpret_program(program).segments
+    rapid, _, depth = crossed_cuts(program, tool_radius)
+    if not len(rapid):
+        return True, None
+    order = np.argsort(rapid, kind='stable')
+    rapids, first = np.unique(rapid[order], return_index=True)
+    # the deepest floor of the cuts crossed by every rapid
+    floor = np.minimum.reduceat(depth[order], first)
+    z_start, z_end = segments['start'][rapids, 2], segments['end'][rapids, 2]
+    below = np.flatnonzero((z_start == z_end) & (z_end < floor - 1e-9))
+    if len(below):
+        row = np.searchsorted(program.line, segments['row'][rapids[below[0]]])
+        error_msg = f"Rapid movement below the machined depth at {program.lines[row]}"
+        logger.info(error_msg)
+        return False, error_msg
+    return True, None
 
-    is_valid_tool_change,_ = validate_tool_changes(gcode_string)
+### State carried between the chunks of a streamed program (see validation_utils.run_validation_stream)
+
+def carry_unreachable_code(program):
+    return ['M30'] if program.has_flag(FLAG_M30).any() else []
+
+def carry_continuity(program):
+    rows = np.flatnonzero((program.motion != NO_MOTION) & program.has('X') & program.has('Y'))
+    return [f"G1 {format_word('X', program.X[rows[-1]])} {format_word('Y', program.Y[rows[-1]])}"] if len(rows) else []
+
+def carry_tool_changes(program):
+    tools, speeds = np.flatnonzero(program.has('T')), np.flatnonzero(program.has('S'))
+    moving = np.flatnonzero(program.motion != NO_MOTION)
+    # the tool still waiting for its spindle speed, and the motion mode telling the following cuts apart
+    lines = [format_word('T', program.T[tools[-1]])] if len(tools) and not (len(speeds) and speeds[-1] >= tools[-1]) else []
+    return lines + ([f"G{program.motion[moving[-1]]}"] if len(moving) else [])
+
+def carry_tool_offsets(program):
+    offset_on, offset_off = program.has_flag(FLAG_G43), program.has_flag(FLAG_G49)
+    changes = np.flatnonzero(offset_on | offset_off)
+    return ['G43'] if len(changes) and offset_on[changes[-1]] else []
+
+def carry_drilling(program):
+    is_move = (program.motion == 0) | (program.motion == 1)
+    lines = []
+    xy_words = []
+    for letter in 'XY':
+        rows = np.flatnonzero(is_move & program.has(letter))
+        xy_words += [format_word(letter, getattr(program, letter)[rows[-1]])] if len(rows) else []
+    # the position is restored before the depth, so that the carried lines never move below the safe height
+    lines += [' '.join(['G0'] + xy_words)] if xy_words else []
+    z_rows = np.flatnonzero(is_move & program.has('Z'))
+    lines += [f"G0 {format_word('Z', program.Z[z_rows[-1]])}"] if len(z_rows) else []
+    return lines
+
+### Validation rules (cheapest first)
+register_rule('syntax', validate_syntax, cost=1, label='Syntax')
+register_rule('unreachable_code', validate_unreachable_code, cost=2, carry=carry_unreachable_code)
+register_rule('feed_rate', validate_feed_rate, cost=2, params=('min_feed', 'max_feed'))
+register_rule('spindle_speed', validate_spindle_speed, cost=2, params=('max_spindle_speed',))
+register_rule('z_levels', validate_z_levels, cost=2, params=('max_depth',))
+register_rule('tool_changes', validate_tool_changes, cost=3, carry=carry_tool_changes)
+register_rule('tool_offsets', check_tool_offsets, cost=3, carry=carry_tool_offsets)
+register_rule('continuity', validate_continuity, cost=3, carry=carry_continuity)
+register_rule('safety', validate_safety, cost=4, params=('workpiece_dimensions', 'tool_radius'), stateful=True)
+register_rule('keep_out_zones', validate_keep_out_zones, cost=4, params=('keep_out_zones', 'tool_radius'),
+              when=lambda context: bool(context.get('keep_out_zones')), streamable=False)
+register_rule('rapids_over_cuts', validate_rapids_over_cuts, cost=4, params=('tool_radius',), streamable=False)
+register_rule('drilling', validate_drilling_gcode, cost=4, carry=carry_drilling,
+              when=lambda context: 'drilling' in context.get('operation_type', ''))
+register_rule('functional_correctness', validate_functional_correctness, cost=100, label='SEMANTIC CORRECTNESS',
+              when=lambda context: 'milling' in context.get('operation_type', ''), params=('parameters_string',),
+              streamable=False)
+
+GCODE_RULES = ('syntax', 'unreachable_code', 'safety', 'continuity', 'feed_rate', 'tool_changes', 'spindle_speed', 'tool_offsets')
+
+def machine_context(machine=DEFAULT_MACHINE):
+    """Limits of the checks of validate_gcode for a machine: the feed of its X/Y axes and its spindle speed."""
+    return {'min_feed': 1, 'max_feed': max(machine.max_velocity[:2]), 'max_spindle_speed': machine.max_spindle_speed}
+
+# Limits used by the checks of validate_gcode
+GCODE_CONTEXT = machine_context()
 
-    is_valid_spindle_speed,_ = validate_spindle_speed(gcode_string, max_spindle_speed=900)
+def validate_gcode(gcode_string):
 
     #is_return_home = check_return_to_home(gcode_string)
-    
-    is_tool_offset,_ = check_tool_offsets(gcode_string)
 
-    return True if  is_syntax and \
-                    is_unreachable_code and \
-                    is_safe and is_continuous and \
-                    is_valid_feed_rate and \
-                    is_valid_tool_change and \
-                    is_tool_offset and \
-                    is_valid_spindle_speed else False
+    report = cached_validation(gcode_string, GCODE_RULES, context=GCODE_CONTEXT)
+
+    return report['passed']
+
+def validate_rewrite(original, rewritten):
+    """
+    Run the checks of validate_gcode on a rewritten program (e.g. reordered or compacted) and on its original.
 
+    :return: (passed, error): False and the error of the first check that the rewritten program fails while the
+        original one passes
+    """
+    original_report = cached_validation(original, GCODE_RULES, context=GCODE_CONTEXT, stop_on_fatal=False)
+    failing = {result['name'] for result in original_report['results'] if not result['passed']}
+    report = cached_validation(rewritten, GCODE_RULES, context=GCODE_CONTEXT, stop_on_fatal=False)
+    for result in report['results']:
+        if not result['passed'] and result['name'] not in failing:
+            return False, result['error']
+    return True, None
+
+def validate_gcode_file(gcode_file, chunk_size=CHUNK_LINES):
+    """
+    Run the checks of validate_gcode on a program read line by line from an open file, any iterator of lines,
+    or a pathlib.Path to a G-code file (read through a memory map).
+    """
+    report = run_validation_stream(gcode_file, GCODE_RULES, context=GCODE_CONTEXT, chunk_size=chunk_size)
+    return report['passed']
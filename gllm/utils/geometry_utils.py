@@ -0,0 +1,400 @@
+"""
+Description of this file:
+
+This file contains geometry utility functions for comparing the tool path extracted from a generated G-code
+with the tool path specified by the user, e.g. the Hausdorff distance used in validate_functional_correctness.
+
+Two comparison modes are provided: a point-set Hausdorff distance over sampled paths (KD-tree of scipy.spatial), and an
+exact mode that treats both paths as line segments and circular arcs and computes the distances analytically, using a
+uniform grid index over the primitives and a Lipschitz branch-and-bound over the parameter of every primitive.
+
+Authors: Mohamed Abdelaal, Samuel Lokadjaja
+
+This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
+"""
+
+import math
+import numpy as np
+from scipy.spatial import cKDTree
+from gllm.utils.toolpath_utils import interpret_program, segment_chords, RAPID, LINEAR, CW_ARC
+
+# Number of query points handled per KD-tree query when an early exit is possible
+QUERY_CHUNK_SIZE = 4096
+
+# Primitive kinds
+LINE = 0
+ARC = 1
+
+# Absolute accuracy of the exact (segment/arc) Hausdorff distance
+HAUSDORFF_ACCURACY = 1e-6
+
+
+def as_points(path):
+    """Convert a list of (x, y) tuples into an (N, 2) float array."""
+    points = np.asarray(path, dtype=float).reshape(-1, 2)
+    if not len(points):
+        raise ValueError("Cannot compare an empty tool path")
+    return points
+
+
+def directed_hausdorff_distance(path_a, path_b, tolerance=None):
+    """
+    Directed Hausdorff distance max_a min_b |a - b| between two point sets.
+
+    :param path_a: Points (N, 2) whose distance to path_b is measured.
+    :param path_b: Points (M, 2) indexed in a KD-tree.
+    :param tolerance: If given, stop as soon as a distance above the tolerance is found.
+                      The returned value is then a lower bound of the true distance (but still > tolerance).
+    :return: The (possibly early-exited) directed Hausdorff distance.
+    """
+    points_a, points_b = as_points(path_a), as_points(path_b)
+    tree = cKDTree(points_b)
+
+    if tolerance is None:
+        return float(tree.query(points_a)[0].max())
+
+    # Neighbours beyond the tolerance are not searched for (reported as inf), which prunes the KD-tree search
+    distance = 0.0
+    for start in range(0, len(points_a), QUERY_CHUNK_SIZE):
+        distances = tree.query(points_a[start:start + QUERY_CHUNK_SIZE], distance_upper_bound=tolerance)[0]
+        if np.isinf(distances).any():
+            return float(tree.query(points_a[start + np.argmax(distances)])[0])
+        distance = max(distance, float(distances.max()))
+    return distance
+
+
+def hausdorff_distance(path1, path2, tolerance=None):
+    """
+    Symmetric Hausdorff distance between two point sets.
+
+    With a tolerance, the computation stops as soon as either direction exceeds it.
+    """
+    distance = directed_hausdorff_distance(path1, path2, tolerance)
+    if tolerance is not None and distance > tolerance:
+        return distance
+    return max(distance, directed_hausdorff_distance(path2, path1, tolerance))
+
+
+class PathPrimitives:
+    """
+    A 2D path stored as arrays of line segments and circular arcs.
+
+    Attributes:
+        kind : LINE or ARC per primitive
+        start, end : (N, 2) start and end points
+        center : (N, 2) arc centers (unused for lines)
+        radius : Arc radii (0 for lines)
+        start_angle : Angle of the start point seen from the center
+        sweep : Signed swept angle, positive counterclockwise (0 for lines)
+    """
+
+    def __init__(self, kind, start, end, center, radius, start_angle, sweep):
+        self.kind = np.asarray(kind, dtype=np.int8)
+        self.start = np.asarray(start, dtype=float).reshape(-1, 2)
+        self.end = np.asarray(end, dtype=float).reshape(-1, 2)
+        self.center = np.asarray(center, dtype=float).reshape(-1, 2)
+        self.radius = np.asarray(radius, dtype=float)
+        self.start_angle = np.asarray(start_angle, dtype=float)
+        self.sweep = np.asarray(sweep, dtype=float)
+        if not len(self.kind):
+            raise ValueError("Cannot compare an empty tool path")
+
+    def __len__(self):
+        return len(self.kind)
+
+    def lengths(self):
+        is_arc = self.kind == ARC
+        return np.where(is_arc, self.radius * np.abs(self.sweep), np.linalg.norm(self.end - self.start, axis=1))
+
+    def points_at(self, index, t):
+        """Points at parameter t in [0, 1] along the primitives `index`."""
+        t = np.asarray(t, dtype=float)
+        linear = self.start[index] + (self.end[index] - self.start[index]) * t[:, None]
+        angle = self.start_angle[index] + self.sweep[index] * t
+        circular = self.center[index] + self.radius[index][:, None] * np.column_stack([np.cos(angle), np.sin(angle)])
+        return np.where((self.kind[index] == ARC)[:, None], circular, linear)
+
+    def vertices(self):
+        """Start point of every primitive followed by the end of the last one, without consecutive duplicates."""
+        points = np.vstack([self.start, self.end[-1:]])
+        keep = np.concatenate([[True], np.any(points[1:] != points[:-1], axis=1)])
+        return [(float(x), float(y)) for x, y in points[keep]]
+
+    def bounds(self):
+        """Axis-aligned (min, max) corners per primitive (full circle box for arcs)."""
+        is_arc = (self.kind == ARC)[:, None]
+        reach = self.radius[:, None]
+        lower = np.where(is_arc, self.center - reach, np.minimum(self.start, self.end))
+        upper = np.where(is_arc, self.center + reach, np.maximum(self.start, self.end))
+        return lower, upper
+
+
+def polyline_primitives(points):
+    """Line segments joining consecutive points of a polyline (a single point gives a zero-length segment)."""
+    points = as_points(points)
+    if len(points) == 1:
+        points = np.vstack([points, points])
+    n = len(points) - 1
+    return PathPrimitives(np.full(n, LINE), points[:-1], points[1:], np.zeros((n, 2)), np.zeros(n), np.zeros(n), np.zeros(n))
+
+
+def toolpath_primitives(gcode):
+    """
+    Line segments and arcs of the XY projection of the interpreted tool path of a G-code program.
+
+    Arcs outside the XY plane are projected as chords within CHORD_TOLERANCE of the arc.
+
+    :param gcode: The G-code string or a parsed GCodeProgram.
+    :return: PathPrimitives
+    """
+    segments = interpret_program(gcode).segments
+    if len(segments) and segments['motion'][0] in (RAPID, LINEAR):
+        # the first positioning move only defines where the path begins
+        segments = segments.copy()
+        segments['start'][0] = segments['end'][0]
+
+    is_xy_arc = (segments['motion'] >= CW_ARC) & (segments['plane'] == 17)
+    is_projected_arc = (segments['motion'] >= CW_ARC) & ~is_xy_arc
+    index, starts, ends = segment_chords(segments, split=is_projected_arc)
+
+    arcs = is_xy_arc[index]
+    selected = segments[index]
+    return PathPrimitives(np.where(arcs, ARC, LINE), starts[:, :2], ends[:, :2],
+                          np.where(arcs[:, None], selected['center'][:, :2], 0.0),
+                          np.where(arcs, selected['radius'], 0.0),
+                          np.where(arcs, selected['start_angle'], 0.0),
+                          np.where(arcs, selected['sweep'], 0.0))
+
+
+def primitive_distances(points, primitives, index):
+    """
+    Exact distances between points and primitives.
+
+    Shapes broadcast: points (K, 1, 2) with index (M,) gives a (K, M) matrix, points (K, 2) with index (K,) gives
+    the (K,) distances of the pairs.
+    """
+    start, end = primitives.start[index], primitives.end[index]
+    delta = end - start
+    offset = points - start
+
+    # point to segment
+    squared_length = np.sum(delta * delta, axis=-1)
+    t = np.clip(np.sum(offset * delta, axis=-1) / np.where(squared_length > 0, squared_length, 1.0), 0.0, 1.0)
+    to_segment = np.linalg.norm(offset - t[..., None] * delta, axis=-1)
+
+    is_arc = primitives.kind[index] == ARC
+    if not is_arc.any():
+        return to_segment
+
+    # point to arc: radial distance inside the angular span, distance to the closer end point outside of it
+    from_center = points - primitives.center[index]
+    relative = relative_angle(np.arctan2(from_center[..., 1], from_center[..., 0]), primitives, index)
+    radial = np.abs(np.linalg.norm(from_center, axis=-1) - primitives.radius[index])
+    to_ends = np.minimum(np.linalg.norm(offset, axis=-1), np.linalg.norm(points - end, axis=-1))
+    to_arc = np.where(relative <= np.abs(primitives.sweep[index]), radial, to_ends)
+
+    return np.where(is_arc, to_arc, to_segment)
+
+
+def relative_angle(angle, primitives, index):
+    """Angle measured from the start of the arcs `index` in their direction of travel, in [0, 2 pi)."""
+    sweep, start_angle = primitives.sweep[index], primitives.start_angle[index]
+    return np.where(sweep >= 0, angle - start_angle, start_angle - angle) % (2 * np.pi)
+
+
+class PrimitiveGrid:
+    """
+    Uniform grid index over the bounding boxes of path primitives, answering exact nearest-primitive queries.
+    """
+
+    def __init__(self, primitives, cell_size=None):
+        self.primitives = primitives
+        lower, upper = primitives.bounds()
+        self.origin = lower.min(axis=0)
+        if cell_size is None:
+            extent = float(np.max(upper.max(axis=0) - self.origin))
+            cell_size = max(extent / max(math.sqrt(len(primitives)), 1.0), float(np.median(primitives.lengths())), 1e-9)
+        self.cell_size = cell_size
+
+        cells = {}
+        for index, ((i0, j0), (i1, j1)) in enumerate(zip(self.cell_of(lower), self.cell_of(upper))):
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    cells.setdefault((i, j), []).append(index)
+        self.cells = {cell: np.asarray(indices) for cell, indices in cells.items()}
+
+    def cell_of(self, points):
+        return np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+
+    def nearest(self, points):
+        """Exact distance from every point (K, 2) to the closest primitive, and the index of that primitive."""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        distances = np.full(len(points), np.inf)
+        nearest_index = np.zeros(len(points), dtype=np.int64)
+        if not len(points):
+            return distances, nearest_index
+
+        unique_cells, inverse = np.unique(self.cell_of(points), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        for group, (i, j) in enumerate(unique_cells):
+            # any primitive closer than one cell size overlaps the 3x3 neighbourhood
+            candidates = [self.cells[(ci, cj)] for ci in (i - 1, i, i + 1) for cj in (j - 1, j, j + 1) if (ci, cj) in self.cells]
+            if not candidates:
+                continue
+            members = np.flatnonzero(inverse == group)
+            candidates = np.unique(np.concatenate(candidates))
+            matrix = primitive_distances(points[members][:, None, :], self.primitives, candidates)
+            closest = matrix.argmin(axis=1)
+            found = matrix[np.arange(len(members)), closest] <= self.cell_size
+            distances[members[found]] = matrix[np.arange(len(members)), closest][found]
+            nearest_index[members[found]] = candidates[closest][found]
+
+        # points farther than one cell from every primitive are compared against all primitives
+        misses = np.flatnonzero(np.isinf(distances))
+        everything = np.arange(len(self.primitives))
+        for start in range(0, len(misses), 256):
+            chunk = misses[start:start + 256]
+            matrix = primitive_distances(points[chunk][:, None, :], self.primitives, everything)
+            nearest_index[chunk] = matrix.argmin(axis=1)
+            distances[chunk] = matrix.min(axis=1)
+        return distances, nearest_index
+
+
+class PathPieces:
+    """Sub-intervals [t0, t1] of the primitives of a path, with the distance to the other path at both ends."""
+
+    def __init__(self, path, index, t0, t1, f0, f1, n0, n1):
+        self.path, self.index, self.t0, self.t1 = path, index, t0, t1
+        self.f0, self.f1, self.n0, self.n1 = f0, f1, n0, n1
+
+    def select(self, mask):
+        return PathPieces(self.path, self.index[mask], self.t0[mask], self.t1[mask],
+                          self.f0[mask], self.f1[mask], self.n0[mask], self.n1[mask])
+
+    def upper_bound(self, other):
+        """Upper bound of the distance to the path `other` over every piece."""
+        path, index = self.path, self.index
+        span = self.t1 - self.t0
+        length = path.lengths()[index] * span
+        p0, p1 = path.points_at(index, self.t0), path.points_at(index, self.t1)
+        is_arc = path.kind[index] == ARC
+        piece_sweep = path.sweep[index] * span
+        sagitta = np.where(is_arc, path.radius[index] * (1 - np.cos(np.minimum(np.abs(piece_sweep), np.pi) / 2)), 0.0)
+        sagitta = np.where(np.abs(piece_sweep) > np.pi, path.radius[index] * 2, sagitta)
+
+        # the distance to the whole path is 1-Lipschitz along the piece
+        bound = (self.f0 + self.f1 + length) / 2
+
+        for nearest in (self.n0, self.n1):
+            d0 = primitive_distances(p0, other, nearest)
+            d1 = primitive_distances(p1, other, nearest)
+            # distance to a segment is convex along the chord of the piece, which is at most a sagitta away
+            to_segment = np.maximum(d0, d1) + sagitta
+            to_arc = radial_bound(path, index, self.t0, self.t1, p0, p1, other, nearest)
+            bound = np.minimum(bound, np.where(other.kind[nearest] == ARC, to_arc, to_segment))
+        return bound
+
+
+def radial_bound(path, index, t0, t1, p0, p1, other, nearest):
+    """
+    Upper bound of the distance to the arcs `nearest` of `other` over path pieces lying within their angular span
+    (inf for the other pieces): there, the distance is |R - r| with R the distance to the arc center.
+    """
+    center, radius = other.center[nearest], other.radius[nearest]
+    from_center0, from_center1 = p0 - center, p1 - center
+    angle0 = np.arctan2(from_center0[:, 1], from_center0[:, 0])
+    angle1 = np.arctan2(from_center1[:, 1], from_center1[:, 0])
+    is_arc = path.kind[index] == ARC
+    piece_sweep = path.sweep[index] * (t1 - t0)
+
+    # segment pieces: the angle seen from the center turns by less than pi, in the direction of the cross product
+    cross = from_center0[:, 0] * from_center1[:, 1] - from_center0[:, 1] * from_center1[:, 0]
+    segment_direction = np.sign(cross)
+    chord = p1 - p0
+    squared_length = np.sum(chord * chord, axis=1)
+    t = np.clip(np.sum(-from_center0 * chord, axis=1) / np.where(squared_length > 0, squared_length, 1.0), 0.0, 1.0)
+    segment_min = np.linalg.norm(from_center0 + t[:, None] * chord, axis=1)
+    segment_max = np.maximum(np.linalg.norm(from_center0, axis=1), np.linalg.norm(from_center1, axis=1))
+
+    # arc pieces: the angle turns monotonically only if the center lies inside the circle of the piece
+    piece_center, piece_radius = path.center[index], path.radius[index]
+    towards = center - piece_center
+    offset = np.linalg.norm(towards, axis=1)
+    inside = offset < piece_radius * (1 - 1e-9)
+    piece_start = path.start_angle[index] + path.sweep[index] * t0
+    phase = np.arctan2(towards[:, 1], towards[:, 0])
+    # R^2 = r^2 + |w|^2 - 2 r |w| cos(theta - phase); extremes at the end points or at theta = phase (+ pi)
+    cos_ends = np.stack([np.cos(piece_start - phase), np.cos(piece_start + piece_sweep - phase)])
+    reaches = lambda angle: ((np.where(piece_sweep >= 0, angle - piece_start, piece_start - angle) % (2 * np.pi))
+                             <= np.abs(piece_sweep))
+    cos_max = np.where(reaches(phase), 1.0, cos_ends.max(axis=0))
+    cos_min = np.where(reaches(phase + np.pi), -1.0, cos_ends.min(axis=0))
+    squared = piece_radius ** 2 + offset ** 2
+    arc_min = np.sqrt(np.maximum(squared - 2 * piece_radius * offset * cos_max, 0.0))
+    arc_max = np.sqrt(np.maximum(squared - 2 * piece_radius * offset * cos_min, 0.0))
+
+    direction = np.where(is_arc, np.sign(piece_sweep), segment_direction)
+    turn = np.where(is_arc, (angle1 - angle0) * direction % (2 * np.pi), (angle1 - angle0) * segment_direction % (2 * np.pi))
+    turn = np.where(is_arc & (np.abs(piece_sweep) >= 2 * np.pi), 2 * np.pi, turn)
+    turn = np.where(~is_arc & (cross == 0), 0.0, turn)
+    monotonic = np.where(is_arc, inside, segment_min > 0)
+
+    # angular interval of the piece in the coordinates of the arc it is compared with
+    relative0 = relative_angle(angle0, other, nearest)
+    same_direction = direction * np.where(other.sweep[nearest] >= 0, 1, -1) >= 0
+    span = np.abs(other.sweep[nearest])
+    within = np.where(same_direction, relative0 + turn <= span, relative0 - turn >= 0) & (relative0 <= span)
+    within |= span >= 2 * np.pi
+
+    distance_min = np.where(is_arc, arc_min, segment_min)
+    distance_max = np.where(is_arc, arc_max, segment_max)
+    bound = np.maximum(distance_max - radius, radius - distance_min)
+    return np.where(monotonic & within, bound, np.inf)
+
+
+def directed_path_hausdorff_distance(path_a, path_b, tolerance=None, accuracy=HAUSDORFF_ACCURACY):
+    """
+    Directed Hausdorff distance from the continuous path_a to the continuous path_b (both PathPrimitives).
+
+    The distance to path_b is evaluated exactly at the ends of pieces of path_a, and every piece gets an upper bound
+    of the distance over its interior (Lipschitz, convexity along segments, radial distance to arcs). Pieces whose
+    bound may still exceed the best value found are bisected until the result is exact up to `accuracy`.
+    With a tolerance, the search stops as soon as a distance above it is found, or as soon as no piece can exceed it.
+    """
+    grid = PrimitiveGrid(path_b)
+    index = np.arange(len(path_a))
+    zeros, ones = np.zeros(len(path_a)), np.ones(len(path_a))
+    f0, n0 = grid.nearest(path_a.points_at(index, zeros))
+    f1, n1 = grid.nearest(path_a.points_at(index, ones))
+    pieces = PathPieces(path_a, index, zeros, ones, f0, f1, n0, n1)
+    best = float(max(f0.max(), f1.max()))
+
+    while len(pieces.index):
+        if tolerance is not None and best > tolerance:
+            return best
+        threshold = best + accuracy if tolerance is None else max(best, tolerance) + accuracy
+        pieces = pieces.select(pieces.upper_bound(path_b) > threshold)
+
+        # bisect the remaining pieces
+        middle = (pieces.t0 + pieces.t1) / 2
+        f_middle, n_middle = grid.nearest(path_a.points_at(pieces.index, middle))
+        if len(f_middle):
+            best = max(best, float(f_middle.max()))
+        pieces = PathPieces(path_a, np.concatenate([pieces.index, pieces.index]),
+                            np.concatenate([pieces.t0, middle]), np.concatenate([middle, pieces.t1]),
+                            np.concatenate([pieces.f0, f_middle]), np.concatenate([f_middle, pieces.f1]),
+                            np.concatenate([pieces.n0, n_middle]), np.concatenate([n_middle, pieces.n1]))
+
+    return best
+
+
+def path_hausdorff_distance(path1, path2, tolerance=None, accuracy=HAUSDORFF_ACCURACY):
+    """
+    Symmetric Hausdorff distance between two paths made of line segments and arcs.
+
+    With a tolerance, the computation stops as soon as the distance is known to be above or below it.
+    """
+    distance = directed_path_hausdorff_distance(path1, path2, tolerance, accuracy)
+    if tolerance is not None and distance > tolerance:
+        return distance
+    return max(distance, directed_path_hausdorff_distance(path2, path1, tolerance, accuracy))
@@ -12,19 +12,28 @@ Authors: Mohamed Abdelaal, Samuel Lokadjaja
 This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
 """
 
+import logging
 from typing import Annotated
 from typing import TypedDict
 from langgraph.graph.message import AnyMessage, add_messages
 from langgraph.checkpoint.sqlite import SqliteSaver
 from langgraph.graph import END, StateGraph
 
-from gllm.utils.gcode_utils import generate_gcode_with_langchain, validate_syntax, validate_continuity, \
-                              clean_gcode, validate_unreachable_code, validate_safety, validate_drilling_gcode, \
-                              validate_functional_correctness
+from gllm.utils.gcode_utils import generate_gcode_with_langchain, clean_gcode
+from gllm.utils.params_extraction_utils import parse_extracted_parameters
+from gllm.utils.validation_utils import IncrementalValidator, cached_validation, VALIDATION_CACHE, format_timings
+from gllm.utils.trace_utils import span
+
+logger = logging.getLogger(__name__)
 
 ### Parameters
 max_iterations = 50
 
+# Checks run on every generated solution (continuity and return-to-home are currently disabled;
+# keep-out zones are checked when the caller gives some)
+CODE_CHECK_RULES = ('syntax', 'functional_correctness', 'unreachable_code', 'safety', 'rapids_over_cuts', 'drilling',
+                    'keep_out_zones')
+
 class GraphState(TypedDict):
     """
     Represents the state of our graph.
@@ -53,7 +62,7 @@ def generate(state: GraphState, chain, user_inputs):
         state (dict): New key added to state, generation
     """
 
-    print("---GENERATING G-CODE SOLUTION---")
+    logger.info("---GENERATING G-CODE SOLUTION---")
 
     # State
     messages = state["messages"]
@@ -72,29 +81,59 @@ def generate(state: GraphState, chain, user_inputs):
     iterations = iterations + 1
     return {"generation": gcode_response, "messages": messages, "iterations": iterations}
 
-def code_check(state: GraphState, chain, user_inputs, parameters_string):
+def check_context(user_inputs, parameters_string, keep_out_zones=()):
+    """
+    Context of the code checks (rule parameters and predicates) for the given user inputs.
+
+    :param keep_out_zones: spatial_utils.KeepOutZone values of the fixtures and clamps, checked if any.
+    """
+    parsed_parameters = parse_extracted_parameters(parameters_string)
+    return {
+        'parameters_string': parameters_string,
+        'operation_type': user_inputs.get('Operation Type', ''),
+        'workpiece_dimensions': parsed_parameters['workpiece_diemensions'] if parsed_parameters else None,
+        'keep_out_zones': tuple(keep_out_zones),
+    }
+
+def code_check(state: GraphState, chain, user_inputs, parameters_string, validator=None, keep_out_zones=()):
     """
     Check code
 
     Args:
         state (dict): The current graph state
+        validator (IncrementalValidator): Validator kept across the iterations of the graph, so that every retry
+            only re-checks the lines after its first change
+        keep_out_zones (list): Keep-out zones the tool must not enter, used when no validator is given
 
     Returns:
         state (dict): New key added to state, error
     """
 
-    print("---CHECKING GENERATED G-CODE---")
+    logger.info("---CHECKING GENERATED G-CODE---")
 
     # State
     messages = state["messages"]
     code_solution = clean_gcode(state["generation"])
     iterations = state["iterations"]
 
-    # Validate syntax
-    is_valid_syntax, syntax_error_msg = validate_syntax(str(code_solution))
-    if not is_valid_syntax:
-        print("---Syntax CHECK: FAILED---")
-        error_message = [("user", f"Your solution failed the Syntax test. Here is the error: {syntax_error_msg}. Reflect on this error and your prior attempt to solve the problem. (1) State what you think went wrong with the prior solution and (2) try to solve this problem again. Return the FULL SOLUTION.")]
+    # Run all checks, cheapest first, reusing what the previous iterations checked before the first changed line
+    # (or the whole report if this program was already checked)
+    if validator is None:
+        validator = IncrementalValidator(CODE_CHECK_RULES, check_context(user_inputs, parameters_string,
+                                                                         keep_out_zones))
+    with span('code_check', iteration=iterations) as fields:
+        report = cached_validation(str(code_solution), CODE_CHECK_RULES, validator.context, run=validator.validate)
+        fields.update(lines=str(code_solution).count('\n') + 1, passed=report['passed'])
+    logger.info("---CHECK TIMINGS: %s---", format_timings(report))
+    logger.debug("---VALIDATION CACHE: %s---", VALIDATION_CACHE.stats())
+
+    if not report['passed']:
+        failed_rule, error_msg = report['failed_rule'], report['error']
+        logger.info("---%s CHECK: FAILED---", failed_rule.label)
+        if failed_rule.name == 'syntax':
+            error_message = [("user", f"Your solution failed the Syntax test. Here is the error: {error_msg}. Reflect on this error and your prior attempt to solve the problem. (1) State what you think went wrong with the prior solution and (2) try to solve this problem again. Return the FULL SOLUTION.")]
+        else:
+            error_message = [("user", f"Your solution failed the code execution test: {error_msg}) Reflect on this error and your prior attempt to solve the problem. (1) State what you think went wrong with the prior solution and (2) try to solve this problem again. Return the FULL SOLUTION.")]
         messages += error_message
         return {
             "generation": code_solution,
@@ -102,88 +141,9 @@ def code_check(state: GraphState, chain, user_inputs, parameters_string):
             "iterations": iterations,
             "error": "yes",
         }
-    
-    # Check functional (semantic correctness)
-    is_semantically_correct, semantic_error_msg = validate_functional_correctness(code_solution, parameters_string)
-    if not is_semantically_correct and 'milling' in user_inputs.get('Operation Type', ''):
-        print("---SEMANTIC CORRECTNESS CHECK: FAILED---")
-        error_message = [("user", f"Your solution failed the code execution test: {semantic_error_msg}) Reflect on this error and your prior attempt to solve the problem. (1) State what you think went wrong with the prior solution and (2) try to solve this problem again. Return the FULL SOLUTION.")]
-        messages += error_message
-        return {
-            "generation": code_solution,
-            "messages": messages,
-            "iterations": iterations,
-            "error": "yes",
-        }
-
-    # Check continuty
-    # is_continuous, continuity_error_msg = validate_continuity(code_solution)
-    # if not is_continuous and 'milling' in user_inputs.get('Operation Type', ''):
-    #     print("---CONTINUITY CHECK: FAILED---")
-    #     error_message = [("user", f"Your solution failed the code execution test: {continuity_error_msg}) Reflect on this error and your prior attempt to solve the problem. (1) State what you think went wrong with the prior solution and (2) try to solve this problem again. Return the FULL SOLUTION.")]
-    #     messages += error_message
-    #     return {
-    #         "generation": code_solution,
-    #         "messages": messages,
-    #         "iterations": iterations,
-    #         "error": "yes",
-    #     }
-
-    # Check unreachable code
-    is_unreachable_code, unreachable_error_msg = validate_unreachable_code(code_solution)
-    if not is_unreachable_code:
-        print("---UNREACHABLE CODE CHECK: FAILED---")
-        error_message = [("user", f"Your solution failed the code execution test: {unreachable_error_msg}) Reflect on this error and your prior attempt to solve the problem. (1) State what you think went wrong with the prior solution and (2) try to solve this problem again. Return the FULL SOLUTION.")]
-        messages += error_message
-        return {
-            "generation": code_solution,
-            "messages": messages,
-            "iterations": iterations,
-            "error": "yes",
-        }
-
-    # Check safety
-    is_safe_code, safety_error_msg = validate_safety(code_solution)
-    if not is_safe_code:
-        print("---SAFETY CHECK: FAILED---")
-        error_message = [("user", f"Your solution failed the code execution test: {safety_error_msg}) Reflect on this error and your prior attempt to solve the problem. (1) State what you think went wrong with the prior solution and (2) try to solve this problem again. Return the FULL SOLUTION.")]
-        messages += error_message
-        return {
-            "generation": code_solution,
-            "messages": messages,
-            "iterations": iterations,
-            "error": "yes",
-        }
-
-    # Check correct drilling
-    is_correct_drilling, drilling_error_msg = validate_drilling_gcode(code_solution)
-    if not is_correct_drilling and 'drilling' in user_inputs.get('Operation Type', ''):
-        print("---DRILLING CHECK: FAILED---")
-        error_message = [("user", f"Your solution failed the code execution test: {drilling_error_msg}) Reflect on this error and your prior attempt to solve the problem. (1) State what you think went wrong with the prior solution and (2) try to solve this problem again. Return the FULL SOLUTION.")]
-        messages += error_message
-        return {
-            "generation": code_solution,
-            "messages": messages,
-            "iterations": iterations,
-            "error": "yes",
-        }    
-    
-    
-    # Check return to home position
-    # is_return_to_home, return_error_msg = check_safe_return(code_solution)
-    # if not is_return_to_home:
-    #     print("---RETURN TO HOME CHECK: FAILED---")
-    #     error_message = [("user", f"Your solution failed the code execution test: {return_error_msg}) Reflect on this error and your prior attempt to solve the problem. (1) State what you think went wrong with the prior solution and (2) try to solve this problem again. Return the FULL SOLUTION.")]
-    #     messages += error_message
-    #     return {
-    #         "generation": code_solution,
-    #         "messages": messages,
-    #         "iterations": iterations,
-    #         "error": "yes",
-    #     }
 
     # No errors
-    print("---NO G-CODE TEST FAILURES---")
+    logger.info("---NO G-CODE TEST FAILURES---")
     return {
         "generation": code_solution,
         "messages": messages,
@@ -206,17 +166,17 @@ def decide_to_finish(state: GraphState):
     iterations = state["iterations"]
 
     if error == "no" or iterations == max_iterations:
-        print("---DECISION: FINISH---")
-        print("# ITERATIONS: ", iterations)
+        logger.info("---DECISION: FINISH---")
+        logger.info("# ITERATIONS: %s", iterations)
         return "end"
     else:
-        print("---DECISION: RE-TRY SOLUTION---")
+        logger.info("---DECISION: RE-TRY SOLUTION---")
         return "generate"
 
 def _print_event(event: dict, _printed: set, max_length=1500):
     current_state = event.get("dialog_state")
     if current_state:
-        print(f"Currently in: ", current_state[-1])
+        logger.info("Currently in: %s", current_state[-1])
     message = event.get("messages")
     if message:
         if isinstance(message, list):
@@ -225,15 +185,16 @@ def _print_event(event: dict, _printed: set, max_length=1500):
             msg_repr = message.pretty_repr(html=True)
             if len(msg_repr) > max_length:
                 msg_repr = msg_repr[:max_length] + " ... (truncated)"
-            print(msg_repr)
+            logger.info(msg_repr)
             _printed.add(message.id)
 
-def construct_graph(model, user_inputs, parameters_string):
+def construct_graph(model, user_inputs, parameters_string, keep_out_zones=()):
     builder = StateGraph(GraphState)
+    validator = IncrementalValidator(CODE_CHECK_RULES, check_context(user_inputs, parameters_string, keep_out_zones))
 
     # Define the nodes
     builder.add_node("generate", lambda state: generate(state, model, user_inputs))
-    builder.add_node("check_code", lambda state: code_check(state, model, user_inputs, parameters_string))
+    builder.add_node("check_code", lambda state: code_check(state, model, user_inputs, parameters_string, validator))
 
     # Build graph
     builder.set_entry_point("generate")
@@ -0,0 +1,280 @@
+"""
+Description of this file:
+
+This file contains the parser that turns a G-code program into a compact, columnar intermediate representation (IR).
+Every line of the program is tokenized exactly once into NumPy arrays (motion code, X/Y/Z/I/J/K/R/F/S/T words and a bitmask
+of modal flags), so that the validators in gcode_utils.py and the path extraction in plot_utils.py can share a single
+parse of the program instead of splitting and re-tokenizing the text on their own.
+
+The utilities are implemented in Python and use NumPy for the columnar storage.
+
+Authors: Mohamed Abdelaal, Samuel Lokadjaja
+
+This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
+"""
+
+import os
+import re
+import mmap
+import contextlib
+import numpy as np
+
+# Words stored as float columns of the IR (NaN when the word is absent on a line)
+AXIS_WORDS = ('X', 'Y', 'Z', 'I', 'J', 'K', 'R', 'F', 'S', 'T')
+
+# G-codes of the motion modal group (G38.x is stored as 38)
+MOTION_CODES = frozenset([0, 1, 2, 3, 33, 38, 73, 76, 80, 81, 82, 83, 84, 85, 86, 87, 88, 89])
+NO_MOTION = -1
+
+# Modal flags, one bit per G/M word of interest
+FLAG_G90 = 1 << 0    # absolute positioning
+FLAG_G91 = 1 << 1    # incremental positioning
+FLAG_G20 = 1 << 2    # inches
+FLAG_G21 = 1 << 3    # millimeters
+FLAG_G17 = 1 << 4    # XY plane
+FLAG_G18 = 1 << 5    # ZX plane
+FLAG_G19 = 1 << 6    # YZ plane
+FLAG_G28 = 1 << 7    # return to home
+FLAG_G43 = 1 << 8    # tool length offset on
+FLAG_G49 = 1 << 9    # tool length offset off
+FLAG_M0 = 1 << 10    # program stop
+FLAG_M2 = 1 << 11    # program end
+FLAG_M3 = 1 << 12    # spindle on clockwise
+FLAG_M4 = 1 << 13    # spindle on counterclockwise
+FLAG_M5 = 1 << 14    # spindle stop
+FLAG_M6 = 1 << 15    # tool change
+FLAG_M8 = 1 << 16    # coolant on
+FLAG_M9 = 1 << 17    # coolant off
+FLAG_M30 = 1 << 18   # program end and reset
+FLAG_EMPTY = 1 << 19  # no words on the line (blank or comment only)
+FLAG_ERROR = 1 << 20  # the line could not be tokenized
+FLAG_G98 = 1 << 21   # canned cycles retract to the initial level
+FLAG_G99 = 1 << 22   # canned cycles retract to the R level
+FLAG_G92 = 1 << 23   # coordinate system offset (axis words are not a move)
+FLAG_G4 = 1 << 24    # dwell
+
+G_FLAGS = {
+    90: FLAG_G90, 91: FLAG_G91, 20: FLAG_G20, 21: FLAG_G21,
+    17: FLAG_G17, 18: FLAG_G18, 19: FLAG_G19, 28: FLAG_G28,
+    43: FLAG_G43, 49: FLAG_G49, 98: FLAG_G98, 99: FLAG_G99,
+    92: FLAG_G92, 4: FLAG_G4,
+}
+M_FLAGS = {
+    0: FLAG_M0, 2: FLAG_M2, 3: FLAG_M3, 4: FLAG_M4, 5: FLAG_M5,
+    6: FLAG_M6, 8: FLAG_M8, 9: FLAG_M9, 30: FLAG_M30,
+}
+
+COMMENT_PATTERN = re.compile(r'\([^)]*\)|;.*$')
+WORD_PATTERN = re.compile(r'([A-Z])\s*([+-]?(?:\d+\.?\d*|\.\d+))')
+
+
+class GCodeProgram:
+    """
+    Columnar IR of a G-code program, one row per source line.
+
+    Attributes:
+        lines : Stripped source text of every line (used in error messages)
+        line : Index of the line in the source program
+        motion : Motion G-code programmed on the line, or NO_MOTION
+        X, Y, Z, I, J, K, R, F, S, T : Word values, NaN when the word is absent
+        flags : Bitmask of the modal G/M words found on the line (FLAG_*)
+        errors : Syntax error message per row index, for lines that failed to tokenize
+        derived : Results computed from the program (e.g. the interpreted tool path), cached for all consumers
+    """
+
+    __slots__ = ('lines', 'line', 'motion', 'flags', 'errors', 'derived') + AXIS_WORDS
+
+    def __init__(self, lines, line, motion, flags, words, errors):
+        self.lines = lines
+        self.line = line
+        self.motion = motion
+        self.flags = flags
+        self.errors = errors
+        self.derived = {}
+        for letter in AXIS_WORDS:
+            setattr(self, letter, words[letter])
+
+    def __len__(self):
+        return len(self.lines)
+
+    def has(self, letter):
+        """Boolean mask of the rows on which the given word is programmed."""
+        return ~np.isnan(getattr(self, letter))
+
+    def has_flag(self, flag):
+        """Boolean mask of the rows on which the given modal flag is set."""
+        return (self.flags & flag) != 0
+
+    def text(self):
+        return '\n'.join(self.lines)
+
+
+def tokenize_line(line_text):
+    """
+    Tokenize a single line into (motion, flags, words, error).
+
+    words maps the letters of AXIS_WORDS to their float value; error is None when the line is valid.
+    """
+    code = COMMENT_PATTERN.sub('', line_text).upper().strip()
+    if not code or code == '%':
+        return NO_MOTION, FLAG_EMPTY, {}, None
+
+    motion = NO_MOTION
+    flags = 0
+    words = {}
+    position = 0
+    for match in WORD_PATTERN.finditer(code):
+        if code[position:match.start()].strip():
+            return NO_MOTION, FLAG_ERROR, {}, f"word '{code[position:match.start()].strip()}' value invalid"
+        position = match.end()
+        letter, value = match.group(1), float(match.group(2))
+        if letter == 'G':
+            number = int(value)
+            if number in MOTION_CODES:
+                if motion != NO_MOTION:
+                    return NO_MOTION, FLAG_ERROR, {}, f"G{motion} and G{number} cannot be in the same block"
+                motion = number
+            flags |= G_FLAGS.get(number, 0) if value == number else 0
+        elif letter == 'M':
+            flags |= M_FLAGS.get(int(value), 0) if value.is_integer() else 0
+        elif letter in AXIS_WORDS:
+            if letter in words:
+                return NO_MOTION, FLAG_ERROR, {}, f"parameter defined twice: {letter}{words[letter]:g} -> {letter}{value:g}"
+            words[letter] = value
+    if code[position:].strip():
+        return NO_MOTION, FLAG_ERROR, {}, f"word '{code[position:].strip()}' value invalid"
+
+    return motion, flags, words, None
+
+
+def decode_line(line_text):
+    """Decode a line read from a binary file or memory map (lines that are already str are returned as they are)."""
+    return line_text.decode('utf-8', errors='replace') if isinstance(line_text, bytes) else line_text
+
+
+def parse_program(gcode, first_line=0):
+    """
+    Tokenize a G-code program into a GCodeProgram.
+
+    :param gcode: The G-code as a string or as an iterable of lines (str or bytes).
+    :param first_line: Source index of the first line (used when parsing a part of a larger program).
+    :return: GCodeProgram holding one row per line.
+    """
+    lines = gcode.splitlines() if isinstance(gcode, str) else [decode_line(line).rstrip('\r\n') for line in gcode]
+    n = len(lines)
+
+    motion = np.full(n, NO_MOTION, dtype=np.int16)
+    flags = np.zeros(n, dtype=np.uint32)
+    words = {letter: np.full(n, np.nan) for letter in AXIS_WORDS}
+    errors = {}
+
+    for row, line_text in enumerate(lines):
+        lines[row] = line_text.strip()
+        row_motion, row_flags, row_words, error = tokenize_line(line_text)
+        motion[row] = row_motion
+        flags[row] = row_flags
+        for letter, value in row_words.items():
+            words[letter][row] = value
+        if error is not None:
+            errors[row] = error
+
+    line = np.arange(first_line, first_line + n, dtype=np.int64)
+    return GCodeProgram(lines, line, motion, flags, words, errors)
+
+
+def as_program(gcode):
+    """
+    Return gcode as a GCodeProgram, parsing it only if it is not one already.
+
+    gcode may be a G-code string, an iterable of lines, or the path of a G-code file as a pathlib.Path (read through
+    a memory map, see mapped_lines). The returned program holds every line of the file, decoded: the validators called
+    directly on a path load the whole program, and large files are only processed in bounded memory through the
+    chunked readers (iter_program_chunks, validation_utils.run_validation_stream, toolpath_utils.iter_toolpath).
+    """
+    if isinstance(gcode, GCodeProgram):
+        return gcode
+    if isinstance(gcode, os.PathLike):
+        with mapped_lines(gcode) as lines:
+            return parse_program(lines)
+    return parse_program(gcode)
+
+
+@contextlib.contextmanager
+def mapped_lines(path):
+    """
+    Open a G-code file as a memory map and provide an iterator over its lines as bytes.
+
+    The file is never read or decoded as a whole: the lines are sliced out of the mapped buffer one at a time,
+    and the operating system pages the file in as needed.
+    """
+    with open(path, 'rb') as gcode_file:
+        if os.fstat(gcode_file.fileno()).st_size == 0:
+            # empty files cannot be mapped
+            yield iter(())
+            return
+        with mmap.mmap(gcode_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield iter(buffer.readline, b'')
+
+
+def forward_fill(values, mask, initial):
+    """
+    Carry the last value set on a masked row forward to all following rows.
+
+    Rows before the first masked row receive `initial`.
+    """
+    index = np.where(mask, np.arange(len(values)), -1)
+    np.maximum.accumulate(index, out=index)
+    filled = np.asarray(values)[np.maximum(index, 0)].copy()
+    filled[index < 0] = initial
+    return filled
+
+
+# Lines per chunk when a program is read as a stream
+CHUNK_LINES = 65536
+
+
+def iter_program_chunks(lines, chunk_size=CHUNK_LINES):
+    """
+    Tokenize a program read line by line, yielding one GCodeProgram per chunk of lines.
+
+    Only one chunk is held in memory at a time, so arbitrarily large programs can be processed from a file object.
+
+    :param lines: A file object (text or binary), any iterator over the lines of the program, or the path of a G-code
+                  file as a pathlib.Path (read through a memory map).
+    :param chunk_size: Number of lines per chunk.
+    """
+    if isinstance(lines, os.PathLike):
+        with mapped_lines(lines) as mapped:
+            yield from iter_program_chunks(mapped, chunk_size)
+        return
+
+    chunk = []
+    first_line = 0
+    for line_text in lines:
+        chunk.append(line_text)
+        if len(chunk) == chunk_size:
+            yield parse_program(chunk, first_line=first_line)
+            first_line += len(chunk)
+            chunk = []
+    if chunk:
+        yield parse_program(chunk, first_line=first_line)
+
+
+def concatenate_programs(programs):
+    """Join parsed programs into one GCodeProgram (row numbers are kept as they are)."""
+    programs = list(programs)
+    lines = [line_text for program in programs for line_text in program.lines]
+    errors = {}
+    offset = 0
+    for program in programs:
+        errors.update({offset + row: error for row, error in program.errors.items()})
+        offset += len(program)
+    words = {letter: np.concatenate([getattr(program, letter) for program in programs]) for letter in AXIS_WORDS}
+    return GCodeProgram(lines, np.concatenate([program.line for program in programs]),
+                        np.concatenate([program.motion for program in programs]),
+                        np.concatenate([program.flags for program in programs]), words, errors)
+
+
+def format_word(letter, value):
+    """Format a word such as 'X12.5' so that the value parses back exactly."""
+    return f"{letter}{np.format_float_positional(value, trim='-')}"
@@ -0,0 +1,213 @@
+"""
+Description of this file:
+
+This file contains the kinematic simulator used for realistic cycle times. It plans the interpreted tool path
+(see toolpath_utils.py) the way a motion controller does: every move runs a trapezoidal velocity profile bounded by
+the programmed feed, by the velocity and acceleration limits of the machine axes and, for arcs, by the centripetal
+acceleration; the speed at every corner is bounded by the junction deviation. The lookahead (backward and forward
+passes over the whole program) is computed in closed form with cumulative sums and minimums, so that the whole
+plan is vectorized with NumPy.
+
+The simulator reports the feed actually reached on every segment, which exposes the feed-starved tool paths
+(many short segments or sharp corners) for which length/feed badly underestimates the machining time.
+
+Authors: Mohamed Abdelaal, Samuel Lokadjaja
+
+This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
+"""
+
+from typing import NamedTuple, TypedDict
+import numpy as np
+from gllm.utils.toolpath_utils import interpret_program, RAPID, CW_ARC, PLANE_AXES
+
+# Segments whose peak feed stays below this share of the programmed feed are flagged as feed-starved
+STARVATION_RATIO = 0.5
+
+
+class MachineProfile(NamedTuple):
+    """
+    Kinematic limits of a machine.
+
+    Attributes:
+        max_velocity : Maximum velocity of the X, Y and Z axes in mm/min (also the rapid traverse rates)
+        max_acceleration : Maximum acceleration of the X, Y and Z axes in mm/s^2
+        junction_deviation : Allowed deviation in mm from the programmed corner, bounding the cornering speed
+        max_spindle_speed : Maximum spindle speed in rpm
+    """
+
+    max_velocity: tuple = (5000.0, 5000.0, 3000.0)
+    max_acceleration: tuple = (500.0, 500.0, 250.0)
+    junction_deviation: float = 0.01
+    max_spindle_speed: float = 24000.0
+
+
+DEFAULT_MACHINE = MachineProfile()
+
+
+class KinematicsReport(TypedDict):
+    """
+    Simulated execution of a tool path. Per-segment arrays follow the segment table of the tool path;
+    zero-length segments take no time and have NaN feeds.
+
+    Attributes:
+        total : Total machining time in seconds
+        times : Time of every segment in seconds
+        entry_feed, exit_feed : Feed at the start and end of every segment in mm/min
+        peak_feed : Highest feed reached on every segment in mm/min
+        average_feed : Length divided by time of every segment in mm/min
+        starved : Feed moves whose peak feed stays below STARVATION_RATIO of the programmed feed
+        starved_length : Share of the feed move length that is feed-starved
+    """
+
+    total: float
+    times: np.ndarray
+    entry_feed: np.ndarray
+    exit_feed: np.ndarray
+    peak_feed: np.ndarray
+    average_feed: np.ndarray
+    starved: np.ndarray
+    starved_length: float
+
+
+def segment_directions(segments):
+    """Unit tangents of every segment at its start and end, as two (N, 3) arrays."""
+    delta = segments['end'] - segments['start']
+    length = np.maximum(segments['length'], np.finfo(float).tiny)
+    start_direction = delta / length[:, None]
+    end_direction = start_direction.copy()
+
+    is_arc = segments['motion'] >= CW_ARC
+    if is_arc.any():
+        arcs = segments[is_arc]
+        axes = np.array([PLANE_AXES[plane] for plane in arcs['plane']])
+        rows = np.arange(len(arcs))
+        sign = np.sign(arcs['sweep'])
+        in_plane = arcs['radius'] * np.abs(arcs['sweep']) / length[is_arc]
+        along_normal = delta[is_arc][rows, axes[:, 2]] / length[is_arc]
+        for directions, angle in ((start_direction, arcs['start_angle']),
+                                  (end_direction, arcs['start_angle'] + arcs['sweep'])):
+            tangent = np.zeros((len(arcs), 3))
+            tangent[rows, axes[:, 0]] = -sign * np.sin(angle) * in_plane
+            tangent[rows, axes[:, 1]] = sign * np.cos(angle) * in_plane
+            tangent[rows, axes[:, 2]] = along_normal
+            directions[is_arc] = tangent
+    return start_direction, end_direction
+
+
+def axis_limits(segments, start_direction, limits):
+    """
+    Largest speed (or acceleration) along every segment such that no axis exceeds its own limit.
+
+    Straight moves use their direction; arcs may move both axes of their plane at the full in-plane speed.
+    """
+    limits = np.asarray(limits, dtype=float)
+    components = np.abs(start_direction)
+    is_arc = segments['motion'] >= CW_ARC
+    if is_arc.any():
+        arcs = segments[is_arc]
+        axes = np.array([PLANE_AXES[plane] for plane in arcs['plane']])
+        rows = np.arange(len(arcs))
+        arc_components = components[is_arc]
+        in_plane = np.hypot(arc_components[rows, axes[:, 0]], arc_components[rows, axes[:, 1]])
+        arc_components[rows, axes[:, 0]] = in_plane
+        arc_components[rows, axes[:, 1]] = in_plane
+        components[is_arc] = arc_components
+    with np.errstate(divide='ignore'):
+        return np.min(np.where(components > 0, limits / components, np.inf), axis=1)
+
+
+def junction_speeds(end_direction, start_direction, acceleration, junction_deviation):
+    """
+    Squared maximum speed at the junctions between consecutive segments (junction deviation model).
+
+    :param end_direction: Unit tangents at the end of the incoming segments.
+    :param start_direction: Unit tangents at the start of the outgoing segments.
+    :param acceleration: Acceleration limit at every junction in mm/s^2.
+    """
+    cos_theta = np.clip(-np.einsum('ij,ij->i', end_direction, start_direction), -1.0, 1.0)
+    sin_half_theta = np.sqrt((1.0 - cos_theta) / 2.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speeds = acceleration * junction_deviation * sin_half_theta / (1.0 - sin_half_theta)
+    # a straight continuation does not limit the speed
+    return np.where(sin_half_theta >= 1.0 - 1e-12, np.inf, speeds)
+
+
+def plan_speeds(junction_limit, reach):
+    """
+    Squared speeds at every junction after the lookahead passes.
+
+    The speed at junction k is bounded by junction_limit[k] and by what can be reached from the neighbouring
+    junctions: v[k]^2 <= v[k+1]^2 + reach[k] (deceleration) and v[k+1]^2 <= v[k]^2 + reach[k] (acceleration),
+    where reach[k] = 2 a L of segment k. Both passes are min-plus recurrences, solved with cumulative sums and
+    cumulative minimums.
+    """
+    suffix = np.concatenate((np.cumsum(reach[::-1])[::-1], [0.0]))
+    backward = suffix + np.minimum.accumulate((junction_limit - suffix)[::-1])[::-1]
+    prefix = np.concatenate(([0.0], np.cumsum(reach)))
+    return np.maximum(prefix + np.minimum.accumulate(backward - prefix), 0.0)
+
+
+def trapezoid_times(length, entry, exit_, cruise, acceleration):
+    """Time and peak speed of trapezoidal (or triangular) velocity profiles, speeds in mm/s."""
+    accelerating = (cruise**2 - entry**2) / (2 * acceleration)
+    decelerating = (cruise**2 - exit_**2) / (2 * acceleration)
+    reaches_cruise = accelerating + decelerating <= length
+    peak = np.where(reaches_cruise, cruise,
+                    np.sqrt(np.maximum((2 * acceleration * length + entry**2 + exit_**2) / 2, 0.0)))
+    peak = np.maximum(peak, np.maximum(entry, exit_))
+    cruising = np.where(reaches_cruise, (length - accelerating - decelerating) / cruise, 0.0)
+    times = (peak - entry) / acceleration + (peak - exit_) / acceleration + cruising
+    return times, peak
+
+
+def simulate_kinematics(gcode, machine=DEFAULT_MACHINE, starvation_ratio=STARVATION_RATIO):
+    """
+    Simulate the execution of a G-code program on a machine.
+
+    Rapid moves run at the velocity limit of the axes; feed moves programmed before any F word are treated the same.
+
+    :param gcode: The G-code string, a parsed GCodeProgram or a pathlib.Path to a G-code file.
+    :param machine: MachineProfile with the limits of the machine.
+    :param starvation_ratio: Share of the programmed feed below which a feed move is flagged as feed-starved.
+    :return: KinematicsReport
+    """
+    all_segments = interpret_program(gcode).segments
+    moving = all_segments['length'] > 0
+    segments = all_segments[moving]
+    count = len(segments)
+
+    start_direction, end_direction = segment_directions(segments)
+    acceleration = axis_limits(segments, start_direction, machine.max_acceleration)
+    velocity_limit = axis_limits(segments, start_direction, machine.max_velocity) / 60.0
+    programmed = segments['feed'] / 60.0
+    is_feed = segments['motion'] != RAPID
+    cruise = np.where(is_feed & ~np.isnan(programmed), np.fmin(programmed, velocity_limit), velocity_limit)
+    is_arc = segments['motion'] >= CW_ARC
+    cruise = np.where(is_arc, np.minimum(cruise, np.sqrt(acceleration * segments['radius'])), cruise)
+
+    # squared speed limits at the junctions; the machine starts and ends at rest
+    junction_limit = np.zeros(count + 1)
+    if count > 1:
+        junction_limit[1:-1] = np.minimum(
+            junction_speeds(end_direction[:-1], start_direction[1:],
+                            np.minimum(acceleration[:-1], acceleration[1:]), machine.junction_deviation),
+            np.minimum(cruise[:-1], cruise[1:])**2)
+    speeds = np.sqrt(plan_speeds(junction_limit, 2 * acceleration * segments['length']))
+    entry, exit_ = np.minimum(speeds[:-1], cruise), np.minimum(speeds[1:], cruise)
+    times, peak = trapezoid_times(segments['length'], entry, exit_, cruise, acceleration)
+
+    starved = is_feed & (peak < starvation_ratio * programmed)
+    feed_length = segments['length'][is_feed].sum()
+
+    def expand(values, fill):
+        result = np.full(len(all_segments), fill, dtype=values.dtype)
+        result[moving] = values
+        return result
+
+    return KinematicsReport(total=float(times.sum()), times=expand(times, 0.0),
+                            entry_feed=expand(entry * 60.0, np.nan), exit_feed=expand(exit_ * 60.0, np.nan),
+                            peak_feed=expand(peak * 60.0, np.nan),
+                            average_feed=expand(np.divide(segments['length'], times, out=np.zeros(count),
+                                                          where=times > 0) * 60.0, np.nan),
+                            starved=expand(starved, False),
+                            starved_length=float(segments['length'][starved].sum() / feed_length) if feed_length else 0.0)
@@ -0,0 +1,204 @@
+"""
+Description of this file:
+
+This file contains the level-of-detail layer used to plot large tool paths. The vertices of a tool path are ranked
+once with the Ramer-Douglas-Peucker algorithm: the importance of a vertex is the largest tolerance at which the
+simplification still keeps it. Every level of the resulting pyramid keeps the vertices above a tolerance (each
+level doubling the tolerance of the previous one), so a plot draws the coarsest level that stays within half a
+pixel of the full tool path in its viewport. Programs still too large for the viewport are drawn as a 2D histogram
+raster of the tool path instead.
+
+The algorithms are vectorized with NumPy: the Douglas-Peucker splits are computed for all open intervals at once.
+
+Authors: Mohamed Abdelaal, Samuel Lokadjaja
+
+This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
+"""
+
+import numpy as np
+from gllm.utils.spatial_utils import point_segment_distances
+
+# Smallest tolerance of a pyramid in mm; vertices closer than this to the simplified path only appear in full detail
+MIN_TOLERANCE = 1e-3
+
+# Vertices per block of the two-level ranking of long tool paths (see point_importance)
+RANK_BLOCK = 256
+
+# Default size of a plot in pixels (a 10x6 inch figure at 100 dpi)
+VIEWPORT_PIXELS = (1000, 600)
+
+# Largest number of vertices drawn as lines; above it the tool path is rasterized
+MAX_PLOT_POINTS = 50000
+
+
+def douglas_peucker(points, starts, ends, min_tolerance, slack=None):
+    """
+    Douglas-Peucker splits of the intervals starts[i]..ends[i] of a polyline, all intervals at once.
+
+    :param slack: Optional distance added to the distance of every vertex from the chord.
+    :return: (importance, spans): the importance of the interior vertices of the intervals (capped by the importance
+             of the enclosing split, 0 below min_tolerance) and the largest distance of the interior of every
+             interval from its chord
+    """
+    importance = np.zeros(len(points))
+    spans = np.zeros(len(starts))
+    starts, ends = np.asarray(starts), np.asarray(ends)
+    caps, first_pass = np.full(len(starts), np.inf), True
+    while len(starts):
+        counts = ends - starts - 1
+        open_ = counts > 0
+        if first_pass:
+            interval = np.flatnonzero(open_)
+        starts, ends, caps, counts = starts[open_], ends[open_], caps[open_], counts[open_]
+        if not len(starts):
+            break
+        offsets = np.cumsum(counts) - counts
+        owner = np.repeat(np.arange(len(starts)), counts)
+        index = starts[owner] + 1 + np.arange(counts.sum()) - offsets[owner]
+        distances = point_segment_distances(points[index], points[starts[owner]], points[ends[owner]])
+        if slack is not None:
+            distances += slack[index]
+
+        farthest = np.maximum.reduceat(distances, offsets)
+        if first_pass:
+            spans[interval], first_pass = farthest, False
+        # first vertex at the largest distance of every interval
+        candidates = np.flatnonzero(distances == farthest[owner])
+        _, first = np.unique(owner[candidates], return_index=True)
+        split = index[candidates[first]]
+
+        split_importance = np.minimum(farthest, caps)
+        kept = split_importance >= min_tolerance
+        importance[split[kept]] = split_importance[kept]
+        starts, ends = np.concatenate((starts[kept], split[kept])), np.concatenate((split[kept], ends[kept]))
+        caps = np.tile(split_importance[kept], 2)
+    return importance, spans
+
+
+def point_importance(points, min_tolerance=MIN_TOLERANCE, breaks=()):
+    """
+    Douglas-Peucker importance of every vertex of a polyline: the vertex is kept by the simplification with any
+    tolerance below its importance. The end points (and the given breaks, e.g. where rapid moves start or end) have
+    an infinite importance; vertices that only matter below min_tolerance have importance 0. The levels of
+    importance are nested.
+
+    Long polylines are ranked in two levels, so that the number of passes stays small: the vertices within blocks
+    of RANK_BLOCK vertices, then the block ends over the whole polyline. A block end is ranked by its distance from
+    the coarse chord plus the largest distance of the adjacent blocks from their own chords, which bounds the
+    distance of every vertex of the blocks from the coarse chord (the distance to a segment is convex).
+    """
+    points = np.asarray(points, dtype=float)
+    if len(points) == 0:
+        return np.zeros(0)
+    fixed = np.unique(np.concatenate(([0, len(points) - 1], np.asarray(breaks, dtype=np.int64))))
+    ends = np.union1d(np.arange(0, len(points), RANK_BLOCK), fixed)
+    importance, spans = douglas_peucker(points, ends[:-1], ends[1:], min_tolerance)
+    if len(ends) == len(fixed):
+        importance[fixed] = np.inf
+        return importance
+
+    slack = np.maximum(np.append(spans, 0.0), np.insert(spans, 0, 0.0))
+    fixed = np.searchsorted(ends, fixed)
+    coarse, _ = douglas_peucker(points[ends], fixed[:-1], fixed[1:], min_tolerance, slack)
+    coarse[fixed] = np.inf
+    block = np.searchsorted(ends, np.arange(len(points)), side='right') - 1
+    importance = np.minimum(importance, np.minimum(coarse[:-1], coarse[1:])[np.minimum(block, len(ends) - 2)])
+    importance[ends] = coarse
+    return importance
+
+
+def simplify(points, tolerance):
+    """Indices of the vertices kept by the Douglas-Peucker simplification with the given tolerance."""
+    return np.flatnonzero(point_importance(points, tolerance) >= tolerance)
+
+
+class ToolpathPyramid:
+    """
+    Multi-resolution pyramid of the vertices of a tool path.
+
+    Attributes:
+        points : (N, 3) vertices of the tool path in full detail
+        importance : Douglas-Peucker importance of every vertex (see point_importance)
+        tolerances : Tolerance of every level, from the finest (MIN_TOLERANCE) to the coarsest, doubling each time;
+                     level k keeps the vertices whose importance is at least tolerances[k]
+        sizes : Number of vertices of every level
+    """
+
+    def __init__(self, points, min_tolerance=MIN_TOLERANCE, breaks=()):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 3)
+        self.importance = point_importance(self.points, min_tolerance, breaks)
+        extent = float(np.ptp(self.points, axis=0).max()) if len(self.points) else 0.0
+        count = max(int(np.ceil(np.log2(max(extent, min_tolerance) / min_tolerance))), 0) + 1
+        self.tolerances = min_tolerance * 2.0 ** np.arange(count)
+        finite = np.sort(self.importance)
+        self.sizes = len(finite) - np.searchsorted(finite, self.tolerances, side='left')
+
+    def __len__(self):
+        return len(self.points)
+
+    def level(self, tolerance):
+        """Indices of the vertices of the coarsest level whose tolerance does not exceed `tolerance`."""
+        if tolerance < self.tolerances[0]:
+            return np.arange(len(self.points))
+        k = np.searchsorted(self.tolerances, tolerance, side='right') - 1
+        return np.flatnonzero(self.importance >= self.tolerances[k])
+
+    def within(self, max_points):
+        """Indices of the vertices of the finest level with at most max_points vertices (or of the coarsest level)."""
+        if len(self.points) <= max_points:
+            return np.arange(len(self.points))
+        fitting = np.flatnonzero(self.sizes <= max_points)
+        k = fitting[0] if len(fitting) else len(self.sizes) - 1
+        return np.flatnonzero(self.importance >= self.tolerances[k])
+
+    def for_viewport(self, bounds=None, pixels=VIEWPORT_PIXELS):
+        """
+        Vertices to draw for a viewport: the level within half a pixel of the tool path, cropped to the viewport.
+
+        :param bounds: (x_min, y_min, x_max, y_max) of the viewport in mm; default: the whole tool path.
+        :param pixels: Width and height of the viewport in pixels.
+        :return: (M, 3) vertices; consecutive vertices are joined by the tool path
+        """
+        if not len(self.points):
+            return self.points
+        if bounds is None:
+            bounds = (*self.points[:, :2].min(axis=0), *self.points[:, :2].max(axis=0))
+        pixel = max((bounds[2] - bounds[0]) / pixels[0], (bounds[3] - bounds[1]) / pixels[1])
+        index = self.level(pixel / 2)
+        points = self.points[index]
+        inside = ((points[:, 0] >= bounds[0]) & (points[:, 0] <= bounds[2]) &
+                  (points[:, 1] >= bounds[1]) & (points[:, 1] <= bounds[3]))
+        # keep the neighbours of visible vertices, so that the lines leaving the viewport are still drawn
+        visible = inside | np.concatenate(([False], inside[:-1])) | np.concatenate((inside[1:], [False]))
+        return points[visible]
+
+
+def raster_toolpath(points, bounds=None, pixels=VIEWPORT_PIXELS):
+    """
+    2D histogram of the XY tool path: how many times the path crosses every pixel of the viewport.
+
+    The segments between consecutive vertices are sampled at least once per pixel, so long moves are drawn as well.
+
+    :return: (counts, extent) with counts[row, column] for imshow (row 0 at y_min) and extent
+             (x_min, x_max, y_min, y_max)
+    """
+    points = np.asarray(points, dtype=float)
+    if bounds is None:
+        bounds = (*points[:, :2].min(axis=0), *points[:, :2].max(axis=0)) if len(points) else (0, 0, 1, 1)
+    x_min, y_min, x_max, y_max = bounds
+    x_max, y_max = max(x_max, x_min + 1e-9), max(y_max, y_min + 1e-9)
+    pixel = min((x_max - x_min) / pixels[0], (y_max - y_min) / pixels[1])
+
+    starts, ends = points[:-1, :2], points[1:, :2]
+    samples = np.minimum(np.ceil(np.hypot(*(ends - starts).T) / pixel), max(pixels)).astype(np.int64) + 1
+    segment = np.repeat(np.arange(len(starts)), samples)
+    t = (np.arange(samples.sum()) - np.repeat(np.cumsum(samples) - samples, samples)) / np.repeat(samples, samples)
+    sampled = starts[segment] + t[:, None] * (ends[segment] - starts[segment])
+    sampled = np.concatenate((sampled, points[-1:, :2]))
+    column = np.floor((sampled[:, 0] - x_min) / (x_max - x_min) * pixels[0]).astype(np.int64)
+    row = np.floor((sampled[:, 1] - y_min) / (y_max - y_min) * pixels[1]).astype(np.int64)
+    # the upper edges belong to the last pixel, as for np.histogram2d
+    column[sampled[:, 0] == x_max], row[sampled[:, 1] == y_max] = pixels[0] - 1, pixels[1] - 1
+    inside = (column >= 0) & (column < pixels[0]) & (row >= 0) & (row < pixels[1])
+    counts = np.bincount(row[inside] * pixels[0] + column[inside], minlength=pixels[0] * pixels[1])
+    return counts.reshape(pixels[1], pixels[0]).astype(float), (x_min, x_max, y_min, y_max)
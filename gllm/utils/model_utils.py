@@ -15,6 +15,7 @@ This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is publis
 
 import os
 import toml
+import logging
 import openai
 from peft import PeftModel, PeftConfig
 from transformers import AutoModelForCausalLM, pipeline, AutoTokenizer
@@ -25,6 +26,8 @@ from langchain_community.llms import HuggingFaceEndpoint, HuggingFacePipeline
 from langchain_community.chat_models.huggingface import ChatHuggingFace
 from huggingface_hub import login
 
+logger = logging.getLogger(__name__)
+
 
 # Define the path to the secrets.toml file
 secrets_file_path = os.path.abspath(os.path.join(os.path.dirname('__file__'), '.streamlit', 'secrets.toml'))
@@ -39,11 +42,11 @@ hf_token = secrets.get("huggingface_token")
 if hf_token:
     try:
         login(hf_token, add_to_git_credential=True)
-        print("Successfully logged in to Hugging Face")
+        logger.info("Successfully logged in to Hugging Face")
     except Exception as e:
-        print(f"Warning: Could not login to Hugging Face: {e}")
+        logger.warning(f"Warning: Could not login to Hugging Face: {e}")
 else:
-    print("Warning: No Hugging Face token found in secrets")
+    logger.warning("Warning: No Hugging Face token found in secrets")
 
 
 def setup_model(model:str):
@@ -66,16 +69,16 @@ def setup_model(model:str):
             # Load the fine tuned model
             llm = PeftModel.from_pretrained(base_model, "ArneKreuz/starcoderbase-finetuned-thestack", token=hf_token, force_download=True)
         except Exception as e:
-            print(f"Error loading Fine-tuned StarCoder: {e}")
-            print("This might be due to:")
-            print("1. Missing Hugging Face token")
-            print("2. No access to gated repository 'bigcode/starcoderbase-3b'")
-            print("3. Visit https://huggingface.co/bigcode/starcoderbase-3b to request access")
-            print("Falling back to publicly available StarCoder alternative...")
+            logger.warning(f"Error loading Fine-tuned StarCoder: {e}")
+            logger.info("This might be due to:")
+            logger.info("1. Missing Hugging Face token")
+            logger.info("2. No access to gated repository 'bigcode/starcoderbase-3b'")
+            logger.info("3. Visit https://huggingface.co/bigcode/starcoderbase-3b to request access")
+            logger.info("Falling back to publicly available StarCoder alternative...")
             
             # Try alternative open-source code models
             try:
-                print("Trying WizardCoder-1B as alternative...")
+                logger.info("Trying WizardCoder-1B as alternative...")
                 ENDPOINT_URL = "https://api-inference.huggingface.co/models/WizardLM/WizardCoder-1B-V1.0"
                 llm = HuggingFaceEndpoint(
                     endpoint_url=ENDPOINT_URL,
@@ -86,8 +89,8 @@ def setup_model(model:str):
                     repetition_penalty=1.03,
                     huggingfacehub_api_token=hf_token)
             except Exception as e2:
-                print(f"WizardCoder also failed: {e2}")
-                print("Final fallback to Zephyr-7b model...")
+                logger.warning(f"WizardCoder also failed: {e2}")
+                logger.info("Final fallback to Zephyr-7b model...")
                 # Final fallback to a publicly available model
                 ENDPOINT_URL = "https://api-inference.huggingface.co/models/HuggingFaceH4/zephyr-7b-beta"
                 llm = HuggingFaceEndpoint(
@@ -105,7 +108,7 @@ def setup_model(model:str):
 
     elif model == 'CodeLlama':
         try:
-            print("Loading CodeLlama via Hugging Face Inference API (recommended for memory efficiency)...")
+            logger.info("Loading CodeLlama via Hugging Face Inference API (recommended for memory efficiency)...")
             # Use Hugging Face Inference API instead of loading locally to avoid memory issues
             ENDPOINT_URL = "https://api-inference.huggingface.co/models/codellama/CodeLlama-7b-hf"
             llm = HuggingFaceEndpoint(
@@ -116,15 +119,15 @@ def setup_model(model:str):
                 temperature=0.1,
                 repetition_penalty=1.03,
                 huggingfacehub_api_token=hf_token)
-            print("Successfully loaded CodeLlama via API")
+            logger.info("Successfully loaded CodeLlama via API")
         except Exception as e:
-            print(f"Error loading CodeLlama via API: {e}")
-            print("Trying local CodeLlama with memory optimizations...")
+            logger.warning(f"Error loading CodeLlama via API: {e}")
+            logger.info("Trying local CodeLlama with memory optimizations...")
             
             try:
                 # Try loading locally with memory optimizations
                 model_name = "codellama/CodeLlama-7b-hf"
-                print("Loading with memory optimizations...")
+                logger.info("Loading with memory optimizations...")
                 
                 # Load with memory optimizations (without 8-bit for Mac compatibility)
                 base_model = AutoModelForCausalLM.from_pretrained(
@@ -147,12 +150,12 @@ def setup_model(model:str):
                     temperature=0.1,
                     pad_token_id=tokenizer.eos_token_id
                 )
-                print("Successfully loaded CodeLlama locally with optimizations")
+                logger.info("Successfully loaded CodeLlama locally with optimizations")
                 
             except Exception as e2:
-                print(f"Error loading CodeLlama locally: {e2}")
-                print("This is likely due to insufficient memory (CodeLlama-7B requires ~13GB RAM)")
-                print("Falling back to lighter alternative: WizardCoder-1B...")
+                logger.warning(f"Error loading CodeLlama locally: {e2}")
+                logger.info("This is likely due to insufficient memory (CodeLlama-7B requires ~13GB RAM)")
+                logger.info("Falling back to lighter alternative: WizardCoder-1B...")
                 
                 # Fallback to a smaller code model
                 try:
@@ -165,10 +168,10 @@ def setup_model(model:str):
                         temperature=0.1,
                         repetition_penalty=1.03,
                         huggingfacehub_api_token=hf_token)
-                    print("Loaded WizardCoder-1B as fallback")
+                    logger.info("Loaded WizardCoder-1B as fallback")
                 except Exception as e3:
-                    print(f"WizardCoder also failed: {e3}")
-                    print("Final fallback to Zephyr-7b model...")
+                    logger.warning(f"WizardCoder also failed: {e3}")
+                    logger.info("Final fallback to Zephyr-7b model...")
                     # Final fallback
                     ENDPOINT_URL = "https://api-inference.huggingface.co/models/HuggingFaceH4/zephyr-7b-beta"
                     llm = HuggingFaceEndpoint(
@@ -183,7 +186,7 @@ def setup_model(model:str):
         
     elif model == "DeepSeek-Coder-1B":
         try:
-            print("Loading DeepSeek-Coder-1B (lightweight code model)...")
+            logger.info("Loading DeepSeek-Coder-1B (lightweight code model)...")
             ENDPOINT_URL = "https://api-inference.huggingface.co/models/deepseek-ai/deepseek-coder-1.3b-base"
             llm = HuggingFaceEndpoint(
                 endpoint_url=ENDPOINT_URL,
@@ -194,8 +197,8 @@ def setup_model(model:str):
                 repetition_penalty=1.03,
                 huggingfacehub_api_token=hf_token)
         except Exception as e:
-            print(f"Error loading DeepSeek-Coder: {e}")
-            print("Falling back to Zephyr-7b...")
+            logger.warning(f"Error loading DeepSeek-Coder: {e}")
+            logger.info("Falling back to Zephyr-7b...")
             ENDPOINT_URL = "https://api-inference.huggingface.co/models/HuggingFaceH4/zephyr-7b-beta"
             llm = HuggingFaceEndpoint(
                 endpoint_url=ENDPOINT_URL,
@@ -208,7 +211,7 @@ def setup_model(model:str):
     
     elif model == "Phi-3-Mini":
         try:
-            print("Loading Phi-3-Mini (Microsoft's efficient code model)...")
+            logger.info("Loading Phi-3-Mini (Microsoft's efficient code model)...")
             ENDPOINT_URL = "https://api-inference.huggingface.co/models/microsoft/Phi-3-mini-4k-instruct"
             llm = HuggingFaceEndpoint(
                 endpoint_url=ENDPOINT_URL,
@@ -219,8 +222,8 @@ def setup_model(model:str):
                 repetition_penalty=1.03,
                 huggingfacehub_api_token=hf_token)
         except Exception as e:
-            print(f"Error loading Phi-3-Mini: {e}")
-            print("Falling back to Zephyr-7b...")
+            logger.warning(f"Error loading Phi-3-Mini: {e}")
+            logger.info("Falling back to Zephyr-7b...")
             ENDPOINT_URL = "https://api-inference.huggingface.co/models/HuggingFaceH4/zephyr-7b-beta"
             llm = HuggingFaceEndpoint(
                 endpoint_url=ENDPOINT_URL,
@@ -16,9 +16,12 @@ This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is publis
 
 import re
 import math
+import logging
 import streamlit as st
 from gllm.utils.prompts_utils import REQUIRED_PARAMETERS
 
+logger = logging.getLogger(__name__)
+
 
 
 def extract_parameters_logic(chain, task_description):
@@ -27,7 +30,7 @@ def extract_parameters_logic(chain, task_description):
     # convert the extracted parameters from string into a dictionary 
     extracted_parameters = {}
     cutting_tool_path = []
-    print(extracted_parameters_text.content)
+    logger.debug("Extracted parameters:\n%s", extracted_parameters_text.content)
     for line in extracted_parameters_text.content.split('\n'):
         if ':' in line:
             key, value = line.split(':', 1)
@@ -40,10 +43,10 @@ def extract_parameters_logic(chain, task_description):
         else:
             # capture x and y values of the cutting tool path
             match = re.search(r'(?:[xX]\s*=\s*([\d.]+)\s*[,;\s]\s*[yY]\s*=\s*([\d.]+))|(?:\(([\d.]+),\s*([\d.]+)\))', line)
-            print("MATCH: ", match)
+            logger.debug("MATCH: %s", match)
             if match:
                 x, y = match.groups()[0:2] if match.groups()[0] else match.groups()[2:4]
-                print("X, Y: ", x, y)
+                logger.debug("X, Y: %s %s", x, y)
                 cutting_tool_path.append((float(x), float(y)))
 
     # Add the cutting tool path to the extracted parameters
@@ -95,7 +98,7 @@ def display_extracted_parameters():
             for param in st.session_state['missing_parameters']:
                 st.session_state['user_inputs'][param] = st.text_input(f"Please provide the {param}", key=f"text_input_{param}")  # Unique key for each text input
                 if st.session_state['user_inputs'][param]:
-                    print("PARAM: ", param)
+                    logger.debug("PARAM: %s", param)
                     st.session_state['extracted_parameters'] += f"{param}: {st.session_state['user_inputs'][param]}\n" 
                     st.session_state['missing_parameters'].remove(param)    # remove the entry from the list, if the user added it.
 
@@ -140,9 +143,7 @@ def find_circular_path(parameters: dict):
     center_x = starting_point[0] + radius
     center_y = starting_point[1]
     path = []
-    print("CENTER_X: ", center_x)
-    print("CENTER_Y: ", center_y)
-    print("RADIUS: ", radius)
+    logger.debug("CENTER_X: %s, CENTER_Y: %s, RADIUS: %s", center_x, center_y, radius)
     for i in range(num_points + 1):
         angle = 2 * math.pi * i / num_points
         x = center_x + radius * math.cos(angle)
@@ -177,9 +178,9 @@ def parse_extracted_parameters(parameter_string):
                         parameters[current_key] += " " + line  # Append to previous line
                     else:
                         # Handle the case where there's no previous key (shouldn't happen ideally)
-                        print(f"Warning: Line without a valid key: {line}")
+                        logger.info("Warning: Line without a valid key: %s", line)
     except Exception as e:
-        print(f"Error parsing parameters: {e}")
+        logger.info("Error parsing parameters: %s", e)
         return None
 
     try:
@@ -189,7 +190,7 @@ def parse_extracted_parameters(parameter_string):
         parsed_parameters['tool_path'] = find_circular_path(parameters=parameters) if parameters.get("Desired Shape", "").lower() in ['circle', 'circular pocket', 'circular'] else extract_path(parameters=parameters, key='Cutting Tool Path')
         parsed_parameters['cut_depth'] = extract_numerical_values(parameters=parameters, key='Depth of Cut') 
     except Exception as e:
-        print(f"Error processing parsed parameters: {e}")
+        logger.info("Error processing parsed parameters: %s", e)
         return None
 
     return parsed_parameters
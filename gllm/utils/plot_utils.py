@@ -4,17 +4,38 @@ Description of this file:
 This file contains utility functions for plotting and refining G-code generated by the Streamlit application that uses LLM pipelines with Langchain and Langgraph. 
 The functions are used to visualize the G-code as a 3D plot and refine the G-code based on the instructions given to the application.
 
-The functions are written in Python and use the Plotly library for the visualization.
+The functions are written in Python and use the Plotly library for the visualization (the 3D tool path, drawn with
+WebGL) and Matplotlib for the 2D plots.
 
 Authors: Mohamed Abdelaal, Samuel Lokadjaja
 
 This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
 """
 
+import io
+import logging
 import numpy as np
 import matplotlib.pyplot as plt
 import re
 import plotly.graph_objects as go
+from gllm.utils.cache_utils import LRUCache, content_key
+from gllm.utils.ir_utils import GCodeProgram
+from gllm.utils.toolpath_utils import interpret_program, iter_toolpath, Toolpath, ModalState, SEGMENT_DTYPE, RAPID
+from gllm.utils.lod_utils import ToolpathPyramid, raster_toolpath, VIEWPORT_PIXELS, MAX_PLOT_POINTS
+
+logger = logging.getLogger(__name__)
+
+# Largest number of vertices plotted with markers
+MARKER_POINTS = 200
+
+# Largest number of vertices sent to the browser by the 3D renderer; larger tool paths are decimated
+MAX_RENDER_POINTS = 100000
+
+# First bytes of the binary tool path payload (see encode_toolpath)
+TOOLPATH_MAGIC = b'GTP1'
+
+# Memory of the rendered figures kept by cached_render, in bytes
+FIGURE_CACHE_BYTES = 128 * 2**20
 
 def refine_gcode(gcode):
 
@@ -55,108 +76,201 @@ def parse_coordinates(command):
     return coord_dict
 
 
+def load_toolpath(gcode):
+    """
+    Tool path of a G-code string, of an already parsed GCodeProgram, or of a program read line by line from an open
+    file, an iterator or a pathlib.Path to a memory-mapped file (interpreted chunk by chunk).
+    """
+    if isinstance(gcode, (str, GCodeProgram)):
+        return interpret_program(gcode)
+    toolpaths = list(iter_toolpath(gcode))
+    return Toolpath(np.concatenate([np.zeros(0, dtype=SEGMENT_DTYPE)] + [toolpath.segments for toolpath in toolpaths]),
+                    toolpaths[-1].state if toolpaths else ModalState())
+
+
+def toolpath_vertices(gcode):
+    """Vertices of the tool path of a program (see load_toolpath), as an (N, 3) array."""
+    points = load_toolpath(gcode).points()
+    logger.debug("Parsed tool path with %d points", len(points))
+    return points
+
+
 def parse_gcode(gcode):
-    x_points, y_points = [], []
-    x, y = 0, 0  # Initialize starting point
-    # x_points.append(x)
-    # y_points.append(y)
-    
-    for command in gcode.splitlines():
-        
-        command = command.split(';')[0].strip()  # Remove comments and trim
-        
-        if not command:
-            continue
-        elif 'M30' in command:
-            # End of program
-            break
-        elif 'G00' in command or 'G0 ' in command:
-            print("rapid positioning", command)
-            # Rapid positioning
-            coords = parse_coordinates(command)
-            x = coords.get('X', x)
-            y = coords.get('Y', y)
-            print(command, x, y)
-            x_points.append(x)
-            y_points.append(y)
-        elif 'G01' in command or 'G1 ' in command:
-            # Linear interpolation
-            print("linear interpolation", command)
-            coords = parse_coordinates(command)
-            print(command, x, y)
-            x = coords.get('X', x)
-            y = coords.get('Y', y)
-            x_points.append(x)
-            y_points.append(y)
-        # Handle circular interpolation if present
-        elif 'G02' in command or 'G2 ' in command or 'G03' in command or 'G3 ' in command:
-            print("plotting Circualar shape!", command)
-            # Circular interpolation
-            coords = parse_coordinates(command)
-            i_center = coords.get('I', 0)
-            j_center = coords.get('J', 0)
-            radius = coords.get('R', None)
-
-            if radius is not None:
-                # Calculate center of the arc from radius
-                dx = x - (x + radius)
-                dy = y - (y + radius)
-                center_x = x + np.cos(np.arctan2(dy, dx)) * radius
-                center_y = y + np.sin(np.arctan2(dy, dx)) * radius
-            else:
-                center_x = x + i_center
-                center_y = y + j_center
-            
-            # Determine the end position
-            if 'X' in coords and 'Y' in coords:
-                x_end = coords.get('X', x)
-                y_end = coords.get('Y', y)
-            else:
-                # If no end coordinates are provided, compute them assuming a complete circle
-                x_end = x
-                y_end = y
-
-            # Calculate angles for the arc
-            start_angle = np.arctan2(y - center_y, x - center_x)
-            end_angle = np.arctan2(y_end - center_y, x_end - center_x)
-
-            # Generate points along the arc
-            if 'G02' in command or 'G2' in command:  # Clockwise
-                if start_angle <= end_angle:
-                    start_angle += 2 * np.pi
-            elif 'G03' in command or 'G3' in command:  # Counterclockwise
-                if start_angle >= end_angle:
-                    end_angle += 2 * np.pi
-
-            angles = np.linspace(start_angle, end_angle, 100)
-            arc_x = center_x + radius * np.cos(angles) if radius is not None else center_x + np.sqrt(i_center**2 + j_center**2) * np.cos(angles)
-            arc_y = center_y + radius * np.sin(angles) if radius is not None else center_y + np.sqrt(i_center**2 + j_center**2) * np.sin(angles)
-            x_points.extend(arc_x)
-            y_points.extend(arc_y)
-            # Update current position to end of arc
-            x, y = x_end, y_end
-        
-        else:
-            # skipp all other irrelevant commands
-            continue
-    
+    """Extract the XY tool path of a program (see toolpath_vertices) as lists of X and Y coordinates."""
+    points = toolpath_vertices(gcode)
+    x_points, y_points = points[:, 0].tolist(), points[:, 1].tolist()
     return x_points, y_points
 
 
-def plot_gcode(gcode):
+def plot_gcode(gcode, viewport=None):
+    """
+    Plot the XY tool path of a program.
+
+    Only the vertices that are visible at the resolution of the figure are drawn (see lod_utils.ToolpathPyramid);
+    tool paths that still have more than MAX_PLOT_POINTS vertices are drawn as a density raster.
 
-    x_points, y_points = parse_gcode(gcode)
+    :param viewport: Optional (x_min, y_min, x_max, y_max) to zoom to, in mm.
+    """
+    points = ToolpathPyramid(toolpath_vertices(gcode)).for_viewport(viewport, VIEWPORT_PIXELS)
 
     plt.figure(figsize=(10, 6))
-    plt.plot(x_points, y_points, marker='o')
+    if len(points) > MAX_PLOT_POINTS:
+        counts, extent = raster_toolpath(points, viewport, VIEWPORT_PIXELS)
+        plt.imshow(np.log1p(counts), origin='lower', extent=extent, cmap='Blues', interpolation='nearest')
+    else:
+        plt.plot(points[:, 0], points[:, 1], marker='o' if len(points) <= MARKER_POINTS else None)
+    if viewport is not None:
+        plt.xlim(viewport[0], viewport[2])
+        plt.ylim(viewport[1], viewport[3])
+        plt.gca().set_aspect('equal', adjustable='box')
+    elif len(points) <= MAX_PLOT_POINTS:
+        plt.axis('equal')
     plt.title('CNC Path Plot')
     plt.xlabel('X Axis')
     plt.ylabel('Y Axis')
     plt.grid(True)
-    plt.axis('equal')
     return plt
 
 
+def run_coordinates(vertices, edges):
+    """
+    Rows of the polylines formed by the given edges (edge j joins vertices j and j + 1), for a single Plotly trace:
+    consecutive edges are drawn as one line and separate runs are split by rows of NaN.
+    """
+    edges = np.asarray(edges)
+    if not len(edges):
+        return np.zeros((0, vertices.shape[1]))
+    run_start = np.concatenate(([True], edges[1:] != edges[:-1] + 1))
+    # every edge adds its end vertex; the first edge of a run adds a gap and its start vertex before
+    sizes = 1 + 2 * run_start
+    rows = np.full((sizes.sum(), vertices.shape[1]), np.nan)
+    ends = np.cumsum(sizes) - 1
+    rows[ends] = vertices[edges + 1]
+    rows[ends[run_start] - 1] = vertices[edges[run_start]]
+    return rows[1:]
+
+
+def render_vertices(gcode, max_points=None):
+    """
+    Vertices of the tool path of a program as drawn by the renderers.
+
+    :param gcode: The G-code string, a parsed GCodeProgram, or a file read line by line (see load_toolpath).
+    :param max_points: Decimate tool paths with more vertices with the level-of-detail pyramid, keeping the ends of
+                       every rapid and feed run (default: all vertices).
+    :return: (vertices, rows, rapid): (M, 3) vertices, the source line (1-based) of every vertex, and whether the
+             edge from vertex j to j + 1 is a rapid move, for the M - 1 edges
+    """
+    toolpath = load_toolpath(gcode)
+    segments = toolpath.segments
+    if not len(segments):
+        return np.zeros((0, 3)), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool)
+    index, points = toolpath.points(return_index=True)
+    # vertex 0 is where the first move starts; edge j (vertex j to j + 1) belongs to segment index[j]
+    points = np.concatenate((segments['start'][:1], points))
+    rows = segments['row'][np.concatenate((index[:1], index))] + 1
+    rapid = segments['motion'][index] == RAPID
+    if max_points is None or len(points) <= max_points:
+        return points, rows, rapid
+
+    breaks = np.flatnonzero(rapid[1:] != rapid[:-1]) + 1
+    kept = ToolpathPyramid(points, breaks=breaks).within(max_points)
+    logger.debug("Rendering %d of %d tool path vertices", len(kept), len(points))
+    # runs are kept whole, so every kept edge has the kind of its first vertex
+    return points[kept], rows[kept], rapid[kept[:-1]]
+
+
+def toolpath_figure(gcode, max_points=MAX_RENDER_POINTS):
+    """
+    3D view of the tool path of a program, rendered with WebGL by Plotly.
+
+    Rapid and feed moves are separate traces (so either can be hidden from the legend); tool paths with more than
+    max_points vertices are decimated (see render_vertices).
+
+    :param gcode: The G-code string, a parsed GCodeProgram, or a file read line by line (see load_toolpath).
+    :return: plotly.graph_objects.Figure
+    """
+    points, rows, rapid = render_vertices(gcode, max_points)
+    vertices = np.column_stack((points, rows))
+    fig = go.Figure()
+    for name, edges, line in (('Feed', np.flatnonzero(~rapid), dict(color='royalblue', width=4)),
+                              ('Rapid', np.flatnonzero(rapid), dict(color='firebrick', width=2, dash='dash'))):
+        coordinates = run_coordinates(vertices, edges)
+        fig.add_trace(go.Scatter3d(x=coordinates[:, 0], y=coordinates[:, 1], z=coordinates[:, 2],
+                                   customdata=coordinates[:, 3], mode='lines', name=name, line=line,
+                                   hovertemplate="X %{x}<br>Y %{y}<br>Z %{z}<br>line %{customdata}"))
+    fig.update_layout(title='CNC Tool Path', scene=dict(xaxis_title='X (mm)', yaxis_title='Y (mm)',
+                                                         zaxis_title='Z (mm)', aspectmode='data'),
+                      margin=dict(l=0, r=0, t=40, b=0), uirevision='toolpath')
+    return fig
+
+
+def encode_toolpath(gcode, max_points=None):
+    """
+    Binary encoding of the tool path of a program for the web frontend, read without parsing into typed arrays.
+
+    Layout (little-endian): the magic TOOLPATH_MAGIC, the number of vertices N as uint32, the X, Y and Z coordinates
+    in microns as int32, each axis delta-encoded (the first value absolute, then differences, so that the payload
+    compresses well) and stored one axis after the other, and one uint8 per vertex that is 1 when the move ending
+    at the vertex is a rapid move.
+
+    :param max_points: Decimate larger tool paths (see render_vertices).
+    :return: bytes
+    """
+    points, _, rapid = render_vertices(gcode, max_points)
+    microns = np.rint(points * 1000.0).astype(np.int64)
+    if len(microns) and np.abs(microns).max() >= 2 ** 31:
+        raise ValueError("Tool path coordinates exceed the range of the toolpath encoding")
+    deltas = np.diff(microns, axis=0, prepend=np.zeros((1, 3), dtype=np.int64)).T.astype('<i4')
+    kinds = np.concatenate(([0], rapid)).astype(np.uint8) if len(points) else np.zeros(0, dtype=np.uint8)
+    return TOOLPATH_MAGIC + np.uint32(len(points)).astype('<u4').tobytes() + deltas.tobytes() + kinds.tobytes()
+
+
+def decode_toolpath(payload):
+    """Inverse of encode_toolpath: (vertices in mm, rapid flag of every vertex)."""
+    if payload[:4] != TOOLPATH_MAGIC:
+        raise ValueError("Not a tool path payload")
+    count = int(np.frombuffer(payload, dtype='<u4', count=1, offset=4)[0])
+    deltas = np.frombuffer(payload, dtype='<i4', count=3 * count, offset=8).reshape(3, count)
+    kinds = np.frombuffer(payload, dtype=np.uint8, count=count, offset=8 + 12 * count)
+    return np.cumsum(deltas, axis=1).T / 1000.0, kinds.astype(bool)
+
+
+def figure_size(figure):
+    """Approximate memory of a rendered figure: the data arrays of a Plotly figure, or the bytes of an image."""
+    if isinstance(figure, (bytes, str)):
+        return len(figure)
+    return sum(np.asarray(values).nbytes for trace in figure.data
+               for values in (trace['x'], trace['y'], trace['z'] if 'z' in trace else None, trace['customdata'])
+               if values is not None)
+
+
+# Rendered figures, by hash of the renderer and of what they show
+FIGURE_CACHE = LRUCache(max_bytes=FIGURE_CACHE_BYTES, sizeof=figure_size)
+
+
+def cached_render(render, *args):
+    """
+    render(*args), reusing the figure rendered before for the same arguments (e.g. the same G-code), so that
+    showing a plot again on a Streamlit rerun costs a lookup instead of a parse and a render.
+    The figures are shared: callers must not modify them.
+    """
+    key = content_key(render.__module__, render.__qualname__, *args)
+    figure = FIGURE_CACHE.get(key)
+    if figure is None:
+        figure = render(*args)
+        FIGURE_CACHE.put(key, figure)
+    return figure
+
+
+def user_specification_image(parsed_parameters):
+    """PNG image of plot_user_specification."""
+    plot = plot_user_specification(parsed_parameters)
+    buffer = io.BytesIO()
+    plot.savefig(buffer, format='png', bbox_inches='tight')
+    plot.close()
+    return buffer.getvalue()
+
+
 def plot_user_specification(parsed_parameters):
     """Plots the CNC task in 2D."""
     
@@ -0,0 +1,407 @@
+"""
+Description of this file:
+
+This file contains the assembly of the programs generated by the application into a single program:
+
+- ProgramBuilder accumulates the G-code blocks streamed by the generation graph, one per event. It replaces re-running
+  plot_utils.refine_gcode over the whole accumulated string after every event, which made the assembly quadratic in
+  the number of events: every block is refined once, when it is appended, with the same rules (comments and blank
+  lines removed, M30 only as the last line of the program), and the program text is joined only when it is read. The
+  tape markers ('%') and the program ends (M30) of the blocks are merged: the program starts and ends with a single
+  '%' if any block had one, and ends with M30 if its last block did.
+- assemble_programs merges the programs of the subtasks of a decomposed task, each of which sets the machine up and
+  tears it down again. The program keeps the setup of the first subtask only: between two subtasks, the home returns
+  (G28/G30), the spindle stop/start and coolant off/on pairs, and the setup words repeating the active state (units,
+  plane, distance mode, work offset, tool) are dropped, and a rapid retract to the clearance height is inserted where
+  a dropped home return lifted the tool. Subtasks that change the tool are joined as they are. The merged program is
+  interpreted again and only returned if it makes the same cutting moves as the subtask programs.
+
+The assembly is implemented in plain Python, on top of the tokenizer (ir_utils.py) and the interpreter
+(toolpath_utils.py); the before/after report uses the cycle-time estimator (cycle_time_utils.py).
+
+Authors: Mohamed Abdelaal, Samuel Lokadjaja
+
+This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
+"""
+
+import logging
+from typing import TypedDict
+import numpy as np
+from gllm.utils.ir_utils import WORD_PATTERN
+from gllm.utils.toolpath_utils import interpret_program, RAPID, INCH
+from gllm.utils.cycle_time_utils import estimate_cycle_time, CycleTimeReport, RAPID_RATE
+from gllm.utils.compact_utils import format_number
+
+logger = logging.getLogger(__name__)
+
+# Line delimiting the program on tape and in DNC transfers
+TAPE_MARKER = '%'
+
+# Modal groups of the setup G-codes whose repetition between subtasks is dropped
+SETUP_GROUPS = {**dict.fromkeys((17, 18, 19), 'plane'), **dict.fromkeys((20, 21), 'units'),
+                **dict.fromkeys((40, 41, 42), 'compensation'), **dict.fromkeys((43, 49), 'length offset'),
+                **dict.fromkeys((54, 55, 56, 57, 58, 59), 'work offset'), **dict.fromkeys(range(80, 90), 'cycle'),
+                **dict.fromkeys((90, 91), 'distance'), **dict.fromkeys((93, 94, 95), 'feed mode')}
+
+# Home returns (G28, G30) and program ends (M2, M30)
+HOME_CODES = frozenset([28, 30])
+PROGRAM_ENDS = frozenset([2, 30])
+
+# Decimals of the inserted retracts
+RETRACT_DIGITS = 4
+
+# Fields of the cutting moves that must be the same after merging
+COMPARED_FIELDS = ('motion', 'end', 'feed', 'spindle', 'spindle_direction', 'tool')
+
+
+def block_text(block):
+    """Text of a G-code block: the chains of the chat models return messages, whose content is used, the others text."""
+    block = getattr(block, 'content', block)
+    return block if isinstance(block, str) else str(block)
+
+
+def refined_lines(block):
+    """
+    Lines of a G-code block without comments, blank lines and tape markers, and whether it ends with the program end.
+
+    :param block: Text of the block, or the raw output of the generation chain (a message, whose content is used)
+    :return: (lines, program_end): the refined lines, without any M30 line, and the M30 line if the last line of the
+        block (ignoring tape markers) is one, else None
+    """
+    commands = [command.split(';')[0].strip() for command in block_text(block).splitlines()]
+    last = max((i for i, command in enumerate(commands) if command != TAPE_MARKER), default=-1)
+    lines = []
+    program_end = None
+    for i, command in enumerate(commands):
+        if not command or command == TAPE_MARKER:
+            continue
+        if 'M30' in command:
+            # intermediate program ends would stop the machine before the following blocks
+            if i == last:
+                program_end = command
+            continue
+        lines.append(command)
+    return lines, program_end
+
+
+def join_program(lines, program_end=None, tape_marker=False):
+    """Text of a program from its refined lines, its M30 line (or None) and whether it is delimited by '%'."""
+    lines = lines + ([program_end] if program_end is not None else [])
+    if tape_marker and lines:
+        lines = [TAPE_MARKER] + lines + [TAPE_MARKER]
+    return "\n".join(lines)
+
+
+class ProgramBuilder:
+    """
+    Program assembled from G-code blocks appended one at a time.
+
+    Attributes:
+        lines : Refined lines of all the blocks, without tape markers and program ends
+        program_end : M30 line ending the last block, or None
+        tape_marker : True if any block was delimited by '%'
+        blocks : Number of blocks appended
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.program_end = None
+        self.tape_marker = False
+        self.blocks = 0
+        self._gcode = None
+
+    def __len__(self):
+        return len(self.lines) + (self.program_end is not None)
+
+    def __bool__(self):
+        return bool(self.lines) or self.program_end is not None
+
+    def append(self, block):
+        """Refine a block and append it to the program; returns the builder, so that calls can be chained."""
+        block = block_text(block)
+        lines, self.program_end = refined_lines(block)
+        self.lines.extend(lines)
+        self.tape_marker = self.tape_marker or any(line.strip() == TAPE_MARKER for line in block.splitlines())
+        self.blocks += 1
+        self._gcode = None
+        return self
+
+    @property
+    def gcode(self):
+        """Text of the program, joined on the first read after a change."""
+        if self._gcode is None:
+            self._gcode = join_program(self.lines, self.program_end, self.tape_marker)
+        return self._gcode
+
+    def __str__(self):
+        return self.gcode
+
+
+class AssemblyReport(TypedDict):
+    """
+    Outcome of merging the programs of several subtasks.
+
+    Attributes:
+        programs : Number of subtask programs
+        merged : Number of transitions between subtasks whose setup was merged
+        removed_lines : Number of setup and teardown lines dropped
+        retracts : Number of retracts inserted in place of home returns
+        lines_before, lines_after : Number of lines of the joined and of the merged program
+        before, after : Estimated cycle times of the joined and of the merged program
+        saved : Seconds saved (before total minus after total)
+    """
+
+    programs: int
+    merged: int
+    removed_lines: int
+    retracts: int
+    lines_before: int
+    lines_after: int
+    before: CycleTimeReport
+    after: CycleTimeReport
+    saved: float
+
+
+class SetupState:
+    """
+    Machine setup active at a point of the merged program.
+
+    Attributes:
+        modes : Active G-code of every modal group of SETUP_GROUPS that was programmed
+        spindle, spindle_direction : Programmed spindle speed (None while unknown) and direction (1 for M3, -1 for M4,
+                                     0 when stopped)
+        coolant : True while coolant is on (M7/M8)
+        tool, pending_tool : Tool in the spindle and tool selected by the last T word (None while unknown)
+    """
+
+    def __init__(self):
+        self.modes = {}
+        self.spindle = None
+        self.spindle_direction = 0
+        self.coolant = False
+        self.tool = None
+        self.pending_tool = None
+
+    def update(self, words):
+        """Apply the words of a line of the merged program."""
+        for letter, value in words:
+            if letter == 'G' and value in SETUP_GROUPS:
+                self.modes[SETUP_GROUPS[value]] = value
+            elif letter == 'S':
+                self.spindle = value
+            elif letter == 'T':
+                self.pending_tool = value
+        for letter, value in words:
+            if letter != 'M':
+                continue
+            if value in (3, 4):
+                self.spindle_direction = 1 if value == 3 else -1
+            elif value == 5:
+                self.spindle_direction = 0
+            elif value in (7, 8, 9):
+                self.coolant = value != 9
+            elif value == 6:
+                self.tool = self.pending_tool
+
+
+class SubtaskProgram:
+    """
+    Program of one subtask, split around its moves.
+
+    Attributes:
+        preamble, body, teardown : (line, words) of the lines before the first move, from the first to the last move
+                                   and after the last move (home returns do not count as moves)
+        end_z : Height of the tool at the end of the body, in mm (None if the program has no moves)
+        clearance : Highest rapid height of the body, in mm (None if the program has no moves)
+    """
+
+    def __init__(self, lines):
+        words = [line_words(line) for line in lines]
+        segments = interpret_program("\n".join(lines)).segments
+        moves = segments[[not is_home(words[row]) for row in segments['row']]]
+        self.end_z = self.clearance = None
+        if len(moves) == 0:
+            self.preamble, self.body, self.teardown = [], list(zip(lines, words)), []
+            return
+        first, last = int(moves['row'][0]), int(moves['row'][-1])
+        self.preamble = list(zip(lines[:first], words[:first]))
+        self.body = list(zip(lines[first:last + 1], words[first:last + 1]))
+        self.teardown = list(zip(lines[last + 1:], words[last + 1:]))
+        rapids = moves[moves['motion'] == RAPID]
+        self.end_z = float(moves['end'][-1, 2])
+        self.clearance = float((rapids if len(rapids) else moves)['end'][:, 2].max())
+
+
+def line_words(line):
+    """(letter, value) of every word of a refined line."""
+    return [(letter, float(value)) for letter, value in WORD_PATTERN.findall(line.upper())]
+
+
+def is_home(words):
+    return any(letter == 'G' and value in HOME_CODES for letter, value in words)
+
+
+def starts_spindle(part):
+    return any(letter == 'M' and value in (3, 4) for _, words in part for letter, value in words)
+
+
+def starts_coolant(part):
+    return any(letter == 'M' and value in (7, 8) for _, words in part for letter, value in words)
+
+
+def changes_tool(part, state):
+    return any(letter == 'T' and value != state.tool for _, words in part for letter, value in words)
+
+
+def redundant_teardown(words, following):
+    """True if a teardown line only stops the machine before the preamble of the following subtask starts it again."""
+    if is_home(words):
+        return True
+    for letter, value in words:
+        if letter != 'M':
+            return False
+        if not (value in PROGRAM_ENDS or value == 5 and starts_spindle(following) or
+                value == 9 and starts_coolant(following)):
+            return False
+    return True
+
+
+def redundant_setup(words, state, following):
+    """True if a preamble line only repeats the setup active in the merged program (following: the later lines)."""
+    if is_home(words):
+        return True
+    speed = next((value for letter, value in words if letter == 'S'), state.spindle)
+    for letter, value in words:
+        if letter == 'G':
+            redundant = value in SETUP_GROUPS and state.modes.get(SETUP_GROUPS[value]) == value
+        elif letter == 'S':
+            redundant = value == state.spindle
+        elif letter == 'M' and value in (3, 4):
+            redundant = state.spindle_direction == (1 if value == 3 else -1) and speed == state.spindle
+        elif letter == 'M' and value == 5:
+            # stop/start pair: the spindle is started again before the first move
+            redundant = starts_spindle(following)
+        elif letter == 'M' and value in (7, 8):
+            redundant = state.coolant
+        elif letter == 'M' and value == 9:
+            redundant = starts_coolant(following)
+        elif letter == 'M' and value == 6 or letter == 'T':
+            redundant = state.tool is not None and state.tool == next(
+                (value for letter, value in words if letter == 'T'), state.pending_tool)
+        else:
+            redundant = False
+        if not redundant:
+            return False
+    return True
+
+
+def needs_retract(previous, following, first_words):
+    """True if the tool must be lifted to the clearance height before the following subtask."""
+    clearance = max(previous.clearance, following.clearance)
+    letters = {letter for letter, _ in first_words}
+    # a first move straight up from where the tool is does the retract itself
+    lifts = ('G', 0) in first_words and 'Z' in letters and not letters & {'X', 'Y'}
+    return previous.end_z < clearance and not lifts
+
+
+def retract_line(previous, following, state):
+    scale = INCH if state.modes.get('units') == 20 else 1.0
+    clearance = max(previous.clearance, following.clearance) / scale
+    return f"G00 Z{format_number(clearance, RETRACT_DIGITS)}"
+
+
+def merge_subtasks(subtasks):
+    """
+    Lines of the merged program.
+
+    :return: (lines, merged, removed_lines, retracts)
+    """
+    state = SetupState()
+    lines = []
+    merged = removed = retracts = 0
+    merging = False
+    for index, subtask in enumerate(subtasks):
+        following = subtasks[index + 1] if index + 1 < len(subtasks) else None
+
+        for position, (line, words) in enumerate(subtask.preamble):
+            if merging and redundant_setup(words, state, subtask.preamble[position + 1:]):
+                removed += 1
+                continue
+            lines.append(line)
+            state.update(words)
+        for line, words in subtask.body:
+            lines.append(line)
+            state.update(words)
+
+        # the transition is merged if both subtasks move, with the same tool, in absolute coordinates
+        merging = (following is not None and subtask.end_z is not None and following.end_z is not None and
+                   not changes_tool(following.preamble, state) and state.modes.get('distance') != 91)
+        if not merging:
+            for line, words in subtask.teardown:
+                lines.append(line)
+                state.update(words)
+            continue
+        merged += 1
+        homes = any(is_home(words) for _, words in subtask.teardown + following.preamble)
+        for line, words in subtask.teardown:
+            if redundant_teardown(words, following.preamble) or redundant_setup(words, state, []):
+                removed += 1
+                continue
+            lines.append(line)
+            state.update(words)
+        if homes and needs_retract(subtask, following, following.body[0][1]):
+            lines.append(retract_line(subtask, following, state))
+            retracts += 1
+    return lines, merged, removed, retracts
+
+
+def cutting_moves(gcode):
+    segments = interpret_program(gcode).segments
+    return segments[(segments['motion'] != RAPID) & (segments['length'] > 0)]
+
+
+def same_cuts(programs, merged_gcode):
+    """True if the merged program makes the cutting moves of the subtask programs, in the same order."""
+    original = np.concatenate([cutting_moves(program) for program in programs])
+    merged = cutting_moves(merged_gcode)
+    if len(original) != len(merged):
+        return False
+    return all(np.allclose(original[field], merged[field], rtol=0, atol=1e-6, equal_nan=True)
+               if original[field].dtype.kind == 'f' else np.array_equal(original[field], merged[field])
+               for field in COMPARED_FIELDS)
+
+
+def assemble_programs(programs, rapid_rate=RAPID_RATE):
+    """
+    Merge the programs of the subtasks of a task into one program with a single setup.
+
+    :param programs: G-code strings of the subtasks, in order.
+    :param rapid_rate: Rapid traverse rate in mm/min used for the cycle-time report.
+    :return: (gcode, AssemblyReport): the merged program (the programs joined as they are if merging would change the
+        cuts)
+    """
+    joined = ProgramBuilder()
+    for program in programs:
+        joined.append(program)
+    refined = [refined_lines(program)[0] for program in programs]
+    lines, merged, removed, retracts = merge_subtasks([SubtaskProgram(lines) for lines in refined])
+    merged_gcode = join_program(lines, joined.program_end, joined.tape_marker)
+
+    if merged and not same_cuts(programs, merged_gcode):
+        logger.warning("Merging the subtask programs changed the cuts; they are joined as they are")
+        merged_gcode, merged, removed, retracts = joined.gcode, 0, 0, 0
+    before = estimate_cycle_time(joined.gcode, rapid_rate)
+    after = estimate_cycle_time(merged_gcode, rapid_rate) if merged else before
+    report = AssemblyReport(programs=len(programs), merged=merged, removed_lines=removed, retracts=retracts,
+                            lines_before=len(joined), lines_after=len(merged_gcode.splitlines()), before=before,
+                            after=after, saved=before['total'] - after['total'])
+    return merged_gcode, report
+
+
+def describe_assembly(report):
+    """One-line summary of an AssemblyReport for display."""
+    if not report['merged']:
+        return f"Joined the programs of {report['programs']} subtasks as they are."
+    return (f"Merged the setup of {report['programs']} subtask programs: {report['removed_lines']} setup lines "
+            f"removed, {report['retracts']} retracts inserted, {report['lines_before']} -> {report['lines_after']} "
+            f"lines, estimated cycle time {report['before']['total']:.1f} s -> {report['after']['total']:.1f} s.")
@@ -0,0 +1,548 @@
+"""
+Description of this file:
+
+This file contains the tool path reordering optimizer, which reduces the rapid travel ("air cutting") of programs
+assembled from several independent operations, such as the concatenated subtask programs of multi-shape tasks or the
+holes of a drilling pattern. Two kinds of units are reordered:
+
+- the holes of a canned drilling cycle (a G81-G89 line followed by lines with X/Y words only), visited from the
+  position where the cycle starts;
+- the operations of the program: every operation starts with a rapid XY move above all the cuts (the approach) and
+  ends before the next one, so it does not depend on where the previous operation left the tool. Operations that
+  change the tool, stop the program or touch the coordinate system stay in place and split the program into groups
+  that are reordered separately.
+
+The order is planned as an open travelling salesman path, with the nearest-neighbour heuristic followed by 2-opt
+over a NumPy distance matrix (the distances are asymmetric, from the end of an operation to the start of the next).
+The modal state an operation expects (feed, plane, spindle, retract mode, height) is restored on its approach line
+where its new predecessor leaves a different one, and the reordered program is interpreted again and kept only if
+every operation still produces exactly the same moves (and every hole the same moves within the controller resolution,
+to which the rewritten hole coordinates are rounded; the rapid retract after a hole run may start above a different
+hole, otherwise its last hole stays last).
+
+The optimizer is implemented in Python with NumPy, on top of the IR (ir_utils.py) and the interpreter
+(toolpath_utils.py); the before/after report uses the cycle-time estimator (cycle_time_utils.py).
+
+Authors: Mohamed Abdelaal, Samuel Lokadjaja
+
+This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
+"""
+
+import re
+from typing import TypedDict
+import numpy as np
+from gllm.utils.ir_utils import parse_program, forward_fill, format_word, COMMENT_PATTERN, NO_MOTION, FLAG_ERROR, \
+    FLAG_G20, FLAG_G21, FLAG_G28, FLAG_G43, FLAG_G49, FLAG_G91, FLAG_G92, FLAG_M0, FLAG_M2, FLAG_M6, FLAG_M30
+from gllm.utils.toolpath_utils import interpret_program, ModalState, RAPID, LINEAR, DRILLING_CYCLES, INCH
+from gllm.utils.cycle_time_utils import estimate_cycle_time, CycleTimeReport, RAPID_RATE
+from gllm.utils.compact_utils import RESOLUTION_DIGITS_MM, RESOLUTION_DIGITS_INCH
+
+# Largest number of units planned with 2-opt (its distance matrix holds n^2 floats); larger sets keep the
+# nearest-neighbour order
+TWO_OPT_NODES = 2000
+
+# Largest number of 2-opt passes over the whole path
+TWO_OPT_PASSES = 50
+
+# Smallest saving in mm for which a plan replaces the original order
+MIN_SAVING = 1e-6
+
+# Lines with these flags (or with a T word) keep their operation in place
+BARRIER_FLAGS = FLAG_M0 | FLAG_M2 | FLAG_M6 | FLAG_M30 | FLAG_G43 | FLAG_G49 | FLAG_G92 | FLAG_ERROR
+
+# Segment fields compared between the original and the reordered operations
+COMPARED_FIELDS = ('motion', 'end', 'center', 'radius', 'start_angle', 'sweep', 'plane', 'feed', 'spindle',
+                   'spindle_direction', 'tool')
+
+XY_WORD_PATTERN = re.compile(r'[XY]\s*[+-]?(?:\d+\.?\d*|\.\d+)', re.IGNORECASE)
+
+
+class ReorderReport(TypedDict):
+    """
+    Outcome of reordering a program.
+
+    Attributes:
+        before, after : Estimated cycle times of the original and of the reordered program
+        saved : Seconds saved (before total minus after total)
+        holes : Number of canned-cycle holes in runs that were planned
+        operations : Number of movable operations that were planned
+        reordered : True if the program was changed
+    """
+
+    before: CycleTimeReport
+    after: CycleTimeReport
+    saved: float
+    holes: int
+    operations: int
+    reordered: bool
+
+
+def route_length(order, entry, starts, ends):
+    """Length of the travel from entry through the units in the given order (end of a unit to start of the next)."""
+    order = np.asarray(order)
+    if not len(order):
+        return 0.0
+    travel = np.linalg.norm(starts[order[1:]] - ends[order[:-1]], axis=1).sum()
+    return float(np.linalg.norm(starts[order[0]] - entry) + travel)
+
+
+def nearest_neighbour(entry, starts, ends):
+    """Order visiting, from entry, the unit whose start is nearest to the end of the previous one."""
+    remaining = np.ones(len(starts), dtype=bool)
+    order = np.empty(len(starts), dtype=np.int64)
+    position = entry
+    for step in range(len(starts)):
+        distances = np.linalg.norm(starts - position, axis=1)
+        distances[~remaining] = np.inf
+        order[step] = np.argmin(distances)
+        remaining[order[step]] = False
+        position = ends[order[step]]
+    return order
+
+
+def two_opt(order, entry_distances, distances, passes=TWO_OPT_PASSES):
+    """
+    Improve an open path with fixed entry and free end by reversing sub-paths, best reversal per start first.
+
+    The distances may be asymmetric (distances[i, j] from the end of unit i to the start of unit j): reversing
+    order[i:k+1] also reverses the direction of every edge inside it, which is accounted for with prefix sums of the
+    forward and backward edge lengths.
+    """
+    order = np.array(order)
+    n = len(order)
+    def edge_sums():
+        return (np.concatenate(([0.0], np.cumsum(distances[order[:-1], order[1:]]))),
+                np.concatenate(([0.0], np.cumsum(distances[order[1:], order[:-1]]))))
+
+    for _ in range(passes):
+        improved = False
+        forward, backward = edge_sums()
+        for i in range(n - 1):
+            k = np.arange(i + 1, n)
+            if i == 0:
+                previous_old, previous_new = entry_distances[order[0]], entry_distances[order[k]]
+            else:
+                previous_old, previous_new = distances[order[i - 1], order[i]], distances[order[i - 1], order[k]]
+            following = np.append(order[k[:-1] + 1], order[0])
+            next_old = np.where(k < n - 1, distances[order[k], following], 0.0)
+            next_new = np.where(k < n - 1, distances[order[i], following], 0.0)
+            delta = (previous_new - previous_old + next_new - next_old +
+                     (backward[k] - backward[i]) - (forward[k] - forward[i]))
+            best = int(np.argmin(delta))
+            if delta[best] < -MIN_SAVING:
+                order[i:k[best] + 1] = order[i:k[best] + 1][::-1].copy()
+                forward, backward = edge_sums()
+                improved = True
+        if not improved:
+            break
+    return order
+
+
+def plan_route(entry, starts, ends):
+    """
+    Order of the units minimizing the travel from entry (nearest neighbour, then 2-opt).
+
+    :param entry: Position of the tool before the first unit.
+    :param starts, ends: (N, D) positions where every unit starts and ends.
+    :return: (order, original_length, planned_length); the order is the original one unless the plan is shorter
+    """
+    entry, starts, ends = np.asarray(entry, dtype=float), np.asarray(starts, dtype=float), np.asarray(ends, dtype=float)
+    original = np.arange(len(starts))
+    original_length = route_length(original, entry, starts, ends)
+    if len(starts) < 2:
+        return original, original_length, original_length
+
+    order = nearest_neighbour(entry, starts, ends)
+    if len(starts) <= TWO_OPT_NODES:
+        distances = np.linalg.norm(ends[:, None, :] - starts[None, :, :], axis=2)
+        order = two_opt(order, np.linalg.norm(starts - entry, axis=1), distances)
+    length = route_length(order, entry, starts, ends)
+    if length < original_length - MIN_SAVING:
+        return order, original_length, length
+    return original, original_length, original_length
+
+
+def program_scale(program):
+    """Millimetres per program unit (programs switching units are not reordered)."""
+    return INCH if program.has_flag(FLAG_G20).any() and not program.has_flag(FLAG_G21).any() else 1.0
+
+
+def only_xy_words(line_text):
+    """True if a line holds nothing but X and/or Y words (and comments)."""
+    code = COMMENT_PATTERN.sub('', line_text)
+    return bool(XY_WORD_PATTERN.search(code)) and not XY_WORD_PATTERN.sub('', code).strip()
+
+
+def hole_runs(program, segments):
+    """
+    Runs of canned-cycle holes that can be visited in any order.
+
+    A run starts with any line drilling a hole (e.g. the G81 line defining the cycle) and continues with the lines
+    holding only X/Y words, so that every hole of the run uses the same cycle parameters.
+
+    :return: List of (rows, positions, entry): the rows of the holes, their XY positions in mm and the XY position
+             of the tool before the first hole
+    """
+    modal_motion = forward_fill(program.motion, program.motion != NO_MOTION, NO_MOTION)
+    in_cycle = np.isin(modal_motion, list(DRILLING_CYCLES))
+    # the first feed move of every row is the plunge into the hole
+    feeds = np.flatnonzero(segments['motion'] == LINEAR)
+    hole_rows, first = np.unique(segments['row'][feeds], return_index=True)
+    holes = dict(zip(hole_rows.tolist(), segments['end'][feeds[first], :2]))
+    row_start = dict(zip(*np.unique(segments['row'], return_index=True)))
+
+    runs, run = [], []
+    for row in range(len(program)):
+        is_hole = in_cycle[row] and row in holes
+        if is_hole and run and only_xy_words(program.lines[row]):
+            run.append(row)
+            continue
+        if len(run) > 1:
+            runs.append(run)
+        run = [row] if is_hole else []
+    if len(run) > 1:
+        runs.append(run)
+    return [(rows, np.array([holes[row] for row in rows]), segments['start'][row_start[rows[0]], :2])
+            for rows in runs]
+
+
+def row_segments(segments):
+    """Moves of every row of a program, by row."""
+    rows, first = np.unique(segments['row'], return_index=True)
+    return dict(zip(rows.tolist(), np.split(segments, first[1:])))
+
+
+def same_holes(original, reordered, rows, order, tolerance):
+    """
+    True if a program with a reordered hole run makes the same moves as the original, apart from where the moves
+    following each hole start from.
+
+    The tool leaves the run from a different hole when the last hole changes: the rapid moves after the run (such as
+    the retract of a G80 / G00 Z line) may then end at a different XY position, as long as they do not descend, until
+    a move brings the tool back to the position of the original program. Every other move must be the same.
+
+    :param original, reordered: Moves of the two programs, by row (see row_segments)
+    :param rows, order: Rows of the run and the original hole drilled on each of them
+    """
+    if original.keys() != reordered.keys():
+        return False
+    moved = dict(zip(rows, np.asarray(rows)[order].tolist()))
+    synced = True
+    for row, moves in reordered.items():
+        expected = original[moved.get(row, row)]
+        if not (same_moves(expected, moves, tolerance) if synced else same_rapids(expected, moves, tolerance)):
+            return False
+        if row >= rows[-1]:
+            synced = equal_fields(original[row]['end'][-1], moves['end'][-1], tolerance)
+    return True
+
+
+def same_rapids(original, reordered, tolerance=0.0):
+    """
+    True if two runs of moves are the same rapid moves, apart from their XY start and end positions, and the
+    reordered ones never descend.
+    """
+    if len(original) != len(reordered) or (original['motion'] != RAPID).any() or (reordered['motion'] != RAPID).any():
+        return False
+    return (all(equal_fields(original[field], reordered[field], tolerance) for field in COMPARED_FIELDS
+                if field != 'end') and
+            equal_fields(original['end'][:, 2], reordered['end'][:, 2], tolerance) and
+            bool((reordered['end'][:, 2] >= reordered['start'][:, 2] - tolerance).all()))
+
+
+def hole_orders(entry, positions):
+    """
+    Orders of a hole run to try, shortest travel first: the planned order, then the planned order of the other holes
+    ending with the last hole of the run (which leaves the tool where the original program does).
+    """
+    identity = np.arange(len(positions))
+    order, original_length, _ = plan_route(entry, positions, positions)
+    orders = [order] if not np.array_equal(order, identity) else []
+    pinned = np.append(plan_route(entry, positions[:-1], positions[:-1])[0], len(positions) - 1)
+    if (not np.array_equal(pinned, identity) and not any(np.array_equal(pinned, other) for other in orders) and
+            route_length(pinned, entry, positions, positions) < original_length - MIN_SAVING):
+        orders.append(pinned)
+    return orders
+
+
+def reorder_holes(gcode):
+    """
+    Visit the holes of every canned-cycle run in the order with the shortest travel.
+
+    The hole coordinates are written rounded to the controller resolution, and a run is only reordered if the program
+    still drills the same holes (within the resolution) and makes the same moves after the run (see same_holes); if
+    the shortest order does not, the last hole is kept last.
+
+    :return: (lines, holes): the lines of the program and the number of holes in the runs that were planned
+    """
+    program = parse_program(gcode)
+    lines = list(program.lines)
+    # like incremental programs, programs switching units are not reordered
+    if program.has_flag(FLAG_G91).any() or (program.has_flag(FLAG_G20).any() and program.has_flag(FLAG_G21).any()):
+        return lines, 0
+    segments = interpret_program(program).segments
+    original = row_segments(segments)
+    scale = program_scale(program)
+    digits = RESOLUTION_DIGITS_INCH if scale != 1.0 else RESOLUTION_DIGITS_MM
+    tolerance = 10.0 ** -digits * scale
+
+    planned = 0
+    for rows, positions, entry in hole_runs(program, segments):
+        planned += len(rows)
+        words = []
+        for row, position in zip(rows, positions):
+            # the programmed words, or the coordinates carried from the previous line
+            x = program.X[row] if program.has('X')[row] else position[0] / scale
+            y = program.Y[row] if program.has('Y')[row] else position[1] / scale
+            words.append(f"{format_word('X', round(x, digits))} {format_word('Y', round(y, digits))}")
+        run_lines = [lines[row] for row in rows]
+        definition = XY_WORD_PATTERN.sub('', COMMENT_PATTERN.sub('', lines[rows[0]])).split()
+        for order in hole_orders(entry, positions):
+            for row, hole in zip(rows, order):
+                lines[row] = words[hole]
+            lines[rows[0]] = ' '.join(definition + [lines[rows[0]]])
+            reordered = row_segments(interpret_program('\n'.join(lines)).segments)
+            if same_holes(original, reordered, rows, order, tolerance):
+                original = reordered
+                break
+            for row, line_text in zip(rows, run_lines):
+                lines[row] = line_text
+    return lines, planned
+
+
+class Operation:
+    """
+    Operation of a program: the lines from its approach move up to the next approach.
+
+    Attributes:
+        first, last : Rows of the approach line and of the last line of the operation
+        movable : False if the operation must stay in place (see BARRIER_FLAGS)
+        approach : False for the fixed lines split off the end of an operation (e.g. a tool change)
+        start_state, end_state : Modal state before the approach line and after the last line
+        segments : Moves of the operation
+    """
+
+    def __init__(self, first, last, movable, approach=True):
+        self.first = first
+        self.last = last
+        self.movable = movable
+        self.approach = approach
+        self.start_state = None
+        self.end_state = None
+        self.segments = None
+
+    @property
+    def start(self):
+        return self.segments['end'][0]
+
+    @property
+    def end(self):
+        return np.array(self.end_state.position)
+
+
+def interpret_rows(lines, first, last, state):
+    """Interpret lines[first:last + 1] from the given modal state; returns the Toolpath (with the state after it)."""
+    return interpret_program(parse_program(lines[first:last + 1], first_line=first), state)
+
+
+def split_operations(lines):
+    """
+    Split a program into its preamble, operations and postamble.
+
+    :return: (operations, preamble_state): the operations (empty if the program cannot be reordered safely) and the
+             modal state at the end of the preamble
+    """
+    program = parse_program(lines)
+    if program.has_flag(FLAG_G91).any() or (program.has_flag(FLAG_G20).any() and program.has_flag(FLAG_G21).any()):
+        return [], None
+    segments = interpret_program(program).segments
+    cutting = segments['motion'] != RAPID
+    if not cutting.any():
+        return [], None
+
+    clearance = max(segments['start'][cutting, 2].max(), segments['end'][cutting, 2].max())
+    rows, counts = np.unique(segments['row'], return_counts=True)
+    moves = np.zeros(len(program), dtype=np.int64)
+    moves[rows] = counts
+    modal_motion = forward_fill(program.motion, program.motion != NO_MOTION, NO_MOTION)
+    # an approach is a single rapid move to an absolute XY position, above all the cuts
+    eligible = ((moves == 1) & (modal_motion == RAPID) & program.has('X') & program.has('Y') &
+                ~program.has_flag(FLAG_G28))
+    approach = ((segments['motion'] == RAPID) & (segments['start'][:, 2] >= clearance) &
+                (segments['end'][:, 2] >= clearance) & eligible[segments['row']])
+    approaches = segments['row'][approach]
+
+    # approaches only count if the tool cuts before the next one
+    cut_rows = segments['row'][cutting]
+    bounds = np.append(approaches[1:], len(program))
+    approaches = approaches[np.searchsorted(cut_rows, approaches) < np.searchsorted(cut_rows, bounds)]
+    if not len(approaches):
+        return [], None
+    # the last operation ends once the tool is back above the cuts; if it never is, it stays last
+    last_cut = np.flatnonzero(cutting)[-1]
+    above = np.flatnonzero(segments['end'][last_cut:, 2] >= clearance)
+    end_row = int(segments['row'][last_cut + above[0]]) if len(above) else len(program) - 1
+
+    barrier = program.has_flag(BARRIER_FLAGS) | program.has('T')
+    lasts = np.append(approaches[1:] - 1, end_row)
+    operations = []
+    for first, last in zip(approaches.tolist(), lasts.tolist()):
+        blocked = first + np.flatnonzero(barrier[first:last + 1])
+        if not len(blocked):
+            operations.append(Operation(first, last, True))
+            continue
+        # lines such as a tool change after all the cuts, once the tool is back above them, become a fixed block
+        cuts_before = np.searchsorted(cut_rows, blocked[0]) - np.searchsorted(cut_rows, first)
+        cuts_after = np.searchsorted(cut_rows, last, side='right') - np.searchsorted(cut_rows, blocked[0])
+        before = np.searchsorted(segments['row'], blocked[0]) - 1
+        if cuts_before and not cuts_after and segments['end'][before, 2] >= clearance:
+            operations += [Operation(first, int(blocked[0]) - 1, True), Operation(int(blocked[0]), last, False, False)]
+        else:
+            operations.append(Operation(first, last, False))
+    operations[-1].movable &= len(above) > 0
+
+    state = interpret_rows(lines, 0, approaches[0] - 1, ModalState()).state
+    preamble_state = state.copy()
+    for operation in operations:
+        operation.start_state = state.copy()
+        toolpath = interpret_rows(lines, operation.first, operation.last, state)
+        operation.segments, operation.end_state = toolpath.segments, toolpath.state
+        state = toolpath.state
+    return operations, preamble_state
+
+
+def restore_words(line_text, explicit_rapid, previous, expected, scale):
+    """
+    Approach line of an operation preceded by a state `previous` instead of the state `expected` it was written for:
+    the modal words that differ are added to the line.
+    """
+    prefix, suffix = [], []
+    if previous.motion != RAPID and not explicit_rapid:
+        prefix.append('G00')
+    if previous.plane != expected.plane:
+        prefix.append(f"G{expected.plane}")
+    if previous.retract_to_r != expected.retract_to_r:
+        prefix.append('G99' if expected.retract_to_r else 'G98')
+    if previous.position[2] != expected.position[2] and not re.search(r'Z', COMMENT_PATTERN.sub('', line_text), re.I):
+        suffix.append(format_word('Z', expected.position[2] / scale))
+    if expected.feed == expected.feed and previous.feed != expected.feed:
+        suffix.append(format_word('F', expected.feed / scale))
+    if previous.spindle != expected.spindle:
+        suffix.append(format_word('S', expected.spindle))
+    if previous.spindle_direction != expected.spindle_direction:
+        suffix.append({1: 'M3', -1: 'M4', 0: 'M5'}[expected.spindle_direction])
+    if not prefix and not suffix:
+        return line_text
+    code, separator, comment = line_text.partition(';')
+    return ' '.join(prefix + [code.strip()] + suffix) + (f" ;{comment}" if separator else '')
+
+
+def equal_fields(a, b, tolerance=0.0):
+    """True if two columns of moves are equal, the float ones within the tolerance (the feed is NaN until set)."""
+    a, b = np.asarray(a), np.asarray(b)
+    if a.dtype.kind != 'f':
+        return np.array_equal(a, b)
+    return np.allclose(a, b, rtol=0.0, atol=tolerance, equal_nan=True)
+
+
+def same_moves(original, reordered, tolerance=0.0):
+    """
+    True if two operations make the same moves, apart from where the approach starts from.
+
+    :param tolerance: Largest difference of the float fields (in mm for the coordinates)
+    """
+    if len(original) != len(reordered):
+        return False
+    return (all(equal_fields(original[field], reordered[field], tolerance) for field in COMPARED_FIELDS) and
+            equal_fields(original['start'][1:], reordered['start'][1:], tolerance))
+
+
+def reorder_operations(lines):
+    """
+    Reorder the movable operations of a program to shorten the travel between them.
+
+    :return: (lines, operations): the lines of the program (unchanged if the reordered program would not make the
+             same moves) and the number of movable operations
+    """
+    operations, preamble_state = split_operations(lines)
+    movable = sum(operation.movable for operation in operations)
+    if movable < 2:
+        return lines, movable
+
+    # plan every group of consecutive movable operations from the end of what precedes it
+    sequence, group = [], []
+    for index, operation in enumerate(operations + [None]):
+        if operation is not None and operation.movable:
+            group.append(index)
+            continue
+        if group:
+            entry = operations[group[0] - 1].end if group[0] > 0 else np.array(preamble_state.position)
+            order, _, _ = plan_route(entry, np.array([operations[i].start for i in group]),
+                                     np.array([operations[i].end for i in group]))
+            sequence += [group[i] for i in order]
+            group = []
+        if operation is not None:
+            sequence.append(index)
+    if sequence == list(range(len(operations))):
+        return lines, movable
+
+    program = parse_program(lines)
+    scale = program_scale(program)
+    reordered = list(lines[:operations[0].first])
+    previous = preamble_state
+    for position, index in enumerate(sequence):
+        operation = operations[index]
+        block = list(lines[operation.first:operation.last + 1])
+        moved = (position == 0 and index != 0) or (position > 0 and sequence[position - 1] != index - 1)
+        if moved and operation.approach:
+            block[0] = restore_words(block[0], program.motion[operation.first] == 0, previous, operation.start_state,
+                                     scale)
+        reordered += block
+        previous = operation.end_state
+    postamble = list(lines[operations[-1].last + 1:])
+
+    # keep the plan only if every operation, and the end of the program, still makes the same moves
+    state = interpret_rows(reordered, 0, operations[0].first - 1, ModalState()).state
+    row = operations[0].first
+    for index in sequence:
+        operation = operations[index]
+        toolpath = interpret_rows(reordered, row, row + operation.last - operation.first, state)
+        if not same_moves(operation.segments, toolpath.segments):
+            return lines, movable
+        state, row = toolpath.state, row + operation.last - operation.first + 1
+    original_end = interpret_rows(lines, operations[-1].last + 1, len(lines) - 1, operations[-1].end_state).segments
+    reordered_end = interpret_rows(postamble, 0, len(postamble) - 1, state).segments
+    if not same_moves(original_end, reordered_end):
+        return lines, movable
+    return reordered + postamble, movable
+
+
+def reorder_program(gcode, rapid_rate=RAPID_RATE):
+    """
+    Reorder the holes of canned drilling cycles and the independent operations of a program to minimize the rapid
+    travel between them.
+
+    :param gcode: The G-code string.
+    :param rapid_rate: Rapid traverse rate in mm/min used for the cycle-time report.
+    :return: (gcode, ReorderReport): the reordered program (the original text if nothing could be improved)
+    """
+    lines, holes = reorder_holes(gcode)
+    lines, operations = reorder_operations(lines)
+    reordered_gcode = '\n'.join(lines)
+    reordered = lines != parse_program(gcode).lines
+    if not reordered:
+        reordered_gcode = gcode
+    before = estimate_cycle_time(gcode, rapid_rate)
+    after = estimate_cycle_time(reordered_gcode, rapid_rate) if reordered else before
+    return reordered_gcode, ReorderReport(before=before, after=after, saved=before['total'] - after['total'],
+                                          holes=holes, operations=operations, reordered=reordered)
+
+
+def describe_reorder(report):
+    """One-line summary of a ReorderReport for display."""
+    if not report['reordered']:
+        return "The order of the operations is already the shortest found."
+    before, after = report['before'], report['after']
+    return (f"Reordered {report['operations']} operations and {report['holes']} holes: estimated cycle time "
+            f"{before['total']:.1f} s -> {after['total']:.1f} s (rapid moves {before['rapid']:.1f} s -> "
+            f"{after['rapid']:.1f} s), {report['saved']:.1f} s saved.")
@@ -0,0 +1,227 @@
+"""
+Description of this file:
+
+This file contains the spatial index over the moves of a tool path. The XY regions swept by the tool (every move
+widened by the tool radius) are bucketed once per program into a uniform grid stored in compressed form (one sorted
+list of moves per grid cell), so that the moves near a segment or a box are found by looking at the few grid cells
+it covers instead of scanning all moves. The index answers which machined regions a rapid move crosses and at which
+depth, and which moves enter the keep-out zones of the fixtures and clamps holding the workpiece.
+
+The index is implemented with NumPy; building and querying are vectorized over all segments and queries.
+
+Authors: Mohamed Abdelaal, Samuel Lokadjaja
+
+This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
+"""
+
+import math
+from typing import NamedTuple
+import numpy as np
+from gllm.utils.toolpath_utils import interpret_program, segment_chords, RAPID
+
+# Largest number of grid cells of an index
+MAX_GRID_CELLS = 1 << 20
+
+
+class KeepOutZone(NamedTuple):
+    """
+    Region the tool must never enter, e.g. a clamp or a fixture: an XY rectangle up to the height z_top.
+
+    The tool and its holder extend upwards from the tool tip, so every move whose tool tip is below z_top while
+    the tool overlaps the rectangle collides with the zone.
+    """
+
+    x_min: float
+    y_min: float
+    x_max: float
+    y_max: float
+    z_top: float
+    name: str = ''
+
+
+def parse_keep_out_zones(text):
+    """
+    Keep-out zones given as text, one per line: "x_min, y_min, x_max, y_max, z_top" in mm, optionally followed by a
+    name (e.g. "40, 40, 60, 60, 10, front clamp").
+
+    :raises ValueError: If a line does not describe a zone.
+    """
+    zones = []
+    for line in (text or '').splitlines():
+        fields = [field.strip() for field in line.split(',')]
+        if not any(fields):
+            continue
+        if len(fields) < 5:
+            raise ValueError(f"Keep-out zone '{line.strip()}' needs x_min, y_min, x_max, y_max and z_top")
+        try:
+            bounds = [float(field) for field in fields[:5]]
+        except ValueError:
+            raise ValueError(f"Keep-out zone '{line.strip()}' has a non-numeric bound") from None
+        if bounds[0] > bounds[2] or bounds[1] > bounds[3]:
+            raise ValueError(f"Keep-out zone '{line.strip()}' has its minimum above its maximum")
+        zones.append(KeepOutZone(*bounds, ', '.join(fields[5:])))
+    return zones
+
+
+def point_segment_distances(points, starts, ends):
+    """Distances between points and segments, pairwise, in the dimensions given (XY for the index)."""
+    delta = ends - starts
+    length_squared = np.einsum('ij,ij->i', delta, delta)
+    t = np.einsum('ij,ij->i', points - starts, delta) / np.where(length_squared > 0, length_squared, 1.0)
+    closest = starts + np.clip(t, 0.0, 1.0)[:, None] * delta
+    return np.linalg.norm(points - closest, axis=1)
+
+
+def segment_distances(starts_a, ends_a, starts_b, ends_b):
+    """XY distances between segments a and b, pairwise (0 where they cross)."""
+    def orientation(p, q, r):
+        return np.sign((q[:, 0] - p[:, 0]) * (r[:, 1] - p[:, 1]) - (q[:, 1] - p[:, 1]) * (r[:, 0] - p[:, 0]))
+
+    crossing = ((orientation(starts_a, ends_a, starts_b) * orientation(starts_a, ends_a, ends_b) < 0) &
+                (orientation(starts_b, ends_b, starts_a) * orientation(starts_b, ends_b, ends_a) < 0))
+    distances = np.minimum.reduce([point_segment_distances(starts_a, starts_b, ends_b),
+                                   point_segment_distances(ends_a, starts_b, ends_b),
+                                   point_segment_distances(starts_b, starts_a, ends_a),
+                                   point_segment_distances(ends_b, starts_a, ends_a)])
+    return np.where(crossing, 0.0, distances)
+
+
+def segment_box_distances(starts, ends, low, high):
+    """XY distances between segments and axis-aligned rectangles, pairwise (0 where they overlap)."""
+    corners = [np.column_stack((low[:, 0], low[:, 1])), np.column_stack((high[:, 0], low[:, 1])),
+               np.column_stack((high[:, 0], high[:, 1])), np.column_stack((low[:, 0], high[:, 1]))]
+    distances = [segment_distances(starts, ends, corner, corners[(k + 1) % 4]) for k, corner in enumerate(corners)]
+    inside = np.all((starts >= low) & (starts <= high), axis=1)
+    return np.where(inside, 0.0, np.minimum.reduce(distances))
+
+
+class SegmentGrid:
+    """
+    Uniform grid over the XY regions swept by a set of segments.
+
+    Attributes:
+        starts, ends : XYZ end points of the indexed segments
+        radius : Width added around every segment (e.g. the tool radius)
+        origin, cell_size, shape : Position of the grid corner, cell width and number of cells along X and Y
+        offsets, entries : Segments of every cell c are entries[offsets[c]:offsets[c + 1]]
+    """
+
+    def __init__(self, starts, ends, radius=0.0, cell_size=None):
+        self.starts, self.ends = np.asarray(starts, dtype=float), np.asarray(ends, dtype=float)
+        self.radius = float(radius)
+        low, high = self.bounds(self.starts, self.ends, self.radius)
+        corner = low.min(axis=0) if len(low) else np.zeros(2)
+        extent = (high.max(axis=0) if len(high) else np.zeros(2)) - corner
+        if cell_size is None:
+            # about the size of a typical move, without exceeding MAX_GRID_CELLS
+            lengths = np.hypot(*(self.ends[:, :2] - self.starts[:, :2]).T) if len(self.starts) else np.zeros(1)
+            cell_size = max(float(np.median(lengths)) + 2 * self.radius, 1e-3)
+        cell_size = max(cell_size, math.sqrt(max(extent[0] * extent[1], 0.0) / MAX_GRID_CELLS))
+        self.origin, self.cell_size = corner, float(cell_size)
+        self.shape = (int(extent[0] // self.cell_size) + 1, int(extent[1] // self.cell_size) + 1)
+
+        segment, cell = self.covered_cells(low, high)
+        order = np.argsort(cell, kind='stable')
+        self.entries = segment[order]
+        self.offsets = np.searchsorted(cell[order], np.arange(self.shape[0] * self.shape[1] + 1))
+
+    def __len__(self):
+        return len(self.starts)
+
+    @staticmethod
+    def bounds(starts, ends, margin):
+        return (np.minimum(starts[:, :2], ends[:, :2]) - margin,
+                np.maximum(starts[:, :2], ends[:, :2]) + margin)
+
+    def covered_cells(self, low, high):
+        """(box, cell) for every grid cell overlapped by the given XY boxes (boxes outside the grid are clipped)."""
+        first = np.clip(np.floor((low - self.origin) / self.cell_size), 0, np.array(self.shape) - 1).astype(np.int64)
+        last = np.clip(np.floor((high - self.origin) / self.cell_size), 0, np.array(self.shape) - 1).astype(np.int64)
+        outside = np.any((high < self.origin) | (low > self.origin + np.array(self.shape) * self.cell_size), axis=1)
+        size = np.where(outside[:, None], 0, last - first + 1)
+        counts = size[:, 0] * size[:, 1]
+        box = np.repeat(np.arange(len(low)), counts)
+        offset = np.arange(len(box)) - np.repeat(np.cumsum(counts) - counts, counts)
+        column = first[box, 0] + offset % np.maximum(size[box, 0], 1)
+        row = first[box, 1] + offset // np.maximum(size[box, 0], 1)
+        return box, row * self.shape[0] + column
+
+    def candidates(self, low, high):
+        """
+        (query, segment) pairs of the indexed segments whose grid cells overlap the given XY boxes.
+
+        Every pair is listed once; the pairs still have to be checked exactly.
+        """
+        box, cell = self.covered_cells(np.atleast_2d(low), np.atleast_2d(high))
+        counts = self.offsets[cell + 1] - self.offsets[cell]
+        query = np.repeat(box, counts)
+        position = (np.repeat(self.offsets[cell], counts) + np.arange(counts.sum()) -
+                    np.repeat(np.cumsum(counts) - counts, counts))
+        return np.divmod(np.unique(query * len(self) + self.entries[position]), max(len(self), 1))
+
+    def near_segments(self, starts, ends, radius=0.0):
+        """(query, segment) pairs of query segments whose XY region (widened by radius) meets an indexed region."""
+        starts, ends = np.atleast_2d(starts).astype(float), np.atleast_2d(ends).astype(float)
+        low, high = self.bounds(starts, ends, radius + self.radius)
+        query, segment = self.candidates(low, high)
+        near = segment_distances(starts[query, :2], ends[query, :2], self.starts[segment, :2],
+                                 self.ends[segment, :2]) <= radius + self.radius
+        return query[near], segment[near]
+
+    def near_boxes(self, low, high):
+        """(query, segment) pairs of XY boxes and the indexed regions that overlap them."""
+        low, high = np.atleast_2d(low).astype(float), np.atleast_2d(high).astype(float)
+        query, segment = self.candidates(low, high)
+        near = segment_box_distances(self.starts[segment, :2], self.ends[segment, :2],
+                                     low[query], high[query]) <= self.radius
+        return query[near], segment[near]
+
+
+def cut_index(toolpath, tool_radius):
+    """
+    Index of the regions machined by the feed moves of a tool path (arcs split into chords).
+
+    :return: (SegmentGrid, index) where index[k] is the tool path segment of the k-th indexed chord
+    """
+    index, starts, ends = segment_chords(toolpath.segments)
+    cutting = toolpath.segments['motion'][index] != RAPID
+    return SegmentGrid(starts[cutting], ends[cutting], tool_radius), index[cutting]
+
+
+def crossed_cuts(gcode, tool_radius):
+    """
+    Machined regions crossed by every rapid move of a program.
+
+    :return: (rapid, cut, depth) arrays: the tool path segment of the rapid move, the feed move whose machined
+             region it crosses, and the lowest height of that feed move. Only cuts made before the rapid are listed.
+    """
+    toolpath = interpret_program(gcode)
+    grid, cut_segments = cut_index(toolpath, tool_radius)
+    rapids = np.flatnonzero(toolpath.segments['motion'] == RAPID)
+    query, cut = grid.near_segments(toolpath.segments['start'][rapids], toolpath.segments['end'][rapids], tool_radius)
+    earlier = cut_segments[cut] < rapids[query]
+    depth = np.minimum(grid.starts[cut, 2], grid.ends[cut, 2])
+    return rapids[query][earlier], cut_segments[cut][earlier], depth[earlier]
+
+
+def keep_out_collisions(gcode, zones, tool_radius):
+    """
+    Moves of a program that enter keep-out zones.
+
+    :param zones: KeepOutZone values (or tuples x_min, y_min, x_max, y_max, z_top).
+    :param tool_radius: Radius of the tool in mm.
+    :return: (segment, zone) index pairs, ordered by segment
+    """
+    zones = [KeepOutZone(*zone) for zone in zones]
+    toolpath = interpret_program(gcode)
+    if not zones or not len(toolpath):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    index, starts, ends = segment_chords(toolpath.segments)
+    grid = SegmentGrid(starts, ends, tool_radius)
+    low = np.array([(zone.x_min, zone.y_min) for zone in zones])
+    high = np.array([(zone.x_max, zone.y_max) for zone in zones])
+    zone, chord = grid.near_boxes(low, high)
+    # conservative: the lowest point of the move is taken as its height over the zone
+    below = np.minimum(starts[chord, 2], ends[chord, 2]) < np.array([z.z_top for z in zones])[zone]
+    pairs = np.unique(np.column_stack((index[chord][below], zone[below])), axis=0)
+    return pairs[:, 0], pairs[:, 1]
@@ -0,0 +1,293 @@
+"""
+Description of this file:
+
+This file contains the material-removal simulation used to check rapid moves against the workpiece.
+The stock is a heightmap (Z-buffer): the height of the remaining material on a regular XY grid, built from the
+`Workpiece Dimensions` given by the user with the top surface at Z=0. The feed moves of the interpreted tool path
+(see toolpath_utils.py) carve the stock with a flat end mill, and every rapid move is checked against the material
+left by the moves before it. The moves are rasterized with NumPy: the grid cells covered by the tool along a batch
+of moves are enumerated at once, and the lowest tool height over every cell is computed in closed form.
+
+Authors: Mohamed Abdelaal, Samuel Lokadjaja
+
+This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
+"""
+
+import math
+import numpy as np
+from gllm.utils.toolpath_utils import interpret_program, segment_chords, RAPID
+
+# Grid spacing of the heightmap in mm
+STOCK_RESOLUTION = 0.1
+
+# Largest number of grid cells of the heightmap built around a tool path when no workpiece dimensions are given
+MAX_STOCK_CELLS = 1_000_000
+
+# Radius in mm of the tool assumed when none is given
+TOOL_RADIUS = 1.5
+
+# Depth in mm a rapid move may graze the material before it counts as a collision
+COLLISION_TOLERANCE = 1e-3
+
+# Moves whose height changes by less than this (in mm) are rasterized as constant-height moves
+LEVEL_TOLERANCE = 1e-9
+
+# Largest number of (move, cell) pairs rasterized at once
+RASTER_BATCH_CELLS = 4_000_000
+
+
+class Stock:
+    """
+    Heightmap of the workpiece.
+
+    Attributes:
+        origin : XY position in mm of the corner of the grid
+        resolution : Grid spacing in mm
+        heights : Height of the material top in every cell, shape (rows along Y, columns along X)
+        top : Height of the uncut material
+        bottom : Height of the bottom of the workpiece; the material is never carved below it
+    """
+
+    def __init__(self, length, width, top=0.0, bottom=-math.inf, origin=(0.0, 0.0), resolution=STOCK_RESOLUTION):
+        columns, rows = max(int(math.ceil(length / resolution)), 1), max(int(math.ceil(width / resolution)), 1)
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.resolution = float(resolution)
+        self.heights = np.full((rows, columns), top, dtype=np.float32)
+        self.top = top
+        self.bottom = bottom
+
+    @classmethod
+    def from_dimensions(cls, dimensions, resolution=STOCK_RESOLUTION):
+        """
+        Stock from the parsed `Workpiece Dimensions` (length along X, width along Y and optionally the height),
+        with its corner at the origin and its top at Z=0. Returns None if fewer than two dimensions are given.
+        """
+        if not isinstance(dimensions, (list, tuple)) or len(dimensions) < 2:
+            return None
+        bottom = -float(dimensions[2]) if len(dimensions) > 2 else -math.inf
+        return cls(float(dimensions[0]), float(dimensions[1]), bottom=bottom, resolution=resolution)
+
+    @classmethod
+    def around(cls, segments, margin, top=0.0):
+        """Stock covering the XY extent of a tool path (plus a margin), with its top at `top`."""
+        low, high = path_bounds(segments, margin)
+        extent = high - low
+        resolution = max(STOCK_RESOLUTION, math.sqrt(extent[0] * extent[1] / MAX_STOCK_CELLS))
+        return cls(extent[0], extent[1], top=top, origin=low, resolution=resolution)
+
+    def include(self, segments, margin):
+        """Grow the grid with uncut material until it covers the XY extent of a tool path (plus a margin)."""
+        rows, columns = self.heights.shape
+        low, high = path_bounds(segments, margin)
+        before = np.maximum(np.ceil((np.array(self.origin) - low) / self.resolution), 0).astype(np.int64)
+        after = np.ceil((high - np.array(self.origin)) / self.resolution) - (columns, rows)
+        after = np.maximum(after, 0).astype(np.int64)
+        if before.any() or after.any():
+            self.heights = np.pad(self.heights, ((before[1], after[1]), (before[0], after[0])),
+                                  constant_values=self.top)
+            self.origin = (self.origin[0] - before[0] * self.resolution, self.origin[1] - before[1] * self.resolution)
+
+    def covered_cells(self, starts, ends, tool_radius):
+        """
+        Grid cells whose center the tool covers while moving along straight moves.
+
+        :return: (move, cell, z) for every covered cell: index of the move, flat index of the cell in `heights`,
+                 and lowest height of the tool bottom over the cell during the move
+        """
+        rows, columns = self.heights.shape
+        start, end = (np.asarray(starts, dtype=float) - (*self.origin, 0.0),
+                      np.asarray(ends, dtype=float) - (*self.origin, 0.0))
+        low = np.minimum(start[:, :2], end[:, :2]) - tool_radius
+        high = np.maximum(start[:, :2], end[:, :2]) + tool_radius
+        first = np.maximum(np.ceil(low / self.resolution - 0.5), 0).astype(np.int64)
+        last = np.minimum(np.floor(high / self.resolution - 0.5), (columns - 1, rows - 1)).astype(np.int64)
+        size = np.maximum(last - first + 1, 0)
+        counts = size[:, 0] * size[:, 1]
+
+        move = np.repeat(np.arange(len(start)), counts)
+        offset = np.arange(len(move)) - np.repeat(np.cumsum(counts) - counts, counts)
+        column = first[move, 0] + offset % np.maximum(size[move, 0], 1)
+        row = first[move, 1] + offset // np.maximum(size[move, 0], 1)
+        center = (np.column_stack((column, row)) + 0.5) * self.resolution
+
+        # the tool covers the cell for the parameters t where |a + t d - p| <= r, an interval around the closest t
+        a, d = start[move, :2], end[move, :2] - start[move, :2]
+        length_squared = np.einsum('ij,ij->i', d, d)
+        relative = center - a
+        moving = length_squared > 0
+        closest = np.where(moving, np.einsum('ij,ij->i', relative, d) / np.where(moving, length_squared, 1.0), 0.0)
+        distance_squared = np.maximum(np.einsum('ij,ij->i', relative, relative) - closest**2 * length_squared, 0.0)
+        reach = tool_radius**2 - distance_squared
+        half_width = np.where(moving, np.sqrt(np.maximum(reach, 0.0) / np.where(moving, length_squared, 1.0)), np.inf)
+        t_low = np.maximum(closest - half_width, 0.0)
+        t_high = np.minimum(closest + half_width, 1.0)
+        covered = (reach >= 0) & (t_low <= t_high)
+
+        z_start, z_delta = start[move, 2], end[move, 2] - start[move, 2]
+        z = np.minimum(z_start + t_low * z_delta, z_start + t_high * z_delta)
+        return move[covered], (row * columns + column)[covered], z[covered]
+
+    def batches(self, starts, ends, tool_radius):
+        """
+        Rasterize straight moves in batches of at most RASTER_BATCH_CELLS candidate cells.
+
+        Long moves are first cut into pieces a few tool diameters long, so that diagonal moves do not enumerate
+        the whole bounding box of the move.
+        """
+        piece_length = max(4 * tool_radius, 10 * self.resolution)
+        counts = np.maximum(np.ceil(np.hypot(*(ends[:, :2] - starts[:, :2]).T) / piece_length), 1).astype(np.int64)
+        move = np.repeat(np.arange(len(starts)), counts)
+        offset = np.arange(len(move)) - np.repeat(np.cumsum(counts) - counts, counts)
+        delta = (ends - starts)[move]
+        piece_starts = starts[move] + delta * (offset / counts[move])[:, None]
+        piece_ends = starts[move] + delta * ((offset + 1) / counts[move])[:, None]
+
+        area = ((np.abs(piece_ends[:, 0] - piece_starts[:, 0]) + 2 * tool_radius) *
+                (np.abs(piece_ends[:, 1] - piece_starts[:, 1]) + 2 * tool_radius) / self.resolution**2)
+        batch_of = (np.cumsum(area) // RASTER_BATCH_CELLS).astype(np.int64)
+        for batch in np.unique(batch_of):
+            selected = np.flatnonzero(batch_of == batch)
+            piece, cell, z = self.covered_cells(piece_starts[selected], piece_ends[selected], tool_radius)
+            yield move[selected[piece]], cell, z
+
+    def row_intervals(self, starts, ends, tool_radius):
+        """
+        Grid cells covered by the tool along straight moves, as one interval of columns per grid row.
+
+        On every row, the region swept by the tool (the segment widened by the tool radius, a convex shape) is
+        bounded by its two end discs and by the rectangle around the segment.
+
+        :return: (move, row, first_column, last_column) of every non-empty interval
+        """
+        rows, columns = self.heights.shape
+        origin = np.array(self.origin)
+        a, b = starts[:, :2] - origin, ends[:, :2] - origin
+        first = np.maximum(np.ceil((np.minimum(a[:, 1], b[:, 1]) - tool_radius) / self.resolution - 0.5), 0)
+        last = np.minimum(np.floor((np.maximum(a[:, 1], b[:, 1]) + tool_radius) / self.resolution - 0.5), rows - 1)
+        counts = np.maximum(last - first + 1, 0).astype(np.int64)
+        move = np.repeat(np.arange(len(a)), counts)
+        row = first.astype(np.int64)[move] + np.arange(len(move)) - np.repeat(np.cumsum(counts) - counts, counts)
+        y = (row + 0.5) * self.resolution
+        a, b = a[move], b[move]
+
+        left, right = np.full(len(move), np.inf), np.full(len(move), -np.inf)
+        for center in (a, b):
+            reach = tool_radius**2 - (y - center[:, 1])**2
+            half_width = np.sqrt(np.maximum(reach, 0.0))
+            left = np.where(reach >= 0, np.minimum(left, center[:, 0] - half_width), left)
+            right = np.where(reach >= 0, np.maximum(right, center[:, 0] + half_width), right)
+
+        delta = b - a
+        length = np.hypot(delta[:, 0], delta[:, 1])
+        scale = tool_radius / np.where(length > 0, length, 1.0)
+        normal = np.column_stack((-delta[:, 1], delta[:, 0])) * scale[:, None]
+        corners = (a + normal, b + normal, b - normal, a - normal)
+        for p, q in zip(corners, corners[1:] + corners[:1]):
+            rise = q[:, 1] - p[:, 1]
+            crosses = (length > 0) & (rise != 0) & ((p[:, 1] - y) * (q[:, 1] - y) <= 0)
+            x = p[:, 0] + (y - p[:, 1]) * (q[:, 0] - p[:, 0]) / np.where(rise != 0, rise, 1.0)
+            left = np.where(crosses, np.minimum(left, x), left)
+            right = np.where(crosses, np.maximum(right, x), right)
+
+        with np.errstate(invalid='ignore'):
+            first_column = np.maximum(np.ceil(left / self.resolution - 0.5), 0)
+            last_column = np.minimum(np.floor(right / self.resolution - 0.5), columns - 1)
+        valid = np.isfinite(left) & (first_column <= last_column)
+        return move[valid], row[valid], first_column[valid].astype(np.int64), last_column[valid].astype(np.int64)
+
+    def carve(self, starts, ends, tool_radius):
+        """Remove the material swept by a flat end mill along straight moves (in any order)."""
+        starts, ends = np.asarray(starts, dtype=float), np.asarray(ends, dtype=float)
+        level = np.abs(ends[:, 2] - starts[:, 2]) < LEVEL_TOLERANCE
+
+        # moves at a constant height: union of the covered intervals per height, with a difference array per row
+        move, row, first_column, last_column = self.row_intervals(starts[level], ends[level], tool_radius)
+        z = np.maximum(starts[level][move, 2], self.bottom)
+        for height in np.unique(z):
+            selected = z == height
+            low, high = row[selected].min(), row[selected].max() + 1
+            coverage = np.zeros((high - low, self.heights.shape[1] + 1), dtype=np.int32)
+            np.add.at(coverage, (row[selected] - low, first_column[selected]), 1)
+            np.add.at(coverage, (row[selected] - low, last_column[selected] + 1), -1)
+            covered = np.cumsum(coverage[:, :-1], axis=1) > 0
+            band = self.heights[low:high]
+            np.minimum(band, np.float32(height), out=band, where=covered)
+
+        # ramps and plunges: lowest tool height per covered cell
+        heights = self.heights.reshape(-1)
+        for _, cell, z in self.batches(starts[~level], ends[~level], tool_radius):
+            np.minimum.at(heights, cell, np.maximum(z, self.bottom).astype(np.float32))
+
+    def collisions(self, starts, ends, tool_radius, tolerance=COLLISION_TOLERANCE):
+        """Boolean mask of the straight moves along which the tool would enter the remaining material."""
+        starts, ends = np.asarray(starts, dtype=float), np.asarray(ends, dtype=float)
+        hits = np.zeros(len(starts), dtype=bool)
+        level = np.flatnonzero(np.abs(ends[:, 2] - starts[:, 2]) < LEVEL_TOLERANCE)
+        others = np.flatnonzero(np.abs(ends[:, 2] - starts[:, 2]) >= LEVEL_TOLERANCE)
+
+        # moves at a constant height: highest material over every covered interval
+        move, row, first_column, last_column = self.row_intervals(starts[level], ends[level], tool_radius)
+        if len(move):
+            columns = self.heights.shape[1]
+            bounds = np.column_stack((row * columns + first_column, row * columns + last_column + 1)).reshape(-1)
+            highest = np.maximum.reduceat(np.append(self.heights.reshape(-1), -np.inf), bounds)[::2]
+            hits[level[move[starts[level][move, 2] < highest - tolerance]]] = True
+
+        heights = self.heights.reshape(-1)
+        for move, cell, z in self.batches(starts[others], ends[others], tool_radius):
+            hits[others[move[z < heights[cell] - tolerance]]] = True
+        return hits
+
+    def volume(self, top=0.0):
+        """Volume of material in mm^3 removed below `top`."""
+        removed = np.maximum(top - self.heights, 0.0)
+        return float(removed.sum()) * self.resolution**2
+
+
+def path_bounds(segments, margin):
+    """Lower and upper XY corners of the tool path segments, widened by a margin."""
+    if not len(segments):
+        return np.zeros(2), np.zeros(2)
+    points = np.concatenate((segments['start'][:, :2], segments['end'][:, :2]))
+    return points.min(axis=0) - margin, points.max(axis=0) + margin
+
+
+def simulate_stock(toolpath, stock, tool_radius=TOOL_RADIUS):
+    """
+    Run a tool path over the stock: feed moves carve it, rapid moves are checked against the remaining material.
+
+    Consecutive feed moves are carved together and consecutive rapids are checked together, so the simulation
+    loops only over the alternations between cutting and rapid positioning.
+
+    :param toolpath: Toolpath of the program (see toolpath_utils.interpret_program).
+    :param stock: Stock, modified in place.
+    :param tool_radius: Radius of the flat end mill in mm.
+    :return: Indices of the segments of the tool path that rapid through material, in order
+    """
+    segments = toolpath.segments
+    index, starts, ends = segment_chords(segments)
+    is_rapid = segments['motion'][index] == RAPID
+    run_starts = np.flatnonzero(np.concatenate(([True], is_rapid[1:] != is_rapid[:-1]))) if len(index) else []
+    run_ends = np.append(run_starts[1:], len(index))
+
+    collisions = []
+    for first, last in zip(run_starts, run_ends):
+        if is_rapid[first]:
+            hits = stock.collisions(starts[first:last], ends[first:last], tool_radius)
+            collisions.extend(np.unique(index[first:last][hits]).tolist())
+        else:
+            stock.carve(starts[first:last], ends[first:last], tool_radius)
+    return collisions
+
+
+def find_rapid_collisions(gcode, workpiece_dimensions=None, tool_radius=TOOL_RADIUS, top=0.0):
+    """
+    Segments of the tool path of a program that rapid through the workpiece.
+
+    :param workpiece_dimensions: Parsed `Workpiece Dimensions`; without them, the material is assumed to fill
+                                 the whole area of the tool path below `top`.
+    :return: Indices of the colliding segments in the tool path of the program
+    """
+    toolpath = interpret_program(gcode)
+    stock = Stock.from_dimensions(workpiece_dimensions) or Stock.around(toolpath.segments, tool_radius, top=top)
+    return simulate_stock(toolpath, stock, tool_radius)
@@ -0,0 +1,396 @@
+"""
+Description of this file:
+
+This file contains the modal G-code interpreter that turns a parsed program (see ir_utils.py) into a 3D tool path.
+It keeps the modal state of the machine (motion mode, G90/G91, G20/G21, G17/G18/G19 plane, feed, spindle, tool and
+canned cycles) while walking the program once, and emits a segment table stored as a NumPy structured array.
+The same tool path is shared by plotting, validation and cycle-time estimation; it is cached on the parsed program so
+that the program is interpreted only once.
+
+The interpreter is implemented in Python and uses NumPy for the segment table and for sampling points along it.
+
+Authors: Mohamed Abdelaal, Samuel Lokadjaja
+
+This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
+"""
+
+import math
+import numpy as np
+from gllm.utils.ir_utils import as_program, iter_program_chunks, AXIS_WORDS, CHUNK_LINES, FLAG_EMPTY, FLAG_ERROR, \
+    FLAG_G90, FLAG_G91, FLAG_G20, FLAG_G21, FLAG_G17, FLAG_G18, FLAG_G19, FLAG_G28, FLAG_G92, FLAG_G4, FLAG_G98, \
+    FLAG_G99, FLAG_M2, FLAG_M3, FLAG_M4, FLAG_M5, FLAG_M6, FLAG_M30
+
+# Motion types of the segments
+RAPID = 0
+LINEAR = 1
+CW_ARC = 2
+CCW_ARC = 3
+
+# Canned drilling cycles, expanded into rapid and linear segments
+DRILLING_CYCLES = frozenset([73, 81, 82, 83, 85, 86, 89])
+FEED_RETRACT_CYCLES = frozenset([85, 89])
+
+INCH = 25.4
+
+# In-plane axes and normal axis (0=X, 1=Y, 2=Z) of the arc planes, ordered so that the normal points towards +
+PLANE_AXES = {17: (0, 1, 2), 18: (2, 0, 1), 19: (1, 2, 0)}
+# Words giving the arc center offsets along the in-plane axes
+PLANE_OFFSETS = {17: ('I', 'J'), 18: ('K', 'I'), 19: ('J', 'K')}
+
+# Maximum distance in mm between an arc and the chords it is drawn with
+CHORD_TOLERANCE = 0.01
+
+SEGMENT_DTYPE = np.dtype([
+    ('row', np.int64),                  # source line of the move
+    ('motion', np.int8),                # RAPID, LINEAR, CW_ARC or CCW_ARC
+    ('start', np.float64, (3,)),        # XYZ in mm
+    ('end', np.float64, (3,)),
+    ('center', np.float64, (3,)),       # arc center, at the start height along the plane normal
+    ('radius', np.float64),
+    ('start_angle', np.float64),        # angle of the start point in the arc plane
+    ('sweep', np.float64),              # signed swept angle, counterclockwise positive
+    ('plane', np.int8),                 # 17, 18 or 19
+    ('feed', np.float64),               # mm/min, NaN until a feed rate is programmed
+    ('spindle', np.float64),            # rpm, 0 while the spindle is stopped
+    ('spindle_direction', np.int8),     # 1 for M3, -1 for M4, 0 when stopped
+    ('tool', np.int32),                 # active tool, -1 before the first tool change
+    ('length', np.float64),             # path length in mm
+])
+
+
+class ModalState:
+    """
+    Modal state of the machine between two lines of a program.
+
+    Attributes:
+        position : Current XYZ position in mm
+        motion : Active motion mode (G0-G3 or a canned cycle), None after G80
+        absolute : G90 (True) or G91 (False)
+        inches : G20 (True) or G21 (False)
+        plane : Active arc plane (17, 18 or 19)
+        feed : Feed rate in mm/min
+        spindle, spindle_direction : Programmed spindle speed and direction (0 when stopped)
+        tool, pending_tool : Active tool and tool selected by the last T word
+        retract_to_r : G99 (True) or G98 (False) for canned cycles
+        cycle_r, cycle_z, cycle_initial_z : Sticky R level, depth and initial height of the active canned cycle
+        ended : True once M2/M30 has been executed
+    """
+
+    __slots__ = ('position', 'motion', 'absolute', 'inches', 'plane', 'feed', 'spindle', 'spindle_direction',
+                 'tool', 'pending_tool', 'retract_to_r', 'cycle_r', 'cycle_z', 'cycle_initial_z', 'ended')
+
+    def __init__(self, position=(0.0, 0.0, 0.0)):
+        self.position = list(position)
+        self.motion = None
+        self.absolute = True
+        self.inches = False
+        self.plane = 17
+        self.feed = math.nan
+        self.spindle = 0.0
+        self.spindle_direction = 0
+        self.tool = -1
+        self.pending_tool = -1
+        self.retract_to_r = False
+        self.cycle_r = math.nan
+        self.cycle_z = math.nan
+        self.cycle_initial_z = math.nan
+        self.ended = False
+
+    def copy(self):
+        state = ModalState(self.position)
+        for name in self.__slots__[1:]:
+            setattr(state, name, getattr(self, name))
+        return state
+
+
+class Toolpath:
+    """
+    Interpreted tool path of a program.
+
+    Attributes:
+        segments : Structured array of SEGMENT_DTYPE, one entry per move
+        state : Modal state after the last interpreted line
+    """
+
+    def __init__(self, segments, state):
+        self.segments = segments
+        self.state = state
+
+    def __len__(self):
+        return len(self.segments)
+
+    def points(self, arc_points=None, chord_tolerance=CHORD_TOLERANCE, return_index=False):
+        """
+        Vertices of the tool path as an (N, 3) array: the end point of every straight move and points from start to
+        end along every arc, spaced so that the chords between them stay within `chord_tolerance` of the arc.
+
+        :param arc_points: Fixed number of points per arc, overriding the chord tolerance.
+        :param chord_tolerance: Maximum distance in mm between an arc and its chords.
+        :param return_index: Also return the segment of every vertex, as (index, points).
+        """
+        segments = self.segments
+        is_arc = segments['motion'] >= CW_ARC
+        if arc_points is None:
+            arc_points = arc_chord_counts(segments['radius'], segments['sweep'], chord_tolerance) + 1
+        counts = np.where(is_arc, arc_points, 1)
+        index = np.repeat(np.arange(len(segments)), counts)
+        offsets = np.arange(len(index)) - np.repeat(np.cumsum(counts) - counts, counts)
+        t = np.where(is_arc[index], offsets / np.maximum(counts[index] - 1, 1), 1.0)
+        points = segment_points(segments, index, t)
+        return (index, points) if return_index else points
+
+
+def arc_chord_counts(radius, sweep, chord_tolerance=CHORD_TOLERANCE):
+    """Number of equal chords needed for every arc so that no chord is further than chord_tolerance from its arc."""
+    # a chord spanning the angle a lies at most radius * (1 - cos(a / 2)) from the arc
+    ratio = np.clip(1 - chord_tolerance / np.maximum(radius, np.finfo(float).tiny), -1.0, 1.0)
+    max_angle = 2 * np.arccos(ratio)
+    return np.maximum(np.ceil(np.abs(sweep) / max_angle), 1).astype(np.int64)
+
+
+def segment_chords(segments, split=None, chord_tolerance=CHORD_TOLERANCE):
+    """
+    Straight pieces of the segments: arcs are split into chords within chord_tolerance of the arc.
+
+    :param split: Optional mask of the arcs to split (by default all of them); other segments are kept whole.
+    :return: (index, starts, ends) with the segment index and the XYZ end points of every piece
+    """
+    if split is None:
+        split = segments['motion'] >= CW_ARC
+    counts = np.where(split, arc_chord_counts(segments['radius'], segments['sweep'], chord_tolerance), 1)
+    index = np.repeat(np.arange(len(segments)), counts)
+    offsets = np.arange(len(index)) - np.repeat(np.cumsum(counts) - counts, counts)
+    pieces = split[index]
+    t0 = np.where(pieces, offsets / counts[index], 0.0)
+    t1 = np.where(pieces, (offsets + 1) / counts[index], 1.0)
+    starts = np.where(pieces[:, None], segment_points(segments, index, t0), segments['start'][index])
+    ends = np.where(pieces[:, None], segment_points(segments, index, t1), segments['end'][index])
+    return index, starts, ends
+
+
+def segment_points(segments, index, t):
+    """Points at parameter t in [0, 1] along the segments `index` (straight lines, arcs and helices)."""
+    segment = segments[index]
+    t = np.asarray(t, dtype=float)
+    points = segment['start'] + (segment['end'] - segment['start']) * t[:, None]
+
+    is_arc = segment['motion'] >= CW_ARC
+    if is_arc.any():
+        arcs = segment[is_arc]
+        axes = np.array([PLANE_AXES[plane] for plane in arcs['plane']]).reshape(-1, 3)
+        rows = np.arange(len(arcs))
+        angle = arcs['start_angle'] + arcs['sweep'] * t[is_arc]
+        arc_points = points[is_arc]
+        arc_points[rows, axes[:, 0]] = arcs['center'][rows, axes[:, 0]] + arcs['radius'] * np.cos(angle)
+        arc_points[rows, axes[:, 1]] = arcs['center'][rows, axes[:, 1]] + arcs['radius'] * np.sin(angle)
+        points[is_arc] = arc_points
+    return points
+
+
+def arc_geometry(start, end, motion, i_offset=None, j_offset=None, radius=None):
+    """
+    Center, radius, start angle and signed sweep of a G02 (clockwise) / G03 (counterclockwise) arc in its plane.
+
+    The center is given either by the offsets from the start point or by the radius R (negative R selects the
+    major arc). An arc ending at its start point is a full circle.
+    """
+    start, end = np.asarray(start, dtype=float), np.asarray(end, dtype=float)
+    clockwise = motion == CW_ARC
+    if radius is None:
+        center = start + (i_offset or 0.0, j_offset or 0.0)
+    else:
+        chord = end - start
+        chord_length = np.hypot(*chord)
+        if chord_length == 0:
+            raise ValueError("An R-form arc needs distinct start and end points")
+        offset = math.sqrt(max(radius ** 2 - (chord_length / 2) ** 2, 0.0))
+        left_normal = np.array([-chord[1], chord[0]]) / chord_length
+        # the minor arc turns around a center on its left when counterclockwise
+        side = 1.0 if clockwise == (radius < 0) else -1.0
+        center = (start + end) / 2 + side * offset * left_normal
+
+    arc_radius = float(np.hypot(*(start - center)))
+    start_angle = math.atan2(start[1] - center[1], start[0] - center[0])
+    end_angle = math.atan2(end[1] - center[1], end[0] - center[0])
+    if np.allclose(start, end):
+        sweep = -2 * math.pi if clockwise else 2 * math.pi
+    elif clockwise:
+        sweep = -((start_angle - end_angle) % (2 * math.pi))
+    else:
+        sweep = (end_angle - start_angle) % (2 * math.pi)
+    return center, arc_radius, start_angle, sweep
+
+
+def interpret_program(gcode, state=None):
+    """
+    Interpret a G-code program into a 3D tool path.
+
+    :param gcode: The G-code string or a parsed GCodeProgram.
+    :param state: Modal state to start from (e.g. the state at the end of the previous part of a program).
+                  Without it, the machine starts at the origin and the result is cached on the parsed program.
+    :return: Toolpath
+    """
+    program = as_program(gcode)
+    if state is None and 'toolpath' in program.derived:
+        return program.derived['toolpath']
+
+    cached = state is None
+    state = ModalState() if state is None else state.copy()
+    segments = []
+
+    def move(row, motion, target, center=(0.0, 0.0, 0.0), radius=0.0, start_angle=0.0, sweep=0.0):
+        start = tuple(state.position)
+        if motion >= CW_ARC:
+            normal = PLANE_AXES[state.plane][2]
+            length = math.hypot(radius * sweep, target[normal] - start[normal])
+        else:
+            length = math.dist(start, target)
+        segments.append((program.line[row], motion, start, tuple(target), tuple(center), radius, start_angle, sweep,
+                         state.plane, state.feed, state.spindle if state.spindle_direction else 0.0,
+                         state.spindle_direction, state.tool, length))
+        state.position = list(target)
+
+    columns = {letter: getattr(program, letter).tolist() for letter in AXIS_WORDS}
+    motions = program.motion.tolist()
+    flags = program.flags.tolist()
+
+    for row in range(len(program)):
+        if state.ended:
+            break
+        row_flags = flags[row]
+        if row_flags & (FLAG_EMPTY | FLAG_ERROR):
+            continue
+        words = {letter: columns[letter][row] for letter in AXIS_WORDS if columns[letter][row] == columns[letter][row]}
+
+        # non-motion modal state, in execution order
+        if row_flags & FLAG_G20:
+            state.inches = True
+        if row_flags & FLAG_G21:
+            state.inches = False
+        scale = INCH if state.inches else 1.0
+        if 'F' in words:
+            state.feed = words['F'] * scale
+        if 'S' in words:
+            state.spindle = words['S']
+        if 'T' in words:
+            state.pending_tool = int(words['T'])
+        if row_flags & FLAG_M6:
+            state.tool = state.pending_tool
+        if row_flags & FLAG_M3:
+            state.spindle_direction = 1
+        if row_flags & FLAG_M4:
+            state.spindle_direction = -1
+        if row_flags & FLAG_M5:
+            state.spindle_direction = 0
+        for flag, plane in ((FLAG_G17, 17), (FLAG_G18, 18), (FLAG_G19, 19)):
+            if row_flags & flag:
+                state.plane = plane
+        if row_flags & FLAG_G90:
+            state.absolute = True
+        if row_flags & FLAG_G91:
+            state.absolute = False
+        if row_flags & FLAG_G98:
+            state.retract_to_r = False
+        if row_flags & FLAG_G99:
+            state.retract_to_r = True
+
+        def target_of(axis_words):
+            target = list(state.position)
+            for axis, letter in enumerate('XYZ'):
+                if letter in axis_words:
+                    value = axis_words[letter] * scale
+                    target[axis] = value if state.absolute else target[axis] + value
+            return target
+
+        axis_words = {letter: words[letter] for letter in 'XYZ' if letter in words}
+        if row_flags & FLAG_G28:
+            # return home, through the intermediate point given by the axis words
+            if axis_words:
+                move(row, RAPID, target_of(axis_words))
+            home = [0.0 if letter in axis_words or not axis_words else state.position[axis]
+                    for axis, letter in enumerate('XYZ')]
+            move(row, RAPID, home)
+        elif row_flags & (FLAG_G92 | FLAG_G4):
+            # axis words of G92 and G4 are not moves
+            pass
+        else:
+            motion = motions[row]
+            if motion >= 0:
+                state.motion = None if motion == 80 else motion
+                if motion in DRILLING_CYCLES:
+                    state.cycle_initial_z = state.position[2]
+            offsets = PLANE_OFFSETS[state.plane]
+            has_arc_words = 'R' in words or offsets[0] in words or offsets[1] in words
+
+            if state.motion in (RAPID, LINEAR) and axis_words:
+                move(row, state.motion, target_of(axis_words))
+            elif state.motion in (CW_ARC, CCW_ARC) and (axis_words or has_arc_words):
+                interpret_arc(row, state, words, target_of(axis_words), scale, move)
+            elif state.motion in DRILLING_CYCLES and (axis_words or motion >= 0):
+                interpret_cycle(row, state, words, target_of({k: v for k, v in axis_words.items() if k != 'Z'}), scale, move)
+
+        if row_flags & (FLAG_M2 | FLAG_M30):
+            state.ended = True
+
+    toolpath = Toolpath(np.array(segments, dtype=SEGMENT_DTYPE), state)
+    if cached:
+        program.derived['toolpath'] = toolpath
+    return toolpath
+
+
+def iter_toolpath(lines, chunk_size=CHUNK_LINES):
+    """
+    Interpret a program read line by line (from an open file, an iterator or a pathlib.Path), yielding one Toolpath per chunk of lines.
+
+    The modal state is carried from one chunk to the next, so the concatenated segments equal those of
+    interpret_program on the whole program while only one chunk is held in memory.
+    """
+    state = ModalState()
+    for chunk in iter_program_chunks(lines, chunk_size):
+        toolpath = interpret_program(chunk, state)
+        state = toolpath.state
+        yield toolpath
+        if state.ended:
+            break
+
+
+def interpret_arc(row, state, words, target, scale, move):
+    """Append a circular (or helical) move in the active plane."""
+    first, second, normal = PLANE_AXES[state.plane]
+    offset_words = PLANE_OFFSETS[state.plane]
+    start2 = (state.position[first], state.position[second])
+    end2 = (target[first], target[second])
+    try:
+        center2, radius, start_angle, sweep = arc_geometry(
+            start2, end2, state.motion,
+            i_offset=words.get(offset_words[0], 0.0) * scale,
+            j_offset=words.get(offset_words[1], 0.0) * scale,
+            radius=words['R'] * scale if 'R' in words else None)
+    except ValueError:
+        # degenerate arc, executed as a straight move
+        move(row, LINEAR, target)
+        return
+    center = [0.0, 0.0, 0.0]
+    center[first], center[second], center[normal] = center2[0], center2[1], state.position[normal]
+    move(row, state.motion, target, center, radius, start_angle, sweep)
+
+
+def interpret_cycle(row, state, words, target, scale, move):
+    """Expand one hole of a canned drilling cycle into rapid and feed moves."""
+    z_now = state.position[2]
+    if 'R' in words:
+        state.cycle_r = words['R'] * scale if state.absolute else z_now + words['R'] * scale
+    if 'Z' in words:
+        state.cycle_z = words['Z'] * scale if state.absolute else state.cycle_r + words['Z'] * scale
+    r_level = state.cycle_r if state.cycle_r == state.cycle_r else z_now
+    depth = state.cycle_z if state.cycle_z == state.cycle_z else r_level
+    initial_z = state.cycle_initial_z if state.cycle_initial_z == state.cycle_initial_z else z_now
+
+    if z_now < r_level:
+        move(row, RAPID, [state.position[0], state.position[1], r_level])
+    move(row, RAPID, [target[0], target[1], state.position[2]])
+    if state.position[2] != r_level:
+        move(row, RAPID, [target[0], target[1], r_level])
+    move(row, LINEAR, [target[0], target[1], depth])
+    retract = LINEAR if state.motion in FEED_RETRACT_CYCLES else RAPID
+    move(row, retract, [target[0], target[1], r_level if state.retract_to_r else max(initial_z, r_level)])
@@ -0,0 +1,96 @@
+"""
+Description of this file:
+
+This file contains the logging and tracing layer shared by the modules of gllm.utils.
+Messages go through the standard `logging` module (loggers named after the modules, below the "gllm" logger), so that
+output costs nothing unless the level is enabled. In addition, timed spans (e.g. one per validator with the number
+of lines checked and the duration) are recorded as structured records on the "gllm.trace" logger and can be turned on
+for a single request with the `tracing` context manager, without changing the global log level.
+
+The utilities are implemented in Python on top of the standard logging and contextvars modules.
+
+Authors: Mohamed Abdelaal, Samuel Lokadjaja
+
+This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
+"""
+
+import time
+import logging
+import contextlib
+import contextvars
+
+trace_logger = logging.getLogger('gllm.trace')
+
+# Spans of the request being traced, or None when tracing is off for the current context
+_request_spans = contextvars.ContextVar('gllm_request_spans', default=None)
+
+
+# Console handler of the "gllm" logger, added once by configure_logging
+_console_handler = logging.StreamHandler()
+_console_handler.setFormatter(logging.Formatter('%(message)s'))
+
+
+def configure_logging(level=logging.INFO):
+    """
+    Print the messages of gllm to the console, as the command-line and Streamlit entry points expect.
+
+    Only the "gllm" logger is configured: the levels and handlers of the other libraries (and of the root logger) are
+    left as they are. Calling it again, e.g. on every Streamlit rerun, only updates the level.
+    """
+    gllm_logger = logging.getLogger('gllm')
+    gllm_logger.setLevel(level)
+    if _console_handler not in gllm_logger.handlers:
+        gllm_logger.addHandler(_console_handler)
+
+
+@contextlib.contextmanager
+def tracing():
+    """
+    Record the spans of everything run inside the block, for the current request only.
+
+    Yields the list the spans are appended to; every span is a dict with at least `name` and `seconds`.
+    """
+    spans = []
+    token = _request_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _request_spans.reset(token)
+
+
+def tracing_enabled():
+    """Whether spans are recorded, i.e. inside `tracing` or with the gllm.trace logger enabled for DEBUG."""
+    return _request_spans.get() is not None or trace_logger.isEnabledFor(logging.DEBUG)
+
+
+def record_span(name, seconds, **fields):
+    """Record a span whose duration was already measured (no-op when tracing is off)."""
+    spans = _request_spans.get()
+    if spans is None and not trace_logger.isEnabledFor(logging.DEBUG):
+        return
+    span = {'name': name, 'seconds': seconds, **fields}
+    if spans is not None:
+        spans.append(span)
+    trace_logger.debug("span %s %.6fs %s", name, seconds, fields, extra={'span': span})
+
+
+@contextlib.contextmanager
+def span(name, **fields):
+    """
+    Time the block as a span. Yields the dict of fields, so that the block can add values it computes (e.g. lines).
+
+    When tracing is off, the block runs without being timed.
+    """
+    if not tracing_enabled():
+        yield fields
+        return
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        record_span(name, time.perf_counter() - start, **fields)
+
+
+def format_server_timing(spans):
+    """Format spans as the value of an HTTP Server-Timing header."""
+    return ", ".join(f"{span['name']};dur={span['seconds'] * 1000:.3f}" for span in spans)
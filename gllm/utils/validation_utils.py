@@ -0,0 +1,368 @@
+"""
+Description of this file:
+
+This file contains the validation engine that runs the G-code validators over a parsed program.
+Validators register themselves as rules with an estimated cost; the engine runs the selected rules on a single
+GCodeProgram (so the program is tokenized only once), cheapest rules first, stops at the first fatal failure and
+records the time spent in every rule. Programs too large to hold in memory are validated chunk by chunk with
+run_validation_stream, which carries the state each rule needs from one chunk to the next. Successive versions of
+a program (the retries of the generation loop) are validated with IncrementalValidator, which only re-checks the
+lines after the first change, and the reports of programs already validated with the same checks are reused from
+a content-addressed cache (cached_validation).
+
+The engine is used by the Langgraph check node (graph_utils.code_check) and by gcode_utils.validate_gcode.
+
+Authors: Mohamed Abdelaal, Samuel Lokadjaja
+
+This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
+"""
+
+import os
+import time
+from typing import Callable, NamedTuple, Optional, TypedDict
+import numpy as np
+from gllm.utils.ir_utils import as_program, parse_program, concatenate_programs, iter_program_chunks, CHUNK_LINES
+from gllm.utils.toolpath_utils import interpret_program, ModalState, Toolpath
+from gllm.utils.trace_utils import record_span
+from gllm.utils.cache_utils import LRUCache, content_key
+
+# Lines per block of IncrementalValidator, the unit reused between two versions of a program
+INCREMENTAL_BLOCK_LINES = 32
+
+
+class ValidationRule(NamedTuple):
+    """
+    A validator registered with the engine.
+
+    Attributes:
+        name : Unique name of the rule
+        validator : Function (program, **params) -> (bool, error message)
+        cost : Relative cost of the rule; cheaper rules run first
+        label : Name shown in the check log, e.g. "SAFETY"
+        fatal : Whether a failure stops the remaining rules
+        when : Optional predicate on the context; the rule is skipped if it returns False
+        params : Context keys passed to the validator as keyword arguments
+        carry : Optional function (program) -> lines restoring the state the rule needs at the end of the program,
+                prepended to the next chunk when a program is validated as a stream; the lines must not fail the rule
+        streamable : Whether the rule can check a program chunk by chunk
+        stateful : Whether the validator takes a `state` dict, kept for all the chunks of a streamed program
+                   (e.g. for a simulation that cannot be restored from lines); a new dict is used for every run
+    """
+
+    name: str
+    validator: Callable
+    cost: int
+    label: str
+    fatal: bool = True
+    when: Optional[Callable] = None
+    params: tuple = ()
+    carry: Optional[Callable] = None
+    streamable: bool = True
+    stateful: bool = False
+
+
+class RuleResult(TypedDict):
+    name: str
+    passed: bool
+    error: Optional[str]
+    seconds: float
+
+
+class ValidationReport(TypedDict):
+    """
+    Outcome of a validation run.
+
+    Attributes:
+        passed : True if no rule failed
+        failed_rule : The first failing rule, or None
+        error : Error message of the first failing rule, or None
+        results : Result and timing of every rule that was run, in execution order
+    """
+
+    passed: bool
+    failed_rule: Optional[ValidationRule]
+    error: Optional[str]
+    results: list[RuleResult]
+
+
+VALIDATION_RULES: dict[str, ValidationRule] = {}
+
+# Reports of the programs validated through cached_validation; set GLLM_VALIDATION_CACHE to a directory to keep
+# them on disk as well
+VALIDATION_CACHE = LRUCache(directory=os.environ.get('GLLM_VALIDATION_CACHE'))
+
+
+def register_rule(name, validator, cost, label=None, fatal=True, when=None, params=(), carry=None, streamable=True,
+                  stateful=False):
+    """Register a validator with the engine and return it unchanged."""
+    VALIDATION_RULES[name] = ValidationRule(name, validator, cost, label or name.replace('_', ' ').upper(),
+                                            fatal, when, tuple(params), carry, streamable, stateful)
+    return validator
+
+
+def rule_arguments(rule, context, state):
+    """Keyword arguments of a rule's validator: its parameters found in the context, and its state if it keeps one."""
+    arguments = {key: context[key] for key in rule.params if key in context}
+    if rule.stateful:
+        arguments['state'] = state
+    return arguments
+
+
+def run_validation(gcode, rule_names, context=None, stop_on_fatal=True):
+    """
+    Run the given rules over a G-code program.
+
+    :param gcode: The G-code string, an already parsed GCodeProgram, or a pathlib.Path to a G-code file (streamed
+                  chunk by chunk through run_validation_stream when all the rules that apply can be streamed).
+    :param rule_names: Names of the registered rules to run.
+    :param context: Values for the rule parameters and `when` predicates (e.g. parameters_string, operation_type).
+    :param stop_on_fatal: Stop at the first failing fatal rule.
+    :return: ValidationReport
+    """
+    context = context or {}
+    rules = sorted((VALIDATION_RULES[name] for name in rule_names), key=lambda rule: rule.cost)
+    if isinstance(gcode, os.PathLike) and all(rule.streamable for rule in rules
+                                              if rule.when is None or rule.when(context)):
+        return run_validation_stream(gcode, rule_names, context, stop_on_fatal)
+    program = as_program(gcode)
+
+    report = ValidationReport(passed=True, failed_rule=None, error=None, results=[])
+    for rule in rules:
+        if rule.when is not None and not rule.when(context):
+            continue
+
+        start = time.perf_counter()
+        passed, error = rule.validator(program, **rule_arguments(rule, context, {}))
+        seconds = time.perf_counter() - start
+        report['results'].append(RuleResult(name=rule.name, passed=passed, error=error, seconds=seconds))
+        record_span(f"validate.{rule.name}", seconds, lines=len(program), passed=passed)
+
+        if not passed and report['passed']:
+            report['passed'] = False
+            report['failed_rule'] = rule
+            report['error'] = error
+        if not passed and rule.fatal and stop_on_fatal:
+            break
+
+    return report
+
+
+def run_validation_stream(source, rule_names, context=None, stop_on_fatal=True, chunk_size=CHUNK_LINES):
+    """
+    Run the given rules over a program read line by line, e.g. from an open .nc file, in constant memory.
+
+    The program is tokenized chunk by chunk. Every rule sees each chunk preceded by the lines returned by its `carry`
+    function for the previous chunks, so the outcome is the same as for run_validation on the whole program.
+
+    :param source: A file object, any iterator over the lines of the program, or a pathlib.Path to a G-code file.
+    :param rule_names: Names of the registered rules to run; rules that need the whole program raise a ValueError.
+    :param context: Values for the rule parameters and `when` predicates.
+    :param stop_on_fatal: Stop reading at the first failing fatal rule.
+    :param chunk_size: Number of lines tokenized at a time.
+    :return: ValidationReport, with the time of every rule summed over all chunks
+    """
+    context = context or {}
+    rules = sorted((VALIDATION_RULES[name] for name in rule_names), key=lambda rule: rule.cost)
+    rules = [rule for rule in rules if rule.when is None or rule.when(context)]
+    for rule in rules:
+        if not rule.streamable:
+            raise ValueError(f"Rule '{rule.name}' needs the whole program and cannot be run on a stream")
+
+    report = ValidationReport(passed=True, failed_rule=None, error=None, results=[])
+    results = {rule.name: RuleResult(name=rule.name, passed=True, error=None, seconds=0.0) for rule in rules}
+    carried = {rule.name: None for rule in rules}
+    states = {rule.name: {} for rule in rules}
+    ran = set()
+    lines = 0
+    for chunk in iter_program_chunks(source, chunk_size):
+        lines += len(chunk)
+        for rule in rules:
+            result = results[rule.name]
+            if not result['passed']:
+                continue
+
+            ran.add(rule.name)
+            start = time.perf_counter()
+            program = chunk if carried[rule.name] is None else concatenate_programs([carried[rule.name], chunk])
+            passed, error = rule.validator(program, **rule_arguments(rule, context, states[rule.name]))
+            if rule.carry is not None:
+                carry_lines = rule.carry(program)
+                carried[rule.name] = parse_program(carry_lines) if carry_lines else None
+            result['seconds'] += time.perf_counter() - start
+
+            if not passed:
+                result['passed'], result['error'] = False, error
+                if report['passed']:
+                    report['passed'] = False
+                    report['failed_rule'] = rule
+                    report['error'] = error
+                if rule.fatal and stop_on_fatal:
+                    break
+        if report['failed_rule'] is not None and report['failed_rule'].fatal and stop_on_fatal:
+            break
+
+    report['results'] = [results[rule.name] for rule in rules if rule.name in ran]
+    for result in report['results']:
+        record_span(f"validate.{result['name']}", result['seconds'], lines=lines, passed=result['passed'])
+    return report
+
+
+class IncrementalValidator:
+    """
+    Validator for successive versions of a program, e.g. the solutions regenerated by the Langgraph retry loop,
+    which mostly repeat the previous attempt up to the lines that were fixed.
+
+    The program is split into blocks of lines. For every block the validator keeps the parsed lines, the tool path
+    with the modal state at its end and, for every streamable rule, the verdict and the lines carried to the next
+    block (as in run_validation_stream). A new version reuses all of this for the blocks before its first changed
+    line and only parses, interprets and checks the blocks after it. Rules that need the whole program or keep a
+    simulation state are re-run on the whole program when it changed, on the program and tool path assembled from
+    the cached blocks.
+
+    Attributes:
+        rules : Registered rules to run, cheapest first
+        context : Values for the rule parameters and `when` predicates
+        block_size : Number of lines per block
+        blocks : (lines, program, toolpath) of every block of the last validated version
+        verdicts : Per streamable rule, (passed, error, carried program) after every block checked so far
+        whole : Per other rule, the lines of the last version it checked and its (passed, error) verdict
+        lines, reused_blocks : Lines of the last validated version and number of blocks reused for it
+    """
+
+    def __init__(self, rule_names, context=None, block_size=INCREMENTAL_BLOCK_LINES):
+        self.context = context or {}
+        rules = sorted((VALIDATION_RULES[name] for name in rule_names), key=lambda rule: rule.cost)
+        self.rules = [rule for rule in rules if rule.when is None or rule.when(self.context)]
+        self.block_size = block_size
+        self.blocks = []
+        self.verdicts = {}
+        self.whole = {}
+        self.lines = []
+        self.reused_blocks = 0
+
+    def update_blocks(self, lines):
+        """Replace the blocks after the first changed line with the blocks of `lines`; return the number kept."""
+        size = self.block_size
+        new_blocks = [tuple(lines[start:start + size]) for start in range(0, len(lines), size)]
+        kept = 0
+        while kept < min(len(new_blocks), len(self.blocks)) and new_blocks[kept] == self.blocks[kept][0]:
+            kept += 1
+        del self.blocks[kept:]
+
+        state = self.blocks[-1][2].state if self.blocks else ModalState()
+        for block_lines in new_blocks[kept:]:
+            block = parse_program(block_lines, first_line=len(self.blocks) * size)
+            toolpath = interpret_program(block, state)
+            state = toolpath.state
+            self.blocks.append((block_lines, block, toolpath))
+        return kept
+
+    def whole_program(self):
+        """The validated version as one GCodeProgram, with its tool path cached from the blocks."""
+        if not self.blocks:
+            return parse_program('')
+        program = concatenate_programs([block for _, block, _ in self.blocks])
+        program.derived['toolpath'] = Toolpath(np.concatenate([toolpath.segments for _, _, toolpath in self.blocks]),
+                                               self.blocks[-1][2].state)
+        return program
+
+    def check_blocks(self, rule, kept):
+        """Verdict of a streamable rule, checking the blocks after the last cached verdict until one fails."""
+        checked = self.verdicts.setdefault(rule.name, [])
+        del checked[kept:]
+        passed, error = checked[-1][:2] if checked else (True, None)
+        while passed and len(checked) < len(self.blocks):
+            block = self.blocks[len(checked)][1]
+            carried = checked[-1][2] if checked else None
+            program = block if carried is None else concatenate_programs([carried, block])
+            passed, error = rule.validator(program, **rule_arguments(rule, self.context, {}))
+            carry_lines = rule.carry(program) if rule.carry is not None else None
+            checked.append((passed, error, parse_program(carry_lines) if carry_lines else None))
+        return passed, error
+
+    def validate(self, gcode, stop_on_fatal=True):
+        """
+        Run the rules over a new version of the program.
+
+        :param gcode: The G-code string or its list of lines.
+        :param stop_on_fatal: Stop at the first failing fatal rule.
+        :return: ValidationReport, as run_validation on the whole program would return it; the times only cover the
+                 work done for this version
+        """
+        lines = gcode.splitlines() if isinstance(gcode, str) else list(gcode)
+        kept = self.update_blocks(lines)
+        self.lines, self.reused_blocks = lines, kept
+        program = None
+
+        report = ValidationReport(passed=True, failed_rule=None, error=None, results=[])
+        for rule in self.rules:
+            start = time.perf_counter()
+            if rule.streamable and not rule.stateful:
+                passed, error = self.check_blocks(rule, kept)
+            elif rule.name in self.whole and self.whole[rule.name][0] == lines:
+                passed, error = self.whole[rule.name][1]
+            else:
+                program = self.whole_program() if program is None else program
+                passed, error = rule.validator(program, **rule_arguments(rule, self.context, {}))
+                self.whole[rule.name] = (lines, (passed, error))
+            seconds = time.perf_counter() - start
+            report['results'].append(RuleResult(name=rule.name, passed=passed, error=error, seconds=seconds))
+            record_span(f"validate.{rule.name}", seconds, lines=len(lines), passed=passed,
+                        reused_lines=min(kept * self.block_size, len(lines)))
+
+            if not passed and report['passed']:
+                report['passed'] = False
+                report['failed_rule'] = rule
+                report['error'] = error
+            if not passed and rule.fatal and stop_on_fatal:
+                break
+
+        return report
+
+
+def validation_key(gcode, rule_names, context):
+    """Key of a validation in VALIDATION_CACHE: hash of the program, the rules and the context."""
+    return content_key(gcode, sorted(rule_names), sorted((context or {}).items(), key=lambda item: item[0]))
+
+
+def cached_validation(gcode, rule_names, context=None, stop_on_fatal=True, cache=None, run=None):
+    """
+    run_validation with the reports of programs already validated with the same rules and context reused.
+
+    :param gcode: The G-code string (other inputs are validated without the cache).
+    :param cache: LRUCache to use instead of VALIDATION_CACHE.
+    :param run: Function (gcode) -> ValidationReport used on a cache miss instead of run_validation,
+                e.g. IncrementalValidator.validate.
+    :return: ValidationReport; on a cache hit, the rules report 0 seconds (see format_timings)
+    """
+    if run is None:
+        def run(program):
+            return run_validation(program, rule_names, context, stop_on_fatal)
+    if not isinstance(gcode, str):
+        return run(gcode)
+
+    cache = VALIDATION_CACHE if cache is None else cache
+    key = validation_key(gcode, rule_names, context) + ('' if stop_on_fatal else '-all')
+    start = time.perf_counter()
+    stored = cache.get(key)
+    if stored is not None:
+        record_span("validate.cache", time.perf_counter() - start, hit=True, passed=stored['passed'])
+        # no time was spent in the rules this time
+        return ValidationReport(passed=stored['passed'], failed_rule=VALIDATION_RULES.get(stored['failed_rule']),
+                                error=stored['error'],
+                                results=[RuleResult(name=result['name'], passed=result['passed'], error=result['error'],
+                                                    seconds=0.0) for result in stored['results']])
+
+    report = run(gcode)
+    record_span("validate.cache", time.perf_counter() - start, hit=False, passed=report['passed'])
+    # the rule itself holds functions, only its name is stored; the results are copied, so that changes made by the
+    # caller to the returned report do not reach the cache
+    results = [{field: result[field] for field in ('name', 'passed', 'error')} for result in report['results']]
+    cache.put(key, {'passed': report['passed'], 'error': report['error'], 'results': results,
+                    'failed_rule': report['failed_rule'].name if report['failed_rule'] is not None else None})
+    return report
+
+
+def format_timings(report):
+    """One-line summary of the time spent in every rule of a report."""
+    return ", ".join(f"{result['name']}={result['seconds'] * 1000:.2f}ms" for result in report['results'])
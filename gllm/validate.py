@@ -0,0 +1,176 @@
+"""
+Description of this file:
+
+This file contains the command-line batch validator for archives of G-code programs:
+
+    python -m gllm.validate <directory|glob> [...] [--format json|csv] [--output report.json] [--workers N]
+
+It runs the checks of gcode_utils.validate_gcode over every .gcode/.nc file found, in a pool of worker processes
+that receive the files in chunks. Every file is validated as a stream (see validation_utils.run_validation_stream),
+so large programs are read through a memory map in constant memory. The report lists the outcome of every file
+and is followed by throughput statistics (files, lines and megabytes per second).
+
+Authors: Mohamed Abdelaal, Samuel Lokadjaja
+
+This work was done at Software AG, Darmstadt, Germany in 2023-2024 and is published under the Apache License 2.0.
+"""
+
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import logging
+import argparse
+import functools
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from gllm.utils.ir_utils import CHUNK_LINES
+from gllm.utils.gcode_utils import GCODE_RULES, GCODE_CONTEXT
+from gllm.utils.validation_utils import run_validation_stream, VALIDATION_RULES
+from gllm.utils.trace_utils import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Extensions of the files validated when a directory is given
+GCODE_EXTENSIONS = ('.gcode', '.nc')
+
+# Columns of the per-file report
+REPORT_FIELDS = ('path', 'passed', 'failed_rule', 'error', 'lines', 'bytes', 'seconds')
+
+
+def find_programs(patterns, extensions=GCODE_EXTENSIONS):
+    """
+    G-code files matching the given directories (searched recursively for the extensions) and glob patterns,
+    in order and without duplicates.
+    """
+    paths = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(str(path) for path in Path(pattern).rglob('*')
+                             if path.suffix.lower() in extensions and path.is_file())
+        else:
+            matches = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+        paths.update(dict.fromkeys(matches))
+    return list(paths)
+
+
+def count_lines(path):
+    """Number of lines of a file (a last line without a newline counts too)."""
+    lines, last = 0, b'\n'
+    with open(path, 'rb') as file:
+        for block in iter(functools.partial(file.read, 1 << 20), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    return lines + (last != b'\n')
+
+
+def validate_file(path, rule_names=GCODE_RULES, chunk_size=CHUNK_LINES):
+    """Validate one G-code file; returns its row of the report (see REPORT_FIELDS)."""
+    start = time.perf_counter()
+    try:
+        report = run_validation_stream(Path(path), rule_names, GCODE_CONTEXT, chunk_size=chunk_size)
+        result = {'passed': report['passed'],
+                  'failed_rule': report['failed_rule'].name if report['failed_rule'] is not None else None,
+                  'error': report['error'], 'lines': count_lines(path), 'bytes': os.path.getsize(path)}
+    except OSError as e:
+        result = {'passed': False, 'failed_rule': None, 'error': f"Could not read the file: {e}", 'lines': 0,
+                  'bytes': 0}
+    return {'path': str(path), **result, 'seconds': time.perf_counter() - start}
+
+
+def validate_files(paths, workers=None, chunksize=None, rule_names=GCODE_RULES, chunk_size=CHUNK_LINES):
+    """
+    Validate G-code files in parallel.
+
+    :param paths: Paths of the files.
+    :param workers: Number of worker processes (default: one per CPU); 1 validates in this process.
+    :param chunksize: Number of files sent to a worker at a time (default: about four chunks per worker).
+    :param rule_names: Names of the (streamable) rules to run.
+    :param chunk_size: Number of lines tokenized at a time within a file.
+    :return: (results, stats): one report row per file, in the order of paths, and the throughput statistics
+    """
+    workers = workers or os.cpu_count() or 1
+    chunksize = chunksize or max(1, min(64, len(paths) // (workers * 4)))
+    check = functools.partial(validate_file, rule_names=tuple(rule_names), chunk_size=chunk_size)
+
+    start = time.perf_counter()
+    if workers == 1 or len(paths) <= 1:
+        results = [check(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(check, paths, chunksize=chunksize))
+    seconds = time.perf_counter() - start
+
+    lines = sum(result['lines'] for result in results)
+    size = sum(result['bytes'] for result in results)
+    passed = sum(result['passed'] for result in results)
+    stats = {'files': len(results), 'passed': passed, 'failed': len(results) - passed, 'lines': lines,
+             'bytes': size, 'seconds': seconds, 'workers': workers, 'chunksize': chunksize,
+             'files_per_second': len(results) / seconds if seconds else 0.0,
+             'lines_per_second': lines / seconds if seconds else 0.0,
+             'megabytes_per_second': size / 1e6 / seconds if seconds else 0.0}
+    return results, stats
+
+
+def write_report(results, stats, file, report_format='json'):
+    """Write the report as JSON (summary and files) or as CSV (one row per file)."""
+    if report_format == 'csv':
+        writer = csv.DictWriter(file, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+    else:
+        json.dump({'summary': stats, 'files': results}, file, indent=2)
+        file.write('\n')
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m gllm.validate',
+                                     description="Validate directories or glob patterns of G-code programs.")
+    parser.add_argument('patterns', nargs='+', help="Directories (searched recursively) or glob patterns")
+    parser.add_argument('--format', choices=('json', 'csv'), default='json', help="Report format (default: json)")
+    parser.add_argument('--output', '-o', help="Report file (default: standard output)")
+    parser.add_argument('--workers', '-j', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--chunksize', type=int, default=None, help="Files sent to a worker at a time")
+    parser.add_argument('--rules', default=','.join(GCODE_RULES), help="Comma-separated rules to run")
+    parser.add_argument('--extensions', default=','.join(GCODE_EXTENSIONS),
+                        help="Comma-separated extensions of the files searched in directories")
+    arguments = parser.parse_args(argv)
+
+    arguments.rules = tuple(rule for rule in arguments.rules.split(',') if rule)
+    for rule in arguments.rules:
+        if rule not in VALIDATION_RULES:
+            parser.error(f"unknown rule '{rule}'")
+        if not VALIDATION_RULES[rule].streamable:
+            parser.error(f"rule '{rule}' needs the whole program and cannot be run on files")
+    arguments.extensions = tuple(extension.lower() if extension.startswith('.') else f".{extension.lower()}"
+                                 for extension in arguments.extensions.split(',') if extension)
+    return arguments
+
+
+def main(argv=None):
+    """Run the batch validator; returns 0 if every file passed, 1 if some failed and 2 if no file was found."""
+    configure_logging()
+    arguments = parse_arguments(argv)
+    paths = find_programs(arguments.patterns, arguments.extensions)
+    if not paths:
+        logger.error("No G-code files found for %s", ' '.join(arguments.patterns))
+        return 2
+
+    results, stats = validate_files(paths, arguments.workers, arguments.chunksize, arguments.rules)
+    if arguments.output:
+        with open(arguments.output, 'w', newline='') as file:
+            write_report(results, stats, file, arguments.format)
+    else:
+        write_report(results, stats, sys.stdout, arguments.format)
+
+    logger.info("Validated %d files (%d passed, %d failed), %d lines in %.2f s with %d workers: "
+                "%.1f files/s, %.0f lines/s, %.2f MB/s", stats['files'], stats['passed'], stats['failed'],
+                stats['lines'], stats['seconds'], stats['workers'], stats['files_per_second'],
+                stats['lines_per_second'], stats['megabytes_per_second'])
+    return 0 if stats['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
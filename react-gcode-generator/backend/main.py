@@ -8,13 +8,14 @@ LLM pipelines for G-code generation.
 Authors: Enhanced from original Streamlit application
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import sys
 import os
 import uuid
+import gzip
 import asyncio
 from pathlib import Path
 
@@ -24,11 +25,17 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.
 from gllm.utils.rag_utils import setup_langchain_with_rag
 from gllm.utils.model_utils import setup_model, setup_langchain_without_rag
 from gllm.utils.params_extraction_utils import extract_parameters_logic, parse_extracted_parameters, extract_numerical_values
-from gllm.utils.gcode_utils import generate_gcode_unstructured_prompt, generate_task_descriptions, refine_gcode
+from gllm.utils.gcode_utils import generate_gcode_unstructured_prompt, generate_task_descriptions
 from gllm.utils.graph_utils import construct_graph
 from gllm.utils.params_extraction_utils import from_dict_to_text
+from gllm.utils.trace_utils import configure_logging, tracing, format_server_timing
+from gllm.utils.plot_utils import encode_toolpath, refine_gcode
+from gllm.utils.program_utils import ProgramBuilder
+from gllm.utils.spatial_utils import parse_keep_out_zones
 from langgraph.checkpoint.sqlite import SqliteSaver
 
+configure_logging()
+
 app = FastAPI(title="G-code Generator API", version="1.0.0")
 
 # Configure CORS
@@ -38,8 +45,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """Trace the request when it carries an X-Trace header and report the spans in the Server-Timing header."""
+    if "x-trace" not in request.headers:
+        return await call_next(request)
+    with tracing() as spans:
+        response = await call_next(request)
+    if spans:
+        response.headers["Server-Timing"] = format_server_timing(spans)
+    return response
+
 # Pydantic models for request/response
 class ParameterExtractionRequest(BaseModel):
     description: str
@@ -63,10 +82,15 @@ class GCodeGenerationRequest(BaseModel):
     promptType: str = "Structured"
     extractedParameters: Optional[str] = None
     pdfFiles: Optional[List[str]] = []
+    keepOutZones: Optional[str] = None  # one zone per line: x_min, y_min, x_max, y_max, z_top[, name]
 
 class GCodeGenerationResponse(BaseModel):
     gcode: str
 
+class ToolpathRequest(BaseModel):
+    gcode: str
+    maxPoints: Optional[int] = None
+
 # Global state to store models and chains (in production, use a proper cache/session store)
 model_cache = {}
 chain_cache = {}
@@ -147,6 +171,11 @@ async def generate_gcode(request: GCodeGenerationRequest):
     """
     Generate G-code based on task description and parameters
     """
+    try:
+        keep_out_zones = parse_keep_out_zones(request.keepOutZones)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
         # Setup model if not cached
         model_key = f"model_{request.model}"
@@ -198,7 +227,8 @@ async def generate_gcode(request: GCodeGenerationRequest):
                         graph_builder = construct_graph(
                             chain,
                             user_inputs,
-                            extracted_parameters
+                            extracted_parameters,
+                            keep_out_zones
                         )
                         
                         # Compile the graph with the checkpointer
@@ -211,10 +241,11 @@ async def generate_gcode(request: GCodeGenerationRequest):
                             stream_mode="values"
                         )
                         
+                        program = ProgramBuilder()
                         for event in events:
                             if "generation" in event:
-                                generated_gcode += f"\n{event['generation']}"
-                                generated_gcode = refine_gcode(generated_gcode)
+                                program.append(event['generation'])
+                        generated_gcode = program.gcode
                 else:
                     # Fallback to unstructured approach
                     generated_gcode = generate_gcode_unstructured_prompt(chain, request.description)
@@ -230,6 +261,27 @@ async def generate_gcode(request: GCodeGenerationRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate G-code: {str(e)}")
 
+@app.post("/api/toolpath")
+async def get_toolpath(request: ToolpathRequest, http_request: Request):
+    """
+    Interpret G-code into its tool path for the visualization.
+
+    The response is the binary payload of plot_utils.encode_toolpath (vertices as delta-encoded int32 microns and
+    the rapid flag of every move), gzip-compressed when the client accepts it.
+    """
+    try:
+        payload = await asyncio.to_thread(encode_toolpath, request.gcode, request.maxPoints)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Failed to encode tool path: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to compute tool path: {str(e)}")
+
+    headers = {"Vary": "Accept-Encoding"}
+    if "gzip" in http_request.headers.get("accept-encoding", ""):
+        payload = gzip.compress(payload, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=payload, media_type="application/octet-stream", headers=headers)
+
 @app.post("/api/upload-pdf")
 async def upload_pdf(files: List[UploadFile] = File(...)):
     """
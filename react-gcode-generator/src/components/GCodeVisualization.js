@@ -1,51 +1,79 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
 import Plot from 'react-plotly.js';
 import { BarChart3, Eye, AlertCircle } from 'lucide-react';
+import apiService from '../services/api';
+import { toolpathRun } from '../services/toolpath';
 
 const GCodeVisualization = ({ parsedParameters, generatedGCode }) => {
+  const [toolpath, setToolpath] = useState(null);
+  const [toolpathError, setToolpathError] = useState(null);
+
+  // Fetch the interpreted tool path of the generated G-code from the backend
+  useEffect(() => {
+    if (!generatedGCode) {
+      setToolpath(null);
+      return undefined;
+    }
+    let cancelled = false;
+    setToolpathError(null);
+    apiService.getToolpath(generatedGCode)
+      .then((result) => { if (!cancelled) setToolpath(result); })
+      .catch((error) => {
+        console.error('Error fetching tool path:', error);
+        if (!cancelled) setToolpathError(error.message);
+      });
+    return () => { cancelled = true; };
+  }, [generatedGCode]);
+
   // Generate 2D tool path visualization
   const generateToolPathPlot = () => {
-    if (!parsedParameters) return null;
+    if (!toolpath || toolpath.count === 0) return null;
 
     try {
-      // Mock data for demonstration - in real app this would come from parsed parameters
-      const mockToolPath = [
-        { x: 0, y: 0 },
-        { x: 50, y: 0 },
-        { x: 50, y: 30 },
-        { x: 0, y: 30 },
-        { x: 0, y: 0 }
-      ];
-
-      const workpieceData = {
-        x: [0, 50, 50, 0, 0],
-        y: [0, 0, 30, 30, 0],
-        mode: 'lines',
-        line: { color: 'black', width: 3 },
-        name: 'Workpiece',
-        fill: 'toself',
-        fillcolor: 'rgba(128, 128, 128, 0.3)'
-      };
+      const data = [];
+      const dimensions = parsedParameters && parsedParameters.workpiece_diemensions;
+      if (dimensions && dimensions.length >= 2) {
+        const [length, width] = dimensions;
+        data.push({
+          x: [0, length, length, 0, 0],
+          y: [0, 0, width, width, 0],
+          mode: 'lines',
+          line: { color: 'black', width: 3 },
+          name: 'Workpiece',
+          fill: 'toself',
+          fillcolor: 'rgba(128, 128, 128, 0.3)'
+        });
+      }
 
-      const toolPathData = {
-        x: mockToolPath.map(point => point.x),
-        y: mockToolPath.map(point => point.y),
-        mode: 'lines+markers',
+      // WebGL traces, so that large programs stay responsive
+      const feed = toolpathRun(toolpath, false);
+      const rapid = toolpathRun(toolpath, true);
+      data.push({
+        ...feed,
+        type: 'scattergl',
+        mode: 'lines',
         line: { color: 'red', width: 2 },
-        marker: { color: 'red', size: 6 },
-        name: 'Tool Path'
-      };
+        name: 'Feed'
+      });
+      data.push({
+        ...rapid,
+        type: 'scattergl',
+        mode: 'lines',
+        line: { color: 'gray', width: 1, dash: 'dash' },
+        name: 'Rapid'
+      });
 
       return {
-        data: [workpieceData, toolPathData],
+        data,
         layout: {
           title: 'CNC Tool Path Visualization (2D)',
-          xaxis: { title: 'X (mm)', range: [-5, 55] },
-          yaxis: { title: 'Y (mm)', range: [-5, 35] },
+          xaxis: { title: 'X (mm)' },
+          yaxis: { title: 'Y (mm)', scaleanchor: 'x' },
           showlegend: true,
           width: 400,
           height: 300,
-          margin: { t: 50, r: 20, b: 50, l: 50 }
+          margin: { t: 50, r: 20, b: 50, l: 50 },
+          uirevision: 'toolpath'
         }
       };
     } catch (error) {
@@ -116,10 +144,10 @@ const GCodeVisualization = ({ parsedParameters, generatedGCode }) => {
                 config={{ responsive: true, displayModeBar: false }}
               />
               <p className="text-sm text-gray-600 mt-2">
-                Red line shows the tool path, gray area represents the workpiece.
+                Red lines show the feed moves, dashed lines the rapid moves, gray area represents the workpiece.
               </p>
             </div>
-          ) : parsedParameters ? (
+          ) : toolpathError || (toolpath && generatedGCode) ? (
             <div className="border border-gray-200 rounded-lg p-6 text-center">
               <AlertCircle className="h-8 w-8 mx-auto text-yellow-500 mb-2" />
               <p className="text-gray-600">Error generating visualization</p>
@@ -128,7 +156,7 @@ const GCodeVisualization = ({ parsedParameters, generatedGCode }) => {
             <div className="border border-gray-200 rounded-lg p-6 text-center">
               <BarChart3 className="h-12 w-12 mx-auto text-gray-300 mb-4" />
               <p className="text-gray-500">No visualization data available</p>
-              <p className="text-sm text-gray-400">Extract parameters first to generate visualization</p>
+              <p className="text-sm text-gray-400">Generate G-code first to see its tool path</p>
             </div>
           )}
         </div>
@@ -1,5 +1,7 @@
 // API service for communicating with the FastAPI backend
 
+import { decodeToolpath } from './toolpath';
+
 const API_BASE_URL = 'http://localhost:8000/api';
 
 class ApiService {
@@ -54,6 +56,24 @@ class ApiService {
     return response.json();
   }
 
+  async getToolpath(gcode, maxPoints = null) {
+    // Binary payload (gzip-compressed by the server); the browser decompresses it
+    const response = await fetch(`${API_BASE_URL}/toolpath`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ gcode, maxPoints }),
+    });
+
+    if (!response.ok) {
+      const error = await response.json();
+      throw new Error(error.detail || 'Failed to compute tool path');
+    }
+
+    return decodeToolpath(await response.arrayBuffer());
+  }
+
   async uploadPDF(files) {
     const formData = new FormData();
     files.forEach(file => {
@@ -0,0 +1,53 @@
+// Decoding of the binary tool path payload returned by /api/toolpath (see plot_utils.encode_toolpath)
+
+const TOOLPATH_MAGIC = 'GTP1';
+
+// Typed-array views require little-endian data, which is what every browser platform uses
+export function decodeToolpath(buffer) {
+  const header = new Uint8Array(buffer, 0, 4);
+  if (String.fromCharCode(...header) !== TOOLPATH_MAGIC) {
+    throw new Error('Invalid tool path payload');
+  }
+  const count = new DataView(buffer).getUint32(4, true);
+  const deltas = new Int32Array(buffer, 8, 3 * count);
+  const rapid = new Uint8Array(buffer, 8 + 12 * count, count);
+
+  // Undo the delta encoding of every axis and convert microns to millimetres
+  const axes = [0, 1, 2].map((axis) => {
+    const values = new Float64Array(count);
+    let position = 0;
+    for (let i = 0; i < count; i++) {
+      position += deltas[axis * count + i];
+      values[i] = position / 1000;
+    }
+    return values;
+  });
+
+  return { count, x: axes[0], y: axes[1], z: axes[2], rapid };
+}
+
+// XY coordinates of the moves of one kind (rapid or feed), as one Plotly trace with NaN gaps between runs
+export function toolpathRun(toolpath, rapidMoves) {
+  const { count, x, y, rapid } = toolpath;
+  const runX = [];
+  const runY = [];
+  let drawing = false;
+  for (let i = 1; i < count; i++) {
+    if ((rapid[i] === 1) !== rapidMoves) {
+      drawing = false;
+      continue;
+    }
+    if (!drawing) {
+      if (runX.length) {
+        runX.push(NaN);
+        runY.push(NaN);
+      }
+      runX.push(x[i - 1]);
+      runY.push(y[i - 1]);
+      drawing = true;
+    }
+    runX.push(x[i]);
+    runY.push(y[i]);
+  }
+  return { x: Float64Array.from(runX), y: Float64Array.from(runY) };
+}
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test the arc-fitting compressor
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath('.'))
+
+import math
+import numpy as np
+import pytest
+from gllm.utils.toolpath_utils import interpret_program, CCW_ARC, LINEAR
+from gllm.utils.geometry_utils import path_hausdorff_distance, toolpath_primitives
+from gllm.utils.arcfit_utils import fit_arcs, ARC_TOLERANCE
+
+
+def polyline(points, feed=100):
+    lines = [f"G01 X{points[0][0]:.4f} Y{points[0][1]:.4f} F{feed}"]
+    lines += [f"X{x:.4f} Y{y:.4f}" for x, y in points[1:]]
+    return "\n".join(lines)
+
+
+def arc_points(cx, cy, r, a0, a1, n):
+    return [(cx + r * np.cos(t), cy + r * np.sin(t)) for t in np.linspace(a0, a1, n)[1:]]
+
+
+def test_semicircle_becomes_one_arc():
+    gcode = f"G21 G90\nG00 X20 Y0 Z5\nG01 Z-1 F100\n{polyline(arc_points(0, 0, 20, 0, np.pi, 73))}\nX-20 Y-10\nG00 Z5"
+    compressed, report = fit_arcs(gcode)
+    assert compressed.splitlines()[3:6] == ['G03 X-20 Y0 I-20 J0 F100', 'G01 X-20 Y-10', 'G00 Z5']
+    assert report['arcs'] == 1 and report['replaced_moves'] == 72
+    assert report['lines_before'] == 77 and report['lines_after'] == 6
+    assert report['reduction'] == pytest.approx(1 - 6 / 77)
+
+    segments = interpret_program(compressed).segments
+    assert segments['motion'][2] == CCW_ARC and segments['motion'][3] == LINEAR
+    assert segments['sweep'][2] == pytest.approx(np.pi)
+    np.testing.assert_allclose(segments['end'][-1], [-20, -10, 5])
+
+
+def cut_path_distance(gcode, compressed):
+    """Hausdorff distance between the XY cut paths of two programs, over the lines and arcs of both paths."""
+    return path_hausdorff_distance(toolpath_primitives(gcode), toolpath_primitives(compressed), accuracy=1e-5)
+
+
+def test_cut_path_stays_within_tolerance():
+    rng = np.random.default_rng(3)
+    points, x = [], 0.0
+    for _ in range(20):
+        r, sweep = rng.uniform(5, 40), rng.uniform(0.5, 3)
+        # fine enough for the chords to lie within half the tolerance of the arc, or coarser
+        fine = math.ceil(sweep / (2 * math.acos(1 - ARC_TOLERANCE / 2 / r)))
+        points += arc_points(x + r, 0, r, np.pi, np.pi - sweep, fine + int(rng.integers(-fine // 2, 20)))
+        points.append((points[-1][0] + 2, points[-1][1]))
+        x = points[-1][0]
+    gcode = f"G00 X0 Y0 Z5\nG01 Z-1 F100\n{polyline(points)}"
+    compressed, report = fit_arcs(gcode)
+    assert report['arcs'] >= 10 and report['reduction'] > 0.5
+    assert cut_path_distance(gcode, compressed) <= ARC_TOLERANCE + 1e-5
+    np.testing.assert_allclose(interpret_program(compressed).segments['end'][-1, :2], points[-1], atol=1e-4)
+
+
+def test_chords_bulging_beyond_tolerance_are_kept():
+    # a half 26-gon: its corners lie on the circle, but every chord is 0.109 mm inside the arc
+    gcode = f"G00 X65 Y50 Z5\nG01 Z-1 F100\n{polyline(arc_points(50, 50, 15, 0, np.pi, 14))}"
+    compressed, report = fit_arcs(gcode)
+    assert report['arcs'] == 0 and compressed == gcode
+    assert cut_path_distance(gcode, compressed) == 0
+
+
+def test_polygons_and_unsafe_programs_are_kept():
+    octagon = polyline([(10 * np.cos(t), 10 * np.sin(t)) for t in np.linspace(0, 2 * np.pi, 9)])
+    assert fit_arcs(octagon)[1]['arcs'] == 0
+    incremental = "G91\n" + polyline(arc_points(0, 0, 20, 0, np.pi, 37))
+    assert fit_arcs(incremental) == (incremental, fit_arcs(incremental)[1])
+    assert fit_arcs(incremental)[1]['reduction'] == 0
+    # lines with other words (here a Z move) end the runs
+    helix = "\n".join(f"G01 X{x:.4f} Y{y:.4f} Z{-k * 0.1:.1f} F100"
+                      for k, (x, y) in enumerate(arc_points(0, 0, 20, 0, np.pi, 37)))
+    assert fit_arcs(helix)[1]['arcs'] == 0
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test the process-pool batch validator and its command line
+"""
+
+import sys
+import os
+import csv
+import json
+sys.path.append(os.path.abspath('.'))
+
+from gllm.validate import find_programs, validate_files, main
+from gllm.utils.gcode_utils import validate_gcode
+
+PROGRAMS = {
+    'ok.gcode': "G21 G90\nT1 M06\nG43 H1\nM03 S500\nG00 X0 Y0 Z5\nG01 Z-1 F50\nG01 X10\nG00 Z5\nM30\n",
+    'unreachable.nc': "G00 X0 Y0 Z5\nM30\nG01 X10",
+    'nested/syntax.nc': "G00 X0 Y0 Z5\nG01 X1 Q\nM30",
+}
+
+
+def write_programs(directory):
+    for name, gcode in PROGRAMS.items():
+        path = directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(gcode)
+    (directory / 'notes.txt').write_text("not a program")
+
+
+def test_find_programs_searches_directories_and_globs(tmp_path):
+    write_programs(tmp_path)
+    assert [os.path.relpath(path, tmp_path) for path in find_programs([str(tmp_path)])] == \
+        sorted(['nested/syntax.nc', 'ok.gcode', 'unreachable.nc'])
+    assert find_programs([str(tmp_path / '*.nc')]) == [str(tmp_path / 'unreachable.nc')]
+
+
+def test_parallel_results_match_validate_gcode(tmp_path):
+    write_programs(tmp_path)
+    paths = find_programs([str(tmp_path)])
+    results, stats = validate_files(paths, workers=2, chunksize=1)
+    assert [result['path'] for result in results] == paths
+    for result in results:
+        assert result['passed'] == validate_gcode(open(result['path']).read())
+    assert stats['files'] == 3 and stats['passed'] + stats['failed'] == 3
+    assert stats['lines'] == 9 + 3 + 3
+    by_name = {os.path.basename(result['path']): result for result in results}
+    assert by_name['unreachable.nc']['failed_rule'] == 'unreachable_code'
+    assert by_name['syntax.nc']['failed_rule'] == 'syntax'
+
+
+def test_command_line_writes_reports(tmp_path, capsys):
+    write_programs(tmp_path)
+    report = tmp_path / 'report.csv'
+    assert main([str(tmp_path), '--format', 'csv', '--output', str(report), '--workers', '1']) == 1
+    rows = list(csv.DictReader(open(report)))
+    assert len(rows) == 3 and set(rows[0]) >= {'path', 'passed', 'failed_rule', 'error'}
+
+    assert main([str(tmp_path / 'nested' / '*.nc'), '--workers', '1']) == 1
+    output = json.loads(capsys.readouterr().out)
+    assert output['summary']['files'] == 1 and output['files'][0]['failed_rule'] == 'syntax'
+    assert main([str(tmp_path / '*.missing')]) == 2
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test the content-addressed LRU cache and the cached validation reports
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath('.'))
+
+from gllm.utils.cache_utils import LRUCache, content_key
+from gllm.utils.validation_utils import cached_validation, register_rule, VALIDATION_RULES
+
+
+def test_content_key_depends_on_every_part():
+    assert content_key("G00 X0", ('syntax',)) == content_key("G00 X0", ('syntax',))
+    assert content_key("G00 X0", ('syntax',)) != content_key("G00 X1", ('syntax',))
+    assert content_key("ab", "c") != content_key("a", "bc")
+
+
+def test_lru_evicts_least_recently_used_and_counts():
+    cache = LRUCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+    assert cache.stats()['hit_rate'] == 0.75
+
+
+def test_disk_cache_survives_restarts_and_is_bounded(tmp_path):
+    cache = LRUCache(max_entries=1, directory=str(tmp_path), max_disk_entries=10)
+    cache.put('a', {'passed': True})
+    cache.put('b', {'passed': False})
+    assert 'a' not in cache.entries
+    assert cache.get('a') == {'passed': True}
+
+    restarted = LRUCache(max_entries=1, directory=str(tmp_path), max_disk_entries=10)
+    assert restarted.get('b') == {'passed': False}
+    for index in range(20):
+        restarted.put(str(index), index)
+    assert len(os.listdir(tmp_path)) <= 10
+
+
+def test_repeated_validation_is_served_from_cache():
+    calls = []
+    register_rule('test_cached', lambda program: calls.append(1) or (False, "always fails"), cost=1)
+    try:
+        cache = LRUCache()
+        first = cached_validation("G00 X0 Y0", ['test_cached'], cache=cache)
+        second = cached_validation("G00 X0 Y0", ['test_cached'], cache=cache)
+        assert len(calls) == 1
+        assert second['failed_rule'].name == 'test_cached'
+        assert (second['passed'], second['error']) == (first['passed'], first['error'])
+        assert (cache.hits, cache.misses) == (1, 1)
+        # the rules took no time on the hit, and changing a returned report does not change the cache
+        assert first['results'][0]['seconds'] > 0 and second['results'][0]['seconds'] == 0.0
+        first['results'][0]['passed'] = True
+        second['results'].clear()
+        third = cached_validation("G00 X0 Y0", ['test_cached'], cache=cache)
+        assert [(result['name'], result['passed']) for result in third['results']] == [('test_cached', False)]
+
+        cached_validation("G00 X0 Y0", ['test_cached'], context={'max_feed': 10}, cache=cache)
+        assert len(calls) == 2
+    finally:
+        VALIDATION_RULES.pop('test_cached')
+
+
+def test_lru_bounded_by_size():
+    cache = LRUCache(max_bytes=10)
+    cache.put('a', b'12345')
+    cache.put('b', b'1234')
+    cache.put('c', b'123')
+    assert 'a' not in cache.entries and cache.bytes == 7
+    cache.put('d', b'x' * 50)
+    assert list(cache.entries) == ['d'] and cache.stats()['bytes'] == 50
+
+
+def test_rendered_figures_are_reused():
+    import matplotlib
+    matplotlib.use('Agg')
+    from gllm.utils.plot_utils import cached_render, toolpath_figure, user_specification_image, FIGURE_CACHE
+    gcode = "G00 X0 Y0 Z5\nG01 Z-1 F100\nG01 X10\nG00 Z5"
+    hits = FIGURE_CACHE.hits
+    figure = cached_render(toolpath_figure, gcode)
+    assert cached_render(toolpath_figure, gcode) is figure
+    assert cached_render(toolpath_figure, gcode + "\nG00 X0") is not figure
+    assert FIGURE_CACHE.hits == hits + 1
+
+    parameters = {'workpiece_diemensions': [50, 40], 'starting_point': [0, 0],
+                  'tool_path': [(0, 0, 0), (10, 10, 0)], 'cut_depth': [1]}
+    image = cached_render(user_specification_image, parameters)
+    assert image.startswith(b'\x89PNG')
+    assert cached_render(user_specification_image, dict(parameters)) is image
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Test the modal-redundancy compaction pass
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath('.'))
+
+import numpy as np
+from gllm.utils.toolpath_utils import interpret_program
+from gllm.utils.compact_utils import compact_gcode
+
+
+def test_repeated_modal_words_and_positions_are_dropped():
+    gcode = """G21 G90 G17 (setup)
+M3 S1000
+G00 Z5.000
+G00 X0.0000 Y0.0000
+G01 Z-1.000 F100.0
+G01 X10.0000 Y0.0000 F100.0
+G01 X10.0000 Y10.0000
+
+G01 X10.0000 Y10.0000
+G02 X0 Y10 I-5.00004 J0 F100
+G21 G90 G17
+G00 Z5"""
+    compacted, report = compact_gcode(gcode)
+    assert compacted.splitlines() == ['G21 G90 G17', 'M3 S1000', 'G0 Z5', 'X0 Y0', 'G1 Z-1 F100', 'X10', 'Y10',
+                                      'G2 X0 Y10 I-5 J0', 'G0 Z5']
+    assert report['lines_before'] == 12 and report['lines_after'] == 9
+    assert report['bytes_after'] == len(compacted) and report['reduction'] > 0.5
+
+    original, result = interpret_program(gcode).segments, interpret_program(compacted).segments
+    np.testing.assert_allclose(result['end'][result['length'] > 0], original['end'][original['length'] > 0],
+                               atol=1e-3)
+
+
+def test_canned_cycles_and_incremental_moves():
+    gcode = "G21 G90\nG81 X5 Y5 Z-3 R1 F50\nX6 Y5\nG80\nG00 X0.0004 Y0\nG91 G01 X0 Y5.12345 F80\nG90\nG28\nM30"
+    compacted, _ = compact_gcode(gcode)
+    assert compacted.splitlines() == ['G21 G90', 'G81 X5 Y5 Z-3 R1 F50', 'X6 Y5', 'G80', 'G0 X0 Y0',
+                                      'G91 G1 Y5.12345 F80', 'G90', 'G28', 'M30']
+
+
+def test_inverse_time_programs_are_kept():
+    gcode = "G21 G90 G93\nG01 X10 F2\nG01 X20 F2"
+    compacted, report = compact_gcode(gcode)
+    assert compacted == gcode and report['reduction'] == 0.0
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Test the machining cycle-time estimator
+"""
+
+import sys
+import os
+import math
+sys.path.append(os.path.abspath('.'))
+
+import pytest
+from gllm.utils.cycle_time_utils import estimate_cycle_time, rank_by_cycle_time
+from gllm.utils.kinematics_utils import DEFAULT_MACHINE
+
+
+def test_rapid_feed_and_arc_times():
+    gcode = "T1 M06\nG00 X100\nG01 X200 F600\nT2 M06\nG02 X200 Y0 I-50 J0 F100\nM30"
+    report = estimate_cycle_time(gcode, rapid_rate=6000)
+    assert report['rapid'] == pytest.approx(1.0)              # 100 mm at 6000 mm/min
+    line, arc = 10.0, 2 * math.pi * 50 / 100 * 60          # 100 mm at 600 mm/min, full circle at 100 mm/min
+    assert report['cutting'] == pytest.approx(line + arc)
+    assert report['total'] == pytest.approx(1.0 + line + arc)
+    assert report['by_tool'] == pytest.approx({1: 1.0 + line, 2: arc})
+    assert report['by_operation'] == pytest.approx({'rapid': 1.0, 'linear': line, 'arc': arc, 'drilling': 0.0})
+    assert report['unfed_moves'] == 0
+
+
+def test_drilling_cycles_and_missing_feed():
+    report = estimate_cycle_time("G01 X10\nG00 Z10\nG81 X0 Y0 Z-5 R2 F60\nG80", rapid_rate=6000)
+    assert report['unfed_moves'] == 1
+    assert report['by_operation']['linear'] == 0
+    assert report['by_operation']['drilling'] == pytest.approx(7 + (10 + 8 + 15) / 100)  # 7 mm at 60 mm/min plus rapids
+    assert report['by_operation']['rapid'] == pytest.approx(0.1)                         # G00 Z10
+
+
+def test_rank_by_cycle_time():
+    slow = "G01 X100 F10"
+    fast = "G01 X100 F1000"
+    assert rank_by_cycle_time([slow, fast, "G00 X100"]) == [2, 1, 0]
+
+
+def test_rank_by_simulated_time():
+    # same length and feed, but the zigzag has to slow down at every corner
+    zigzag = "\n".join(["G01 X0 Y0 F3000"] + [f"X{i} Y{(i % 2)}" for i in range(1, 40)])
+    straight = "G01 X0 Y0 F3000\n" + f"X{39 * math.sqrt(2):.6f}"
+    assert rank_by_cycle_time([zigzag, straight], machine=DEFAULT_MACHINE) == [1, 0]
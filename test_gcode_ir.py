@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test the columnar G-code IR and the validators consuming it
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath('.'))
+
+import numpy as np
+from gllm.utils.ir_utils import parse_program, as_program, forward_fill, NO_MOTION, FLAG_M30, FLAG_G21, FLAG_EMPTY
+
+SAMPLE_GCODE = """G21 G90 G17
+T1 M06
+S800 M03
+G00 X0 Y0 Z5 ; move above start
+G01 Z-1 F50
+G01 X10 Y0
+X10 Y10
+G02 X0 Y10 I-5 J0
+G00 Z5
+M30"""
+
+
+def test_parse_program_columns():
+    program = parse_program(SAMPLE_GCODE)
+    assert len(program) == 10
+    assert list(program.motion[:5]) == [NO_MOTION, NO_MOTION, NO_MOTION, 0, 1]
+    assert program.motion[6] == NO_MOTION   # modal move without a G word
+    assert program.motion[7] == 2
+    assert program.X[7] == 0 and program.I[7] == -5
+    assert np.isnan(program.X[4]) and program.F[4] == 50
+    assert program.S[2] == 800 and program.T[1] == 1
+    assert program.has_flag(FLAG_G21)[0]
+    assert program.has_flag(FLAG_M30)[9]
+    assert program.lines[3] == "G00 X0 Y0 Z5 ; move above start"
+    assert not program.errors
+
+
+def test_parse_program_syntax_errors():
+    program = parse_program("G1 X\nG1 X1 X2\nG0 G1 X1\nhello\n(comment only)\n%")
+    assert sorted(program.errors) == [0, 1, 2, 3]
+    assert program.has_flag(FLAG_EMPTY)[4] and program.has_flag(FLAG_EMPTY)[5]
+    assert as_program(program) is program
+
+
+def test_forward_fill():
+    values = np.array([np.nan, 2.0, np.nan, 3.0, np.nan])
+    filled = forward_fill(values, ~np.isnan(values), 7.0)
+    assert list(filled) == [7.0, 2.0, 2.0, 3.0, 3.0]
+
+
+def test_machine_limits():
+    # the limits come from the machine profile: a realistic program passes, programs beyond the machine do not
+    from gllm.utils.gcode_utils import machine_context, GCODE_CONTEXT
+    from gllm.utils.kinematics_utils import MachineProfile
+    from gllm.utils.validation_utils import run_validation
+    rules = ['feed_rate', 'spindle_speed', 'tool_changes']
+    realistic = "G21 G90\nT1\nM6\nS12000 M3\nG00 X0 Y0 Z5\nG1 Z-1 F500\nG1 X10 F1500\nM30"
+    assert run_validation(realistic, rules, context=GCODE_CONTEXT, stop_on_fatal=False)['passed']
+    too_fast = realistic.replace("S12000", "S30000").replace("F1500", "F8000")
+    report = run_validation(too_fast, rules, context=GCODE_CONTEXT, stop_on_fatal=False)
+    assert [result['passed'] for result in report['results']] == [False, False, True]
+    small_machine = machine_context(MachineProfile(max_velocity=(1000.0, 1000.0, 500.0), max_spindle_speed=10000.0))
+    assert small_machine == {'min_feed': 1, 'max_feed': 1000.0, 'max_spindle_speed': 10000.0}
+    assert not run_validation(realistic, rules, context=small_machine, stop_on_fatal=False)['passed']
+    # the spindle speed may follow the tool change on any line before the first cut
+    missing = realistic.replace("S12000 M3", "M3")
+    assert not run_validation(missing, rules, context=GCODE_CONTEXT)['passed']
+    # also when the tool change and the cut are in different chunks of a stream
+    from gllm.utils.validation_utils import run_validation_stream
+    assert not run_validation_stream(iter(missing.splitlines()), rules, GCODE_CONTEXT, chunk_size=1)['passed']
+    assert run_validation_stream(iter(realistic.splitlines()), rules, GCODE_CONTEXT, chunk_size=1)['passed']
+
+
+def test_validators_share_parsed_program():
+    from gllm.utils.gcode_utils import validate_syntax, validate_unreachable_code, validate_feed_rate, \
+                                       validate_spindle_speed, validate_tool_changes, check_tool_offsets
+    program = parse_program(SAMPLE_GCODE)
+    assert validate_syntax(program) == (True, None)
+    assert validate_unreachable_code(program) == (True, None)
+    assert validate_feed_rate(program, min_feed=1, max_feed=100) == (True, None)
+    assert validate_spindle_speed(program, max_spindle_speed=500)[0] is False
+    assert validate_tool_changes("T1 M06\nG01 X5 F100")[0] is False
+    assert check_tool_offsets("G43 H1 Z5\nG00 Z1\nG49")[0] is False
+    assert validate_unreachable_code(SAMPLE_GCODE + "\nG00 X1")[0] is False
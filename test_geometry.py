@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Test the tool path comparison used by validate_functional_correctness
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath('.'))
+
+import numpy as np
+import pytest
+from gllm.utils.geometry_utils import hausdorff_distance, directed_hausdorff_distance
+
+
+def brute_force_hausdorff(path1, path2):
+    distances = np.linalg.norm(np.asarray(path1)[:, None, :] - np.asarray(path2)[None, :, :], axis=2)
+    return max(distances.min(axis=1).max(), distances.min(axis=0).max())
+
+
+def test_hausdorff_matches_brute_force():
+    rng = np.random.default_rng(0)
+    path1, path2 = rng.uniform(0, 50, (300, 2)), rng.uniform(0, 50, (200, 2))
+    assert hausdorff_distance(path1, path2) == pytest.approx(brute_force_hausdorff(path1, path2))
+    assert hausdorff_distance([(0, 0), (10, 0)], [(0, 0), (10, 3)]) == pytest.approx(3)
+
+
+def test_hausdorff_early_exit_stays_above_tolerance():
+    path1 = [(x, 0.0) for x in range(100)]
+    path2 = [(x, 5.0) for x in range(100)]
+    assert hausdorff_distance(path1, path2, tolerance=1) > 1
+    assert directed_hausdorff_distance(path1, path1, tolerance=1) == 0
+
+
+def test_hausdorff_rejects_empty_paths():
+    with pytest.raises(ValueError):
+        hausdorff_distance([], [(0, 0)])
+
+
+def test_exact_comparison_of_arcs_and_polylines():
+    from gllm.utils.geometry_utils import toolpath_primitives, polyline_primitives, path_hausdorff_distance
+    circle = toolpath_primitives("G00 X0 Y0\nG02 X0 Y0 I10 J0\nM30")
+    angles = np.linspace(0, 2 * np.pi, 101)
+    polygon = polyline_primitives(np.column_stack([10 - 10 * np.cos(angles), 10 * np.sin(angles)]))
+    # the only deviation is the sagitta of the polygon chords
+    assert path_hausdorff_distance(circle, polygon) == pytest.approx(10 * (1 - np.cos(np.pi / 100)), abs=1e-6)
+
+    inner_circle = toolpath_primitives("G00 X1 Y0\nG03 X1 Y0 I9 J0")
+    assert path_hausdorff_distance(circle, inner_circle) == pytest.approx(1, abs=1e-6)
+
+    square = polyline_primitives([(0, 0), (100, 0), (100, 50)])
+    shifted = polyline_primitives([(0, 1), (100, 1), (99, 50)])
+    assert path_hausdorff_distance(square, shifted) == pytest.approx(1, abs=1e-6)
+
+
+def test_r_form_arcs():
+    from gllm.utils.geometry_utils import toolpath_primitives
+    minor = toolpath_primitives("G00 X0 Y0\nG02 X10 Y0 R5")
+    assert minor.center[1] == pytest.approx([5, 0])
+    assert minor.sweep[1] == pytest.approx(-np.pi)
+    major = toolpath_primitives("G00 X0 Y0\nG03 X10 Y0 R-10")
+    assert abs(major.sweep[1]) > np.pi
+    assert np.hypot(*(major.center[1] - [0, 0])) == pytest.approx(10)
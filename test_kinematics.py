@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Test the trapezoidal-acceleration kinematic simulator
+"""
+
+import sys
+import os
+import math
+sys.path.append(os.path.abspath('.'))
+
+import numpy as np
+import pytest
+from gllm.utils.kinematics_utils import simulate_kinematics, plan_speeds, MachineProfile
+from gllm.utils.cycle_time_utils import estimate_cycle_time
+
+MACHINE = MachineProfile(max_velocity=(6000.0, 6000.0, 6000.0), max_acceleration=(100.0, 100.0, 100.0),
+                         junction_deviation=0.01)
+
+
+def sequential_plan(junction_limit, reach):
+    """Reference lookahead: backward then forward pass over the junctions, one at a time."""
+    speeds = list(junction_limit)
+    for k in range(len(reach) - 1, -1, -1):
+        speeds[k] = min(speeds[k], speeds[k + 1] + reach[k])
+    for k in range(len(reach)):
+        speeds[k + 1] = min(speeds[k + 1], speeds[k] + reach[k])
+    return speeds
+
+
+def test_vectorized_lookahead_matches_sequential_passes():
+    rng = np.random.default_rng(3)
+    for _ in range(20):
+        reach = rng.uniform(0, 50, 30)
+        junction_limit = np.concatenate(([0.0], rng.uniform(0, 400, 29), [0.0]))
+        junction_limit[rng.integers(1, 30, 5)] = np.inf
+        assert plan_speeds(junction_limit, reach) == pytest.approx(sequential_plan(junction_limit, reach))
+
+
+def test_single_move_trapezoid():
+    # 1000 mm at 3000 mm/min = 50 mm/s, 100 mm/s^2: 0.5 s to accelerate and to decelerate over 12.5 mm each
+    report = simulate_kinematics("G01 X1000 F3000", MACHINE)
+    assert report['total'] == pytest.approx(0.5 + 0.5 + 975 / 50)
+    assert report['peak_feed'][0] == pytest.approx(3000)
+    assert report['entry_feed'][0] == 0 and report['exit_feed'][0] == 0
+    assert not report['starved'].any()
+
+    # too short to reach the feed: triangular profile
+    report = simulate_kinematics("G01 X1 F3000", MACHINE)
+    assert report['peak_feed'][0] == pytest.approx(math.sqrt(100 * 1) * 60)
+    assert report['total'] == pytest.approx(2 * math.sqrt(1 / 100))
+    assert report['starved'][0] and report['starved_length'] == 1.0
+
+
+def test_corners_and_short_segments_are_slower_than_length_over_feed():
+    straight = simulate_kinematics("G01 X10 F3000\nX20\nX30", MACHINE)
+    assert straight['exit_feed'][0] == pytest.approx(straight['peak_feed'][0])  # no slowdown on a straight line
+    reverse = simulate_kinematics("G01 X10 F3000\nX0", MACHINE)
+    assert reverse['exit_feed'][0] == pytest.approx(0)                             # full stop on a reversal
+
+    zigzag = "\n".join(["G01 X0 Y0 F3000"] + [f"X{i * 0.5} Y{(i % 2) * 0.5}" for i in range(1, 200)])
+    report = simulate_kinematics(zigzag, MACHINE)
+    assert report['total'] > 2 * estimate_cycle_time(zigzag)['total']
+    assert report['starved_length'] > 0.9
+
+
+def test_arcs_are_limited_by_centripetal_acceleration():
+    report = simulate_kinematics("G00 X1\nG03 X1 Y0 I-1 J0 F3000", MACHINE)
+    assert report['peak_feed'][1] == pytest.approx(math.sqrt(100 * 1) * 60)
+    assert np.isnan(simulate_kinematics("G01 X0 F100", MACHINE)['peak_feed'][0])  # zero-length move
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Test the level-of-detail pyramid and the raster fallback used to plot large tool paths
+"""
+
+import sys
+import os
+import numpy as np
+sys.path.append(os.path.abspath('.'))
+
+from gllm.utils.lod_utils import point_importance, simplify, ToolpathPyramid, raster_toolpath, RANK_BLOCK
+from gllm.utils.spatial_utils import point_segment_distances
+
+
+def max_deviation(points, kept):
+    """Largest distance of the vertices from the polyline through the kept vertices."""
+    piece = np.minimum(np.searchsorted(kept, np.arange(len(points)), side='right') - 1, len(kept) - 2)
+    return point_segment_distances(points, points[kept[piece]], points[kept[piece + 1]]).max()
+
+
+def test_straight_line_keeps_only_its_ends():
+    points = np.column_stack((np.linspace(0, 10, 50), np.linspace(0, 5, 50), np.zeros(50)))
+    importance = point_importance(points)
+    assert np.isinf(importance[[0, -1]]).all()
+    assert list(simplify(points, 1e-6)) == [0, 49]
+
+
+def test_levels_are_nested_and_within_tolerance():
+    rng = np.random.default_rng(1)
+    points = np.cumsum(rng.normal(size=(5 * RANK_BLOCK + 17, 3)), axis=0)
+    pyramid = ToolpathPyramid(points)
+    assert np.all(np.diff(pyramid.sizes) <= 0)
+    for tolerance in pyramid.tolerances:
+        kept = pyramid.level(tolerance)
+        assert kept[0] == 0 and kept[-1] == len(points) - 1
+        assert max_deviation(points, kept) <= tolerance + 1e-9
+
+
+def test_viewport_picks_a_coarse_level_and_crops():
+    angles = np.linspace(0, 2 * np.pi, 20001)
+    points = np.column_stack((50 * np.cos(angles), 50 * np.sin(angles), np.zeros_like(angles)))
+    pyramid = ToolpathPyramid(points)
+    whole = pyramid.for_viewport(pixels=(100, 100))
+    assert 10 < len(whole) < 200
+    zoomed = pyramid.for_viewport((40, -10, 60, 10), pixels=(100, 100))
+    assert np.all(zoomed[:, 0] > 40 - 5)
+    in_view = (whole[:, 0] >= 40) & (np.abs(whole[:, 1]) <= 10)
+    assert len(zoomed) > in_view.sum() + 2
+
+
+def test_raster_counts_every_crossed_pixel():
+    points = np.array([[0.0, 0.0, 0.0], [10.0, 0.0, 0.0], [10.0, 10.0, 0.0]])
+    counts, extent = raster_toolpath(points, pixels=(10, 10))
+    assert extent == (0.0, 10.0, 0.0, 10.0)
+    assert counts.shape == (10, 10)
+    assert np.all(counts[0] > 0) and np.all(counts[:, -1] > 0)
+    assert counts[1:, :-1].sum() == 0
+
+
+def test_plot_gcode_rasterizes_large_tool_paths(monkeypatch):
+    import matplotlib
+    matplotlib.use('Agg')
+    import gllm.utils.plot_utils as plot_utils
+    gcode = "\n".join(["G00 X0 Y0"] + [f"G01 X{i % 2 * 10} Y{i * 0.1:.1f} F100" for i in range(300)])
+    axes = plot_utils.plot_gcode(gcode).gca()
+    assert len(axes.lines) == 1 and not axes.images
+    monkeypatch.setattr(plot_utils, 'MAX_PLOT_POINTS', 100)
+    axes = plot_utils.plot_gcode(gcode).gca()
+    assert len(axes.images) == 1 and not axes.lines
+    plot_utils.plt.close('all')
+
+
+def test_breaks_are_kept_at_every_level():
+    points = np.column_stack((np.linspace(0, 10, 1000), np.zeros(1000), np.zeros(1000)))
+    pyramid = ToolpathPyramid(points, breaks=[300, 301, 700])
+    assert list(pyramid.within(2)) == [0, 300, 301, 700, 999]
+
+
+def test_run_coordinates_split_runs_with_gaps():
+    from gllm.utils.plot_utils import run_coordinates
+    vertices = np.arange(6, dtype=float)[:, None]
+    rows = run_coordinates(vertices, [0, 1, 3])
+    assert np.array_equal(rows[:, 0], [0, 1, 2, np.nan, 3, 4], equal_nan=True)
+
+
+def test_toolpath_figure_layers_rapids_and_decimates():
+    from gllm.utils.plot_utils import toolpath_figure
+    lines = ["G21 G90", "G00 Z5"]
+    for i in range(200):
+        x, y = i % 20 * 5, i // 20 * 5 + 2
+        lines += [f"G00 X{x} Y{y}", "G01 Z-1 F100", f"G02 X{x} Y{y} I0 J-2", "G00 Z5"]
+    fig = toolpath_figure("\n".join(lines))
+    feed, rapid = fig.data
+    assert (feed.name, rapid.name) == ('Feed', 'Rapid')
+    assert feed.type == 'scatter3d' and fig.layout.scene.aspectmode == 'data'
+    # every rapid is a run of its own: retract and move, separated by a gap
+    assert np.isnan(np.asarray(rapid.x, dtype=float)).sum() == 200
+    full = len(feed.x) + len(rapid.x)
+
+    small = toolpath_figure("\n".join(lines), max_points=2000)
+    assert len(small.data[0].x) + len(small.data[1].x) < full
+    assert np.array_equal(np.asarray(small.data[1].x, dtype=float), np.asarray(rapid.x, dtype=float), equal_nan=True)
+
+
+def test_toolpath_payload_round_trips_in_microns():
+    import gzip
+    from gllm.utils.plot_utils import encode_toolpath, decode_toolpath, render_vertices
+    gcode = "G00 X1.2345 Y-2 Z5\nG01 Z-1 F100\nG02 X11.2345 Y-2 R5\nG00 Z5\nG00 X0 Y0"
+    payload = encode_toolpath(gcode)
+    points, _, rapid = render_vertices(gcode)
+    assert len(payload) == 8 + 13 * len(points)
+    vertices, rapid_flags = decode_toolpath(gzip.decompress(gzip.compress(payload)))
+    assert np.abs(vertices - points).max() <= 0.0005 + 1e-9
+    assert vertices[1, 0] in (1.234, 1.235)
+    assert list(rapid_flags[1:]) == list(rapid) and rapid_flags[1]
+    assert decode_toolpath(encode_toolpath(""))[0].shape == (0, 3)
+
+
+def test_toolpath_endpoint_round_trips():
+    import pytest
+    sys.path.append(os.path.abspath('react-gcode-generator/backend'))
+    # the backend imports the whole generation pipeline (see react-gcode-generator/backend/requirements.txt)
+    backend = pytest.importorskip('main', reason="the backend requirements are not installed")
+    from fastapi.testclient import TestClient
+    from gllm.utils.plot_utils import decode_toolpath, render_vertices
+    gcode = "G00 X0 Y0 Z5\nG01 Z-1 F100\nG01 X10 Y5\nG02 X20 Y5 R5\nG00 Z5"
+    points, _, rapid = render_vertices(gcode)
+    client = TestClient(backend.app)
+    for encoding in ("gzip", "identity"):
+        response = client.post("/api/toolpath", json={"gcode": gcode}, headers={"Accept-Encoding": encoding})
+        assert response.status_code == 200 and response.headers["content-type"] == "application/octet-stream"
+        assert (response.headers.get("content-encoding") == "gzip") == (encoding == "gzip")
+        # the client decompresses the gzip-encoded body
+        vertices, rapid_flags = decode_toolpath(response.content)
+        assert np.abs(vertices - points).max() <= 0.0005 + 1e-9
+        assert list(rapid_flags[1:]) == list(rapid)
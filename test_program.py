@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Test the incremental program builder and the assembly of subtask programs
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath('.'))
+
+import numpy as np
+from langchain_core.messages import AIMessage
+from gllm.utils.plot_utils import refine_gcode
+from gllm.utils.toolpath_utils import interpret_program, RAPID
+from gllm.utils.program_utils import ProgramBuilder, assemble_programs
+
+
+def subtask(x, tool=1):
+    return f"""%
+G21 G90 G17
+G28
+T{tool} M06
+M03 S1200
+G00 X{x} Y0 Z5
+G01 Z-1 F100
+G01 X{x + 10} Y0
+M05
+G91 G28 Z0
+G90
+M30
+%"""
+
+
+BLOCKS = ["G21 G90 ; setup\nG00 X0 Y0\nG01 Z-1 F100\nM30",
+          "\nG00 Z5\n\nG01 X10 Y10 ; cut\nM30\nM05",
+          "G00 X20 Y20\nG01 Z-2\nM30"]
+
+
+def test_builder_matches_refining_the_accumulated_string():
+    accumulated = ""
+    program = ProgramBuilder()
+    for block in BLOCKS:
+        accumulated = refine_gcode(accumulated + f"\n{block}")
+        program.append(block)
+        assert program.gcode == accumulated
+    assert program.gcode.splitlines()[-2:] == ['G01 Z-2', 'M30']
+    assert program.gcode.count('M30') == 1 and len(program) == 9 and program.blocks == 3
+
+
+def test_tape_markers_are_merged():
+    program = ProgramBuilder().append("%\nG21 G90\nG00 X0 Y0\nM30\n%").append("%\nG00 X5 Y5\nM30\n%")
+    assert program.gcode.splitlines() == ['%', 'G21 G90', 'G00 X0 Y0', 'G00 X5 Y5', 'M30', '%']
+    assert str(ProgramBuilder()) == "" and not ProgramBuilder()
+
+
+def test_builder_accepts_chat_model_messages():
+    program = ProgramBuilder().append(AIMessage(content=BLOCKS[0])).append(AIMessage(content=BLOCKS[2]))
+    assert program.gcode == ProgramBuilder().append(BLOCKS[0]).append(BLOCKS[2]).gcode
+    assert ProgramBuilder().append(42).gcode == "42"
+
+
+def test_subtasks_share_one_setup():
+    programs = [subtask(0), subtask(50), subtask(100)]
+    merged, report = assemble_programs(programs)
+    lines = merged.splitlines()
+    assert lines.count('G28') == 1 and lines.count('T1 M06') == 1 and lines.count('M03 S1200') == 1
+    assert lines.count('M05') == 1 and lines.count('G91 G28 Z0') == 1 and lines[-2:] == ['M30', '%']
+    # the tool is lifted to the clearance height where the home return was dropped
+    assert lines[lines.index('G01 X10 Y0') + 1] == 'G00 Z5'
+    assert report['merged'] == 2 and report['retracts'] == 2 and report['saved'] > 0
+    assert report['lines_after'] == len(lines) < report['lines_before']
+
+    second = ProgramBuilder().append(programs[1]).gcode
+    cuts = [segments[segments['motion'] != RAPID] for segments in
+            (interpret_program(merged).segments, interpret_program(second).segments)]
+    np.testing.assert_allclose(cuts[0]['end'][2:4], cuts[1]['end'])
+
+
+def test_tool_changes_are_not_merged():
+    programs = [subtask(0), subtask(50, tool=2)]
+    merged, report = assemble_programs(programs)
+    joined = ProgramBuilder().append(programs[0]).append(programs[1]).gcode
+    assert merged == joined and report['merged'] == 0
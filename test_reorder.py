@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test the tool path reordering optimizer
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath('.'))
+
+import numpy as np
+import pytest
+from gllm.utils.ir_utils import parse_program
+from gllm.utils.toolpath_utils import interpret_program, RAPID
+from gllm.utils.reorder_utils import reorder_program, plan_route, route_length, split_operations
+
+
+def square(x, y, feed=''):
+    return f"G00 X{x} Y{y}\nG01 Z-1 {feed}\nG01 X{x + 5}\nG01 Y{y + 5}\nG01 X{x}\nG01 Y{y}\nG00 Z5"
+
+
+def cuts(gcode):
+    """Feed moves of a program, as a sorted set of (start, end, feed) rows."""
+    segments = interpret_program(gcode).segments
+    segments = segments[segments['motion'] != RAPID]
+    rows = np.column_stack((segments['start'], segments['end'], segments['feed']))
+    return rows[np.lexsort(rows.T[::-1])]
+
+
+def test_plan_route_never_worse_than_original():
+    rng = np.random.default_rng(1)
+    points = rng.random((300, 2)) * 100
+    order, original, planned = plan_route([0, 0], points, points)
+    assert sorted(order) == list(range(300))
+    assert planned == pytest.approx(route_length(order, np.zeros(2), points, points))
+    assert planned < original / 5
+    # an order that is already the shortest is kept
+    line = np.column_stack((np.arange(10.0), np.zeros(10)))
+    assert list(plan_route([0, 0], line, line)[0]) == list(range(10))
+
+
+def test_reorder_operations():
+    gcode = "G21 G90\nM3 S800\nG00 Z5\n" + "\n".join(
+        square(x, y, 'F50' if k == 0 else '') for k, (x, y) in enumerate([(0, 0), (100, 100), (10, 0), (90, 100)])
+    ) + "\nM5\nG28\nM30"
+    reordered, report = reorder_program(gcode)
+    assert report['reordered'] and report['operations'] == 4
+    assert report['after']['rapid'] < report['before']['rapid']
+    assert report['saved'] == pytest.approx(report['before']['total'] - report['after']['total'])
+    assert report['after']['cutting'] == pytest.approx(report['before']['cutting'])
+    np.testing.assert_array_equal(cuts(reordered), cuts(gcode))
+    approaches = [line for line in reordered.splitlines() if line.startswith('G00 X')]
+    assert approaches[:3] == ['G00 X0 Y0', 'G00 X10 Y0', 'G00 X90 Y100']
+    assert reordered.splitlines()[-3:] == ['M5', 'G28', 'M30']
+
+
+def test_tool_changes_split_groups():
+    first = "\n".join(square(x, 0, 'F50') for x in (0, 50, 10))
+    second = "\n".join(square(x, 0, 'F50') for x in (0, 50, 10))
+    gcode = f"T1 M06\nG00 Z5\n{first}\nT2 M06\n{second}\nM30"
+    operations, _ = split_operations(parse_program(gcode).lines)
+    assert [operation.movable for operation in operations] == [True, True, True, False, True, True, True]
+    reordered, report = reorder_program(gcode)
+    lines = reordered.splitlines()
+    tool_change = lines.index('T2 M06')
+    assert [line for line in lines[:tool_change] if line.startswith('G00 X')] == ['G00 X0 Y0', 'G00 X10 Y0',
+                                                                                 'G00 X50 Y0']
+    np.testing.assert_array_equal(cuts(reordered), cuts(gcode))
+    assert report['after']['by_tool'].keys() == report['before']['by_tool'].keys()
+
+
+def test_reorder_holes():
+    gcode = "G90\nG00 Z5\nG00 X0 Y0\nG81 X50 Y0 Z-3 R1 F100\nX0 Y10\nX50 Y10\nX0 Y20 (last)\nG80\nM30"
+    reordered, report = reorder_program(gcode)
+    assert report['holes'] == 4 and report['reordered']
+    assert reordered.splitlines()[3:8] == ['G81 Z-3 R1 F100 X0 Y10', 'X0 Y20', 'X50 Y10', 'X50 Y0', 'G80']
+    np.testing.assert_array_equal(cuts(reordered), cuts(gcode))
+
+
+def test_reorder_holes_checks_the_moves():
+    # the carried X of the first hole is written at the controller resolution
+    carried = ("G21 G90\nG00 Z5\nG00 X0 Y0\nG02 X84.74337369372327 Y0 R50 F100\nG00 Z5\n"
+               "G81 Y30 Z-3 R1 F100\nX0 Y10\nX84 Y31\nX0 Y20\nG80\nM30")
+    reordered, report = reorder_program(carried)
+    assert report['reordered'] and 'G81 Z-3 R1 F100 X84.743 Y30' in reordered.splitlines()
+    np.testing.assert_allclose(cuts(reordered), cuts(carried), atol=1e-3)
+    # the cut after the run relies on the Y position of the last hole, which stays last
+    after_run = "G90\nG00 Z5\nG00 X0 Y0\nG81 X50 Y0 Z-3 R1 F100\nX0 Y10\nX50 Y10\nX0 Y20\nG80\nG01 X5 F100\nM30"
+    reordered, report = reorder_program(after_run)
+    assert report['reordered'] and reordered.splitlines()[3:9] == ['G81 Z-3 R1 F100 X0 Y10', 'X50 Y10', 'X50 Y0',
+                                                                   'X0 Y20', 'G80', 'G01 X5 F100']
+    np.testing.assert_array_equal(cuts(reordered), cuts(after_run))
+    mixed_units = "G21 G90\nG00 Z5\nG00 X0 Y0\nG81 X50 Y0 Z-3 R1 F100\nX0 Y10\nX50 Y10\nX0 Y20\nG80\nG20\nM30"
+    assert reorder_program(mixed_units)[0] == mixed_units
+
+
+def test_reorder_holes_before_the_retract():
+    # the usual G80 / G00 Z ending retracts from whichever hole is drilled last
+    gcode = "G21 G90\nG00 Z10\nG00 X0 Y0\nG81 X0 Y0 Z-3 R1 F100\nX100 Y0\nX1 Y0\nX101 Y0\nX2 Y0\nG80\nG00 Z10\nM30"
+    reordered, report = reorder_program(gcode)
+    assert report['reordered'] and report['saved'] > 0
+    assert reordered.splitlines()[3:10] == ['G81 Z-3 R1 F100 X0 Y0', 'X1 Y0', 'X2 Y0', 'X100 Y0', 'X101 Y0', 'G80',
+                                            'G00 Z10']
+    np.testing.assert_array_equal(cuts(reordered), cuts(gcode))
+    # a rapid that plunges again after the retract keeps the last hole last
+    plunge = gcode.replace("G00 Z10\nM30", "G00 Z10\nG00 Z-1\nM30")
+    assert reorder_program(plunge)[0].splitlines()[-5:] == ['X2 Y0', 'G80', 'G00 Z10', 'G00 Z-1', 'M30']
+
+
+def test_unsafe_programs_are_kept():
+    incremental = "G91\n" + "\n".join(square(x, 0, 'F50') for x in (0, 50, 10))
+    assert reorder_program(incremental)[0] == incremental
+    # the second operation relies on the Y position left by the first one
+    carried = ("G00 Z5\nG00 X0 Y0\nG01 Z-1 F50\nG01 Y30\nG00 Z5\nG00 X50 Y0\nG01 Z-1\nG00 Z5\n"
+               "G00 X1 Y30\nG01 Z-1\nG01 X5\nG00 Z5")
+    reordered, report = reorder_program(carried)
+    assert report['after']['total'] <= report['before']['total']
+    np.testing.assert_array_equal(cuts(reordered), cuts(carried))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test the spatial index over tool path moves and the keep-out zone check
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath('.'))
+
+import numpy as np
+import pytest
+from gllm.utils.spatial_utils import SegmentGrid, KeepOutZone, segment_distances, crossed_cuts, keep_out_collisions, \
+    parse_keep_out_zones
+from gllm.utils.validation_utils import run_validation
+from gllm.utils.gcode_utils import validate_keep_out_zones, validate_rapids_over_cuts
+
+
+def random_segments(rng, count, spread=100.0, length=5.0):
+    starts = np.column_stack((rng.uniform(0, spread, (count, 2)), rng.uniform(-3, 0, count)))
+    ends = starts + np.column_stack((rng.uniform(-length, length, (count, 2)), np.zeros(count)))
+    return starts, ends
+
+
+def test_grid_queries_match_brute_force():
+    rng = np.random.default_rng(11)
+    starts, ends = random_segments(rng, 500)
+    grid = SegmentGrid(starts, ends, radius=1.0)
+    query_starts, query_ends = random_segments(rng, 50, spread=120.0, length=20.0)
+    query, segment = grid.near_segments(query_starts, query_ends, radius=0.5)
+
+    all_query, all_segment = np.repeat(np.arange(50), 500), np.tile(np.arange(500), 50)
+    distances = segment_distances(query_starts[all_query, :2], query_ends[all_query, :2],
+                                  starts[all_segment, :2], ends[all_segment, :2])
+    expected = set(zip(all_query[distances <= 1.5].tolist(), all_segment[distances <= 1.5].tolist()))
+    assert set(zip(query.tolist(), segment.tolist())) == expected
+    assert len(expected) < 50 * 500 / 10
+
+    box_query, box_segment = grid.near_boxes([[10.0, 10.0]], [[20.0, 15.0]])
+    centers = (starts + ends)[:, :2] / 2
+    assert set(np.flatnonzero(np.all((centers >= (10, 10)) & (centers <= (20, 15)), axis=1))) <= set(box_segment.tolist())
+
+
+def test_segment_distances():
+    a0, a1 = np.array([[0.0, 0.0], [0.0, 0.0]]), np.array([[10.0, 0.0], [10.0, 0.0]])
+    b0, b1 = np.array([[5.0, -1.0], [12.0, 3.0]]), np.array([[5.0, 1.0], [12.0, 5.0]])
+    assert segment_distances(a0, a1, b0, b1).tolist() == [0.0, np.hypot(2, 3)]
+
+
+def test_crossed_cuts():
+    gcode = "G00 X0 Y0 Z5\nG01 Z-2 F100\nG01 X10\nG00 Z5\nG00 X5 Y-10\nG00 Y10"
+    rapid, cut, depth = crossed_cuts(gcode, tool_radius=1.0)
+    assert 5 in rapid.tolist()                                    # the last rapid crosses the slot
+    assert set(depth[rapid == 5].tolist()) == {-2.0}
+    assert np.all(cut < rapid)
+
+
+def test_rapids_over_cuts():
+    slot = "G00 X0 Y0 Z5\nG01 Z-2 F100\nG01 X10\nG00 Z5\nG00 X5 Y-10\n"
+    passed, error = validate_rapids_over_cuts(slot + "G00 Z-3\nG00 Y10", tool_radius=1.0)
+    assert not passed and error == "Rapid movement below the machined depth at G00 Y10"
+    # above the floor of the slot, or vertical (e.g. retracting from a deeper hole)
+    assert validate_rapids_over_cuts(slot + "G00 Z-1\nG00 Y10", tool_radius=1.0) == (True, None)
+    assert validate_rapids_over_cuts(slot + "G00 Y0\nG01 Z-5\nG00 Z5", tool_radius=1.0) == (True, None)
+    assert validate_rapids_over_cuts("G00 X0 Y0 Z5\nG81 X0 Y0 Z-3 R1 F100\nX10\nX20\nG80") == (True, None)
+    from gllm.utils.graph_utils import CODE_CHECK_RULES
+    report = run_validation(slot + "G00 Z-3\nG00 Y10", CODE_CHECK_RULES, context={}, stop_on_fatal=False)
+    assert {result['name']: result['passed'] for result in report['results']}['rapids_over_cuts'] is False
+
+
+def test_keep_out_zones():
+    clamp = KeepOutZone(40, 40, 60, 60, 10, 'front clamp')
+    gcode = "G00 X0 Y0 Z5\nG01 X30 F100\nG01 X50 Y50\nG00 Z20\nG00 X100"
+    segments, zones = keep_out_collisions(gcode, [clamp], tool_radius=2.0)
+    assert segments.tolist() == [2, 3] and zones.tolist() == [0, 0]    # entering, then retracting out of the clamp
+    passed, error = validate_keep_out_zones(gcode, [clamp], tool_radius=2.0)
+    assert not passed and error == "Tool enters the keep-out zone front clamp at G01 X50 Y50"
+    # above the clamp, or far enough from it
+    assert validate_keep_out_zones("G00 Z20\nG00 X50 Y50\nG00 X0", [clamp]) == (True, None)
+    assert validate_keep_out_zones("G01 X37.9 Y50 F100", [clamp], tool_radius=2.0) == (True, None)
+    assert run_validation(gcode, ['keep_out_zones'], context={})['passed']
+    assert not run_validation(gcode, ['keep_out_zones'], context={'keep_out_zones': [tuple(clamp)]})['passed']
+
+
+def test_keep_out_zones_reach_the_code_check():
+    from gllm.utils.graph_utils import code_check
+    zones = parse_keep_out_zones("40, 40, 60, 60, 10, front clamp\n\n0, 0, 5, 5, 1")
+    assert zones == [KeepOutZone(40, 40, 60, 60, 10, 'front clamp'), KeepOutZone(0, 0, 5, 5, 1)]
+    with pytest.raises(ValueError):
+        parse_keep_out_zones("40, 40, 60")
+
+    gcode = "G00 X20 Y50 Z5\nG01 Z-1 F100\nG01 X50 Y50\nG00 Z5\nM30"
+    state = {"messages": [], "generation": gcode, "iterations": 1}
+    assert code_check(state, None, {'Operation Type': 'milling'}, None)["error"] == "no"
+    result = code_check(state, None, {'Operation Type': 'milling'}, None, keep_out_zones=zones[:1])
+    assert result["error"] == "yes" and "keep-out zone front clamp at G01 X50 Y50" in result["messages"][-1][1]
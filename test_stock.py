@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Test the heightmap stock simulation and the rapid-through-material check built on it
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath('.'))
+
+import numpy as np
+import pytest
+from gllm.utils.stock_utils import Stock, simulate_stock, find_rapid_collisions
+from gllm.utils.toolpath_utils import interpret_program
+from gllm.utils.gcode_utils import validate_safety
+
+
+def test_carving_a_slot():
+    stock = Stock(20, 10, bottom=-5, resolution=0.5)
+    stock.carve(np.array([[2.0, 5.0, -1.0]]), np.array([[18.0, 5.0, -8.0]]), tool_radius=1.0)
+    assert stock.heights[10, 4] == pytest.approx(-1.0 - 7 * 0.25 / 16 * 2, abs=0.5)   # ramping down along X
+    assert stock.heights[10, 35] == -5                                                  # never below the bottom
+    assert stock.heights[0, 4] == 0 and stock.heights[13, 10] == 0                      # outside the tool
+    assert stock.volume() > 0
+
+
+def test_rapid_along_a_cut_slot_is_safe():
+    # the previous check flagged any G0 after a G1 below the safe height
+    gcode = "G00 X0 Y0 Z5\nG01 Z-1 F50\nG01 X20\nG00 X0\nG00 Z5"
+    assert validate_safety(gcode) == (True, None)
+
+
+def test_rapid_into_material_is_detected():
+    # a rapid plunge into uncut material, which the previous check did not see
+    passed, error = validate_safety("G00 X10 Y10 Z5\nG00 Z-2\nG01 X20 F50")
+    assert not passed and error.endswith("at G00 Z-2")
+    passed, error = validate_safety("G00 Z5\nG01 Z-1 F50\nG01 X10\nG00 Y10")
+    assert not passed and error.endswith("at G00 Y10")
+
+
+def test_workpiece_dimensions_bound_the_material():
+    gcode = "G00 X-10 Y10 Z5\nG00 Z-2\nG00 X-20\nG00 X5"
+    assert find_rapid_collisions(gcode, workpiece_dimensions=[100.0, 100.0, 10.0]) == [3]
+    assert validate_safety(gcode, workpiece_dimensions=[100.0, 100.0])[0] is False
+    assert validate_safety("G00 X-10 Y10 Z5\nG00 Z-2\nG00 X-20", workpiece_dimensions=[100.0, 100.0]) == (True, None)
+
+
+def test_arcs_carve_along_the_arc():
+    gcode = "G00 X10 Y0 Z1\nG01 Z-1 F50\nG03 X-10 Y0 I-10 J0\nG00 X10"
+    assert find_rapid_collisions(gcode) == [3]
+    stock = Stock(30, 30, origin=(-15, -15), resolution=0.25)
+    simulate_stock(interpret_program(gcode), stock, tool_radius=1.0)
+    assert stock.heights[int(25 / 0.25), int(15 / 0.25)] == pytest.approx(-1)    # (0, 10) on the arc
+    assert stock.heights[int(5 / 0.25), int(15 / 0.25)] == 0                     # (0, -10) not cut
+
+
+def test_row_intervals_match_cell_rasterization():
+    rng = np.random.default_rng(5)
+    stock = Stock(20, 20, origin=(-10, -10), resolution=0.3)
+    starts = np.column_stack((rng.uniform(-12, 12, (40, 2)), np.zeros(40)))
+    ends = np.column_stack((starts[:, :2] + rng.uniform(-6, 6, (40, 2)) * (rng.random((40, 1)) > 0.2), np.zeros(40)))
+    move, cell, _ = stock.covered_cells(starts, ends, 1.7)
+    interval_move, row, first, last = stock.row_intervals(starts, ends, 1.7)
+    counts = last - first + 1
+    interval_cells = np.repeat(row * stock.heights.shape[1] + first, counts) + \
+        np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    assert sorted(zip(np.repeat(interval_move, counts), interval_cells)) == sorted(zip(move, cell))
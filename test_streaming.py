@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test the streaming parser, validation and tool path extraction against the whole-program versions
+"""
+
+import sys
+import os
+import io
+sys.path.append(os.path.abspath('.'))
+
+import numpy as np
+import pytest
+from gllm.utils.ir_utils import iter_program_chunks, concatenate_programs, parse_program, as_program
+from gllm.utils.validation_utils import run_validation, run_validation_stream
+from gllm.utils.toolpath_utils import interpret_program, iter_toolpath
+from gllm.utils.plot_utils import parse_gcode
+from gllm.utils.gcode_utils import validate_gcode, validate_gcode_file, validate_continuity, GCODE_RULES
+
+STREAM_RULES = GCODE_RULES + ('z_levels', 'drilling')
+CONTEXT = {'min_feed': 1, 'max_feed': 100, 'max_spindle_speed': 900, 'max_depth': 10, 'operation_type': 'drilling'}
+
+PROGRAMS = {
+    'valid': "G21 G90\nT1\nS800 M03\nG00 X0 Y0 Z5\nG01 Z0 F50\nG01 X0 Y0\nG02 X0 Y0 I5 J0\nG00 Z5\nM30",
+    'unreachable': "G00 X0 Y0\n\nM30\n\n\n\nG01 X1",
+    'unsafe_rapid': "G01 Z-2 F50\n\n\n\nG00 X10",
+    'discontinuity': "G01 X0 Y0 F50\n\n\n\nG01 X5 Y5",
+    'missing_speed': "G21\nT2\n\n\n\nG00 X1",
+    'tool_offset': "G43 H1\n\n\n\nG00 Z5",
+    'drilling': "G00 X3 Y4\nG01 Z-1 F50\n\n\n\nG01 X6",
+    'syntax': "G00 X0\n\n\nG00 X1 X2",
+}
+
+
+@pytest.mark.parametrize('name', sorted(PROGRAMS))
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 1000])
+def test_stream_validation_matches_whole_program(name, chunk_size):
+    gcode = PROGRAMS[name]
+    expected = run_validation(gcode, STREAM_RULES, context=CONTEXT)
+    report = run_validation_stream(io.StringIO(gcode), STREAM_RULES, context=CONTEXT, chunk_size=chunk_size)
+    assert report['passed'] == expected['passed']
+    assert report['error'] == expected['error']
+    assert validate_gcode_file(io.StringIO(gcode), chunk_size=chunk_size) == validate_gcode(gcode)
+
+
+def test_stream_rejects_whole_program_rules():
+    with pytest.raises(ValueError):
+        run_validation_stream(io.StringIO("G00 X0"), ['functional_correctness'], context={'operation_type': 'milling'})
+
+
+def test_program_chunks():
+    gcode = PROGRAMS['valid']
+    chunks = list(iter_program_chunks(io.BytesIO(gcode.encode()), chunk_size=4))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 1]
+    assert chunks[1].line[0] == 4 and chunks[1].lines[0] == "G01 Z0 F50"
+    joined, whole = concatenate_programs(chunks), parse_program(gcode)
+    assert joined.lines == whole.lines
+    np.testing.assert_array_equal(joined.line, whole.line)
+    np.testing.assert_array_equal(joined.X, whole.X)
+
+
+def test_stream_toolpath_matches_whole_program():
+    gcode = "G91\nG01 X1 F50\nG02 X2 Y0 R1\nG20\nX1\nM30\nG00 X100"
+    segments = np.concatenate([toolpath.segments for toolpath in iter_toolpath(io.StringIO(gcode), chunk_size=2)])
+    np.testing.assert_array_equal(segments, interpret_program(gcode).segments)
+    assert parse_gcode(io.StringIO(gcode)) == parse_gcode(gcode)
+
+
+def test_mapped_file(tmp_path, monkeypatch):
+    gcode = PROGRAMS['valid']
+    path = tmp_path / "program.nc"
+    path.write_bytes(gcode.replace('\n', '\r\n').encode())
+    program = parse_program(gcode)
+    mapped = as_program(path)
+    assert mapped.lines == program.lines
+    np.testing.assert_array_equal(mapped.Z, program.Z)
+    assert [len(chunk) for chunk in iter_program_chunks(path, chunk_size=5)] == [5, 4]
+    assert validate_gcode_file(path) == validate_gcode(gcode)
+    assert validate_continuity(path) == validate_continuity(gcode)
+    assert parse_gcode(path) == parse_gcode(gcode)
+    # the engine and the plots stream path inputs instead of loading the whole program
+    from gllm.utils import validation_utils, plot_utils
+    passed, points = validate_gcode(gcode), parse_gcode(gcode)
+    def whole_program(gcode, *args):
+        raise AssertionError("the file was loaded as a whole")
+    monkeypatch.setattr(validation_utils, 'as_program', whole_program)
+    monkeypatch.setattr(plot_utils, 'interpret_program', whole_program)
+    assert validation_utils.run_validation(path, GCODE_RULES, context=CONTEXT)['passed'] == passed
+    assert parse_gcode(path) == points
+
+    empty = tmp_path / "empty.nc"
+    empty.write_bytes(b"")
+    assert len(as_program(empty)) == 0
+    assert run_validation_stream(empty, STREAM_RULES, context=CONTEXT)['passed']
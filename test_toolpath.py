@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Test the modal G-code interpreter and its segment table
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath('.'))
+
+import numpy as np
+import pytest
+from gllm.utils.ir_utils import parse_program
+from gllm.utils.toolpath_utils import interpret_program, arc_chord_counts, RAPID, LINEAR, CW_ARC, CCW_ARC
+
+
+def test_modal_motion_and_incremental_moves():
+    toolpath = interpret_program("G90 G21\nG00 X10 Y0 Z5\nG01 Z-1 F100\nX20\nG91 Y5\nX-10 Y5\nM30\nG00 X99")
+    segments = toolpath.segments
+    assert list(segments['motion']) == [RAPID, LINEAR, LINEAR, LINEAR, LINEAR]
+    assert segments['end'][-1] == pytest.approx([10, 10, -1])
+    assert segments['feed'][2] == 100 and np.isnan(segments['feed'][0])
+    assert segments['length'][2] == pytest.approx(10)
+    assert toolpath.state.ended
+
+
+def test_units_spindle_and_tool_state():
+    segments = interpret_program("G20\nT2 M06\nS1000 M03\nG01 X1 F10\nM05\nG00 Y1").segments
+    assert segments['end'][0] == pytest.approx([25.4, 0, 0])
+    assert segments['feed'][0] == pytest.approx(254)
+    assert segments['spindle'][0] == 1000 and segments['spindle_direction'][0] == 1
+    assert segments['spindle'][1] == 0 and segments['tool'][1] == 2
+
+
+def test_arcs_in_all_planes():
+    segments = interpret_program("G17 G02 X10 Y0 I5 J0\nG18 G03 X0 Z0 I-5 K0\nG19 G02 Y10 Z0 R5").segments
+    assert list(segments['motion']) == [CW_ARC, CCW_ARC, CW_ARC]
+    assert segments['center'][0] == pytest.approx([5, 0, 0])
+    assert segments['center'][1] == pytest.approx([5, 0, 0])
+    assert segments['length'][0] == pytest.approx(5 * np.pi)
+    helix = interpret_program("G03 X0 Y0 Z-2 I5 J0").segments
+    assert helix['sweep'][0] == pytest.approx(2 * np.pi)
+    assert helix['length'][0] == pytest.approx(np.hypot(10 * np.pi, 2))
+
+
+def test_drilling_cycle_and_home_return():
+    segments = interpret_program("G00 Z10\nG98 G81 X5 Y5 Z-3 R2 F50\nX15\nG80\nG28").segments
+    drilled = segments[segments['motion'] == LINEAR]
+    assert drilled['end'][:, 2] == pytest.approx([-3, -3])
+    assert drilled['end'][:, 0] == pytest.approx([5, 15])
+    assert segments['end'][-1] == pytest.approx([0, 0, 0])
+    # G98 retracts to the initial height
+    assert segments['end'][-2] == pytest.approx([15, 5, 10])
+
+
+def test_toolpath_is_cached_on_the_program():
+    program = parse_program("G00 X1\nG01 X2")
+    assert interpret_program(program) is interpret_program(program)
+    points = interpret_program("G02 X10 Y0 I5 J0").points(arc_points=5)
+    assert points[-1] == pytest.approx([10, 0, 0]) and points[2] == pytest.approx([5, 5, 0])
+
+
+def test_arc_points_follow_the_chord_tolerance():
+    fillet = interpret_program("G00 X0.5 Y0\nG03 X0 Y0.5 I-0.5 J0")
+    large = interpret_program("G00 X500 Y0\nG03 X0 Y500 I-500 J0")
+    fillet_points, large_points = fillet.points(chord_tolerance=0.01), large.points(chord_tolerance=0.01)
+    assert len(fillet_points) < 10 < 100 < len(large_points)
+    for points, radius in ((fillet_points, 0.5), (large_points, 500)):
+        # the middle of every chord stays within the tolerance of the arc
+        middles = (points[1:-1] + points[2:]) / 2
+        assert np.all(radius - np.hypot(middles[:, 0], middles[:, 1]) <= 0.01 + 1e-9)
+    assert arc_chord_counts(np.array([0.0, 1.0]), np.array([np.pi, 2 * np.pi]), 0.01).tolist() == [1, 23]
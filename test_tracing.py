@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Test the per-request tracing of the validation engine
+"""
+
+import sys
+import os
+import logging
+sys.path.append(os.path.abspath('.'))
+
+from gllm.utils.trace_utils import tracing, span, record_span, format_server_timing
+from gllm.utils.validation_utils import run_validation
+import gllm.utils.gcode_utils  # registers the validation rules
+
+GCODE = "G00 X0 Y0 Z5\nG01 Z-1 F50\nG00 X10\nM30"
+
+
+def test_spans_are_recorded_only_inside_tracing():
+    with tracing() as spans:
+        report = run_validation(GCODE, ['syntax', 'safety'])
+        with span('outer', lines=4) as fields:
+            fields['passed'] = report['passed']
+    assert [s['name'] for s in spans] == ['validate.syntax', 'validate.safety', 'outer']
+    assert spans[0]['lines'] == 4 and spans[1]['passed'] is False and spans[2]['passed'] is False
+    assert format_server_timing(spans[:1]).startswith('validate.syntax;dur=')
+
+    with tracing() as other_spans:
+        pass
+    run_validation(GCODE, ['syntax'])
+    record_span('ignored', 1.0)
+    assert other_spans == [] and len(spans) == 3
+
+
+def test_validator_messages_go_through_logging(caplog, capsys):
+    with caplog.at_level(logging.INFO, logger='gllm'):
+        run_validation(GCODE, ['safety'])
+    assert "Rapid movement through potential material at G00 X10" in caplog.text
+    assert capsys.readouterr().out == ""
+
+
+def test_configure_logging_leaves_other_loggers_alone(capsys):
+    from gllm.utils.trace_utils import configure_logging, _console_handler
+    from gllm.utils.params_extraction_utils import parse_extracted_parameters
+    gllm_logger, root = logging.getLogger('gllm'), logging.getLogger()
+    level, handlers = gllm_logger.level, list(gllm_logger.handlers)
+    root_level, root_handlers = root.level, list(root.handlers)
+    try:
+        configure_logging()
+        configure_logging()
+        assert root.level == root_level and root.handlers == root_handlers
+        assert logging.getLogger('httpx').getEffectiveLevel() == root_level
+        assert gllm_logger.level == logging.INFO and gllm_logger.handlers.count(_console_handler) == 1
+        # the parameter parsing run by every code check does not print
+        parse_extracted_parameters("Desired Shape: circle\nStarting Point: 0, 0\nRadius: 5\nno key here")
+        assert capsys.readouterr().out == ""
+    finally:
+        gllm_logger.setLevel(level)
+        gllm_logger.handlers = handlers
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test the cost-ordered validation engine and the Langgraph check node built on it
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath('.'))
+
+from gllm.utils.validation_utils import register_rule, run_validation, VALIDATION_RULES
+
+
+def test_rules_run_cheapest_first_and_stop_on_fatal():
+    calls = []
+    register_rule('test_expensive', lambda program: calls.append('expensive') or (True, None), cost=50)
+    register_rule('test_cheap_fail', lambda program: calls.append('cheap') or (False, "cheap failed"), cost=1)
+    register_rule('test_never', lambda program: calls.append('never') or (True, None), cost=100)
+    try:
+        report = run_validation("G00 X0 Y0", ['test_never', 'test_expensive', 'test_cheap_fail'])
+        assert calls == ['cheap']
+        assert not report['passed']
+        assert report['failed_rule'].name == 'test_cheap_fail'
+        assert report['error'] == "cheap failed"
+        assert report['results'][0]['seconds'] >= 0
+    finally:
+        for name in ('test_expensive', 'test_cheap_fail', 'test_never'):
+            VALIDATION_RULES.pop(name)
+
+
+def test_rule_params_and_predicates_come_from_context():
+    import gllm.utils.gcode_utils  # registers the built-in rules
+    program = "G00 X0 Y0 Z5\nG01 Z-1 F500\nG01 X10 Y0\nM30"
+    report = run_validation(program, ['syntax', 'feed_rate', 'drilling'],
+                            context={'min_feed': 1, 'max_feed': 100, 'operation_type': 'milling'})
+    assert [result['name'] for result in report['results']] == ['syntax', 'feed_rate']
+    assert report['failed_rule'].name == 'feed_rate'
+
+
+def test_code_check_reports_first_failure():
+    from gllm.utils.graph_utils import code_check
+    state = {"messages": [], "generation": "G00 X0 Y0\nM30\nG01 X10", "iterations": 1}
+    result = code_check(state, None, {'Operation Type': 'milling'}, None)
+    assert result["error"] == "yes"
+    assert "Unreachable code detected: G01 X10" in result["messages"][-1][1]
+
+    state = {"messages": [], "generation": "G00 X0 Y0\nG01 X10\nM30", "iterations": 1}
+    assert code_check(state, None, {'Operation Type': 'milling'}, None)["error"] == "no"
+
+
+def test_incremental_validator_matches_full_runs():
+    import gllm.utils.gcode_utils  # registers the built-in rules
+    from gllm.utils.validation_utils import IncrementalValidator
+    from gllm.utils.graph_utils import CODE_CHECK_RULES
+    body = [f"G01 X{i % 7} Y{i % 5} Z-1 F300" for i in range(100)]
+    versions = [
+        ["G21", "G90", "T1 M06", "G00 X0 Y0 Z5", "M03 S1000"] + body + ["G00 Z5", "M30"],
+        ["G21", "G90", "T1 M06", "G00 X0 Y0 Z5", "M03 S1000"] + body + ["G00 Z5", "M30", "G01 X1"],
+        ["G21", "G90", "T1 M06", "G00 X0 Y0 Z5", "M03 S1000"] + body[:60] + ["G01 X3 Y3 Z-1 Q"] + body[61:] + ["M30"],
+        ["G21", "G90", "T1 M06", "G00 X0 Y0 Z5", "M03 S1000"] + body[:80] + ["G00 X50 Y50 Z-1"] + body[81:] + ["M30"],
+        ["G21", "G90", "T1 M06", "G00 X0 Y0 Z5", "M03 S1000"] + body + ["G00 Z5", "M30"],
+    ]
+    context = {'parameters_string': None, 'operation_type': 'milling'}
+    validator = IncrementalValidator(CODE_CHECK_RULES, context, block_size=16)
+    for lines in versions:
+        incremental = validator.validate("\n".join(lines))
+        full = run_validation("\n".join(lines), CODE_CHECK_RULES, context=context)
+        assert incremental['passed'] == full['passed']
+        assert incremental['error'] == full['error']
+        assert [result['name'] for result in incremental['results']] == [result['name'] for result in full['results']]
+
+
+def test_incremental_validator_only_checks_changed_blocks():
+    from gllm.utils.validation_utils import IncrementalValidator
+    checked = []
+    register_rule('test_counting', lambda program: checked.append(program.line[0]) or (True, None), cost=1)
+    try:
+        validator = IncrementalValidator(['test_counting'], block_size=10)
+        lines = [f"G01 X{i}" for i in range(50)]
+        validator.validate("\n".join(lines))
+        assert checked == [0, 10, 20, 30, 40]
+        checked.clear()
+        lines[35] = "G01 X0"
+        validator.validate("\n".join(lines))
+        assert checked == [30, 40]
+        assert validator.reused_blocks == 3
+    finally:
+        VALIDATION_RULES.pop('test_counting')
+
+
+def test_rewrites_must_not_add_failures():
+    from gllm.utils.gcode_utils import validate_rewrite
+    original = "G21 G90\nG00 X0 Y0 Z5\nG01 Z-1 F50\nG01 X10 Y0\nG01 X10 Y10\nG00 Z5\nM30"
+    # the original already fails the continuity check; a rewrite failing it too is accepted
+    assert validate_rewrite(original, original.replace("G01 X10 Y0\n", "G01 X10\n")) == (True, None)
+    passed, error = validate_rewrite(original, original.replace("F50", "F50000"))
+    assert not passed and error == "Feed rate out of bounds at G01 Z-1 F50000"